@@ -4,4 +4,5 @@ from . import views
 # URLConfig
 urlpatterns = [
     path("get/sensor-data/", views.get_sensor_data),
+    path("get/sensor-data/latest/", views.get_latest_sensor_data),
 ]
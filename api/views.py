@@ -6,8 +6,13 @@ from rest_framework.decorators import api_view, authentication_classes
 from rest_framework.response import Response
 from iot_devices.cache import IotDeviceCache
 
+from sensor_data.cache import LatestSensorDataCache
 from sensor_data.models import SensorData
-from sensor_data.pagination import SensorDataPaginator
+from sensor_data.pagination import (
+    InvalidCursor,
+    SensorDataCursorPaginator,
+    SensorDataPaginator,
+)
 from sensors.cache import SensorCache
 from users.auth.api_auth import ApiKeyAuthentication
 
@@ -46,6 +51,32 @@ def get_sensor_data(request):
 
     list_data_by_sensor = request.query_params.get("list_by", None)
 
+    if (
+        request.query_params.get("pagination") == "cursor"
+        or "cursor" in request.query_params
+    ):
+        # cursor mode skips the count and pages on (timestamp, id)
+        paginator = SensorDataCursorPaginator(
+            sensor_data_qs,
+            page_size,
+            sensor_names=sensor_list,
+            iot_device_list=iot_device_list,
+            list_data_by_sensor=(list_data_by_sensor == "sensor"),
+        )
+        try:
+            page = paginator.page(request)
+        except InvalidCursor:
+            return Response(
+                {"error": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(
+            {
+                "next": paginator.get_next_link(page["next_cursor"], request),
+                "next_cursor": page["next_cursor"],
+                "results": page["results"],
+            }
+        )
+
     paginator = SensorDataPaginator(
         sensor_data_qs,
         page_size,
@@ -76,3 +107,23 @@ def get_sensor_data(request):
     }
 
     return Response(response)
+
+
+@api_view(["GET"])
+@authentication_classes([ApiKeyAuthentication])
+def get_latest_sensor_data(request):
+    """Returns the latest reading of each sensor per iot device of the user or company"""
+    user = request.user
+    iot_device_list = (
+        IotDeviceCache.get_all_company_iot_devices(user.company)
+        if user.is_associated_with_company
+        else IotDeviceCache.get_all_user_iot_devices(user)
+    )
+
+    sensors_data = LatestSensorDataCache.get_latest_sensor_data_by_name(
+        iot_device_list
+    )
+    for data in sensors_data.values():
+        data["timestamp"] = timezone.localtime(data["timestamp"])
+
+    return Response(sensors_data)
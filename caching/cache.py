@@ -1,9 +1,67 @@
 from django.core.cache import cache
+from django.core.cache.backends.redis import RedisSerializer
+from django.db.models import Model
 from abc import ABC
 
+from caching.local_cache import (
+    CLEAR_ALL,
+    local_cache,
+    publish_invalidation,
+    start_invalidation_listener,
+)
+from caching.records import CacheRecord
+
+# connection shared by all the methods which need to talk to redis directly
+_redis_client = None
+_async_redis_client = None
+_redis_serializer = RedisSerializer()
+
+
+def get_redis_client():
+    """Returns the redis client connected to the cache database"""
+    global _redis_client
+    if _redis_client is None:
+        import redis
+        from decouple import config
+
+        _redis_client = redis.Redis(
+            host=config("REDIS_HOST"),
+            port=config("REDIS_DATABASE_PORT"),
+            db=config("REDIS_DATABASE"),
+        )
+    return _redis_client
+
+
+def get_async_redis_client():
+    """Returns the asyncio redis client connected to the cache database"""
+    global _async_redis_client
+    if _async_redis_client is None:
+        import redis.asyncio
+        from decouple import config
+
+        _async_redis_client = redis.asyncio.Redis(
+            host=config("REDIS_HOST"),
+            port=config("REDIS_DATABASE_PORT"),
+            db=config("REDIS_DATABASE"),
+        )
+    return _async_redis_client
+
 
 class Cache(ABC):
+    """
+    Lists of entities are stored as redis hash of entity id and the encoded entity
+    along with a hash per secondary index mapping the indexed value to the entity id,
+    so a single entity is fetched without transferring the whole list.
+    """
+
     CACHE_TTL = 604800  # value in seconds = 1week
+    # attribute path of the entity used as secondary index of the cached list
+    # i.e {"slug": "slug", "username": "user.username"}
+    list_indexes = {}
+    # attribute path of the entity used for ordering the cached list
+    list_ordering = "id"
+    # CacheRecord used to encode the entities of the list, entities are pickled if not provided
+    list_record = None
 
     # later do it in __init__ method
     def __generate_cache_key(app_name):
@@ -11,87 +69,179 @@ class Cache(ABC):
         return f"{app_name}_fetch_list"
 
     @staticmethod
-    def get_all(cache_key: str, app_name: str) -> object | None:
-        is_fetch_list = Cache.__generate_cache_key(app_name)
-        cached_data = cache.get_many((cache_key, is_fetch_list))
-        # if is_fetch_list is true then fetch data from the database
-        if cached_data.get(is_fetch_list):
+    def __get_attribute(entity, attribute_path: str):
+        for attribute in attribute_path.split("."):
+            if entity is None:
+                return None
+            entity = getattr(entity, attribute)
+        return entity
+
+    def __get_list_index_key(self, cache_key: str, index: str) -> str:
+        return cache.make_key(f"{cache_key}__{index}")
+
+    def __get_list_index_keys(self, cache_key: str) -> list:
+        return [
+            self.__get_list_index_key(cache_key, index) for index in self.list_indexes
+        ]
+
+    def __encode_entity(self, entity) -> bytes:
+        if self.list_record:
+            return self.list_record.dumps(entity)
+        return _redis_serializer.dumps(entity)
+
+    def __decode_entity(self, data: bytes):
+        if self.list_record:
+            return self.list_record.loads(data)
+        return _redis_serializer.loads(data)
+
+    def __add_to_list(self, pipeline, cache_key: str, entities) -> None:
+        list_key = cache.make_key(cache_key)
+        for entity in entities:
+            pipeline.hset(list_key, entity.id, self.__encode_entity(entity))
+            for index, attribute_path in self.list_indexes.items():
+                value = self.__get_attribute(entity, attribute_path)
+                if value is not None:
+                    pipeline.hset(
+                        self.__get_list_index_key(cache_key, index), value, entity.id
+                    )
+        for key in (list_key, *self.__get_list_index_keys(cache_key)):
+            pipeline.expire(key, self.CACHE_TTL)
+
+    def get_all(self, cache_key: str, app_name: str) -> list | None:
+        is_fetch_list = cache.get(Cache.__generate_cache_key(app_name))
+        # if is_fetch_list is true or list is never cached then fetch data from the database
+        if is_fetch_list is None or is_fetch_list:
+            return None
+        cached_data = get_redis_client().hvals(cache.make_key(cache_key))
+        entities = [self.__decode_entity(data) for data in cached_data]
+        if None in entities:
+            # stale record of the entity is found
             return None
-        return cached_data.get(cache_key)
+        entities.sort(
+            key=lambda entity: self.__get_attribute(entity, self.list_ordering)
+        )
+        return entities
 
-    @staticmethod
-    def set_all(cache_key: str, app_name: str, data, is_fetch_list=False) -> None:
-        # store the in the cache only if there is some vaue in data
-        # if data is of empty list there will be cache no being saved which causing query to execute always
-        # if data:
-        cached_data = {
-            cache_key: data,
-            Cache.__generate_cache_key(app_name): is_fetch_list,
-        }
-        cache.set_many(cached_data, Cache.CACHE_TTL)
+    def set_all(self, cache_key: str, app_name: str, data, is_fetch_list=False) -> None:
+        # empty list is also cached as is_fetch_list is stored separately, avoiding query to execute always
+        pipeline = get_redis_client().pipeline()
+        pipeline.delete(cache.make_key(cache_key), *self.__get_list_index_keys(cache_key))
+        self.__add_to_list(pipeline, cache_key, data)
+        pipeline.execute()
+        cache.set(Cache.__generate_cache_key(app_name), is_fetch_list, self.CACHE_TTL)
+
+    def get_from_list(self, cache_key: str, id: int) -> object | None:
+        cached_data = get_redis_client().hget(cache.make_key(cache_key), id)
+        if cached_data is None:
+            return None
+        return self.__decode_entity(cached_data)
+
+    def get_from_list_by_index(
+        self, cache_key: str, index: str, value
+    ) -> object | None:
+        """Returns the entity of the cached list whose indexed attribute is equal to value"""
+        id = get_redis_client().hget(self.__get_list_index_key(cache_key, index), value)
+        if id is None:
+            return None
+        entity = self.get_from_list(cache_key, int(id))
+        # index becomes stale if the indexed attribute of the entity is changed
+        if entity is None or (
+            self.__get_attribute(entity, self.list_indexes[index]) != value
+        ):
+            return None
+        return entity
+
+    def set_to_list(self, cache_key: str, app_name: str, data) -> None:
+        """Adds the entity or queryset of the entities to the cached list"""
+        entities = [data] if isinstance(data, Model) else data
+        client = get_redis_client()
+        is_list_cached = client.exists(cache.make_key(cache_key))
+        pipeline = client.pipeline()
+        self.__add_to_list(pipeline, cache_key, entities)
+        pipeline.execute()
+        if not is_list_cached:
+            # cached list only contains some of the entities
+            cache.set(Cache.__generate_cache_key(app_name), True, self.CACHE_TTL)
+
+    def delete_from_list(self, cache_key: str, app_name: str, id: int) -> None:
+        entity = self.get_from_list(cache_key, id)
+        if entity:
+            pipeline = get_redis_client().pipeline()
+            pipeline.hdel(cache.make_key(cache_key), id)
+            for index, attribute_path in self.list_indexes.items():
+                value = self.__get_attribute(entity, attribute_path)
+                if value is not None:
+                    pipeline.hdel(self.__get_list_index_key(cache_key, index), value)
+            pipeline.execute()
+            cache.set(Cache.__generate_cache_key(app_name), True, self.CACHE_TTL)
 
     @staticmethod
-    def get_from_list(cache_key: str, id: int) -> object | None:
+    def get(cache_key: str, record: CacheRecord | None = None) -> object | None:
         cached_data = cache.get(cache_key)
-        if cached_data:
-            result = next(
-                (data for data in cached_data if data.id == id),
-                None,
-            )
-            return result
-        return None
+        if record and cached_data is not None:
+            return record.loads(cached_data)
+        return cached_data
 
     @staticmethod
-    def set_to_list(cache_key: str, app_name: str, data) -> None:
-        cached_data = cache.get(cache_key)
-        if cached_data:
-            # combines the query set
-            cached_data = (
-                cached_data.append(data)
-                if type(cached_data) == list
-                else cached_data | data
-            )
-            cache.set(cache_key, cached_data, Cache.CACHE_TTL)
-        else:
-            cached_data = {
-                cache_key: data,
-                Cache.__generate_cache_key(app_name): True,
-            }
-            cache.set_many(cached_data, Cache.CACHE_TTL)
+    async def aget(
+        cache_key: str, record: CacheRecord | None = None
+    ) -> object | None:
+        """
+        Non blocking version of get.
+        django cache aget runs the blocking get in the thread so redis is called directly
+        """
+        cached_data = await get_async_redis_client().get(cache.make_key(cache_key))
+        if cached_data is None:
+            return None
+        cached_data = _redis_serializer.loads(cached_data)
+        return record.loads(cached_data) if record else cached_data
 
     @staticmethod
-    def delete_from_list(cache_key: str, app_name: str, id: int) -> None:
-        cached_data = cache.get(cache_key)
-        if cached_data:
-            item_to_delete = next(
-                (data for data in cached_data if data.id == id),
-                None,
-            )
-            if item_to_delete:
-                cached_data = (
-                    cached_data.remove(item_to_delete)
-                    if type(cached_data) == list
-                    else cached_data.exclude(pk=item_to_delete.id)
-                )
-                Cache.set_all(cache_key, app_name, cached_data, is_fetch_list=True)
+    def get_local(
+        cache_key: str, record: CacheRecord | None = None
+    ) -> object | None:
+        """
+        Same as get but keeps the value in the process local cache.
+        Use it for the hot lookups whose keys are removed with delete on change.
+        """
+        cached_data = local_cache.get(cache_key)
+        if cached_data is None:
+            start_invalidation_listener()
+            cached_data = Cache.get(cache_key, record)
+            if cached_data is not None:
+                local_cache.set(cache_key, cached_data)
+        return cached_data
 
     @staticmethod
-    def get(cache_key: str) -> object | None:
-        cached_data = cache.get(cache_key)
+    async def aget_local(
+        cache_key: str, record: CacheRecord | None = None
+    ) -> object | None:
+        """Async version of get_local"""
+        cached_data = local_cache.get(cache_key)
+        if cached_data is None:
+            start_invalidation_listener()
+            cached_data = await Cache.aget(cache_key, record)
+            if cached_data is not None:
+                local_cache.set(cache_key, cached_data)
         return cached_data
 
     @staticmethod
-    def set(cache_key: str, data, ttl=CACHE_TTL) -> None:
-        cache.set(cache_key, data, ttl)
+    def set(
+        cache_key: str, data, ttl=CACHE_TTL, record: CacheRecord | None = None
+    ) -> None:
+        # record stores the model instances as compact tuple instead of pickle
+        cache.set(cache_key, record.dumps(data) if record else data, ttl)
 
     @staticmethod
     def delete(cache_key: str) -> None:
         cache.delete(cache_key)
+        publish_invalidation(cache_key)
 
     @staticmethod
     def clear() -> None:
         """Delete all the stored values in cache"""
         cache.clear()
+        publish_invalidation(CLEAR_ALL)
 
     @staticmethod
     def set_many(cache_data: dict, ttl=CACHE_TTL) -> None:
@@ -99,14 +249,10 @@ class Cache(ABC):
 
     @staticmethod
     def delete_pattern(patterns: tuple[str]) -> None:
-        import redis
         from decouple import config
 
         database = config("REDIS_DATABASE")
-        # connect to the redis
-        r = redis.Redis(
-            host=config("REDIS_HOST"), port=config("REDIS_DATABASE_PORT"), db=database
-        )
+        r = get_redis_client()
         for pattern in patterns:
             pattern = f"{config('REDIS_KEY_PREFIX')}:{database}:{pattern}"
             cursor = 0
@@ -116,5 +262,4 @@ class Cache(ABC):
                     r.delete(key)
                 if cursor == 0:
                     break
-        # close the redis connection
-        r.close()
+        publish_invalidation(CLEAR_ALL)
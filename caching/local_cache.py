@@ -0,0 +1,114 @@
+"""
+Per process LRU cache with ttl that sits in front of redis for the hot lookups.
+Keys deleted from redis are published over redis pub/sub so that every process
+drops its local copy, ttl bounds the staleness if a message is missed.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# published in place of cache key when all the local entries must be dropped
+CLEAR_ALL = "*"
+
+
+class LocalCache:
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> object | None:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+local_cache = LocalCache(settings.LOCAL_CACHE_MAX_SIZE, settings.LOCAL_CACHE_TTL)
+
+# process id in which the invalidation listener is running, forked process starts its own
+_listener_pid = None
+_listener_lock = threading.Lock()
+
+
+def get_invalidation_channel() -> str:
+    from decouple import config
+
+    return f"{config('REDIS_KEY_PREFIX')}:local_cache_invalidation"
+
+
+def publish_invalidation(cache_key: str) -> None:
+    """Tells every process to drop the cache key from their local cache"""
+    from caching.cache import get_redis_client
+
+    if cache_key == CLEAR_ALL:
+        local_cache.clear()
+    else:
+        local_cache.delete(cache_key)
+    get_redis_client().publish(get_invalidation_channel(), cache_key)
+
+
+def _listen_invalidation():
+    from caching.cache import get_redis_client
+
+    while True:
+        try:
+            pubsub = get_redis_client().pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(get_invalidation_channel())
+            # messages published while not subscribed are lost so start fresh
+            local_cache.clear()
+            for message in pubsub.listen():
+                cache_key = message["data"].decode()
+                if cache_key == CLEAR_ALL:
+                    local_cache.clear()
+                else:
+                    local_cache.delete(cache_key)
+        except Exception:
+            logger.exception("Local cache invalidation listener disconnected")
+            local_cache.clear()
+            time.sleep(1)
+
+
+def start_invalidation_listener() -> None:
+    """Starts the invalidation listener thread once per process"""
+    global _listener_pid
+    if _listener_pid == os.getpid():
+        return
+    with _listener_lock:
+        if _listener_pid == os.getpid():
+            return
+        threading.Thread(
+            target=_listen_invalidation,
+            name="local-cache-invalidation",
+            daemon=True,
+        ).start()
+        _listener_pid = os.getpid()
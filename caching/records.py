@@ -0,0 +1,133 @@
+"""
+Compact cache records of the model instances.
+Instance is stored as msgpack tuple of its concrete field values along with the
+select related instances, instead of pickling the model instance or queryset.
+Rehydration builds the instances with Model.from_db and never touches the database.
+"""
+
+import zlib
+from datetime import date
+from decimal import Decimal
+
+import msgpack
+from django.db.models import Model
+from django.utils.functional import cached_property
+
+
+class CacheRecord:
+    def __init__(self, model, related: tuple = ()):
+        """
+        model: model class of the cached instances
+        related: name of the select related fields stored along with the instance
+        """
+        self.model = model
+        self.related = related
+
+    @cached_property
+    def fields(self) -> list:
+        return list(self.model._meta.concrete_fields)
+
+    @cached_property
+    def field_names(self) -> list:
+        return [field.attname for field in self.fields]
+
+    @cached_property
+    def related_records(self) -> dict:
+        return {
+            name: CacheRecord(self.model._meta.get_field(name).related_model)
+            for name in self.related
+        }
+
+    @cached_property
+    def signature(self) -> str:
+        related = ",".join(
+            f"{name}:{record.signature}" for name, record in self.related_records.items()
+        )
+        return f"{self.model._meta.label}({','.join(self.field_names)})[{related}]"
+
+    @cached_property
+    def version(self) -> int:
+        # changes whenever the fields of the model changes, so stale records are ignored
+        return zlib.crc32(self.signature.encode())
+
+    @staticmethod
+    def __encode_value(field, value):
+        if value is None:
+            return None
+        internal_type = field.get_internal_type()
+        if internal_type == "DateField":
+            return value.toordinal()
+        if internal_type in ("FileField", "ImageField"):
+            return str(value)
+        if internal_type == "DecimalField":
+            return str(value)
+        return value
+
+    @staticmethod
+    def __decode_value(field, value):
+        if value is None:
+            return None
+        internal_type = field.get_internal_type()
+        if internal_type == "DateField":
+            return date.fromordinal(value)
+        if internal_type == "DecimalField":
+            return Decimal(value)
+        return value
+
+    def to_tuple(self, instance) -> list:
+        row = [
+            [
+                self.__encode_value(field, getattr(instance, field.attname))
+                for field in self.fields
+            ]
+        ]
+        for name, record in self.related_records.items():
+            # reverse one to one raises DoesNotExist which is subclass of AttributeError
+            related_instance = getattr(instance, name, None)
+            row.append(
+                record.to_tuple(related_instance)
+                if related_instance is not None
+                else None
+            )
+        return row
+
+    def from_tuple(self, row):
+        values, *related_rows = row
+        instance = self.model.from_db(
+            "default",
+            self.field_names,
+            [
+                self.__decode_value(field, value)
+                for field, value in zip(self.fields, values)
+            ],
+        )
+        for (name, record), related_row in zip(
+            self.related_records.items(), related_rows
+        ):
+            related_instance = (
+                record.from_tuple(related_row) if related_row is not None else None
+            )
+            # caching the related instance same as select_related so accessing it doesn't query
+            self.model._meta.get_field(name).set_cached_value(
+                instance, related_instance
+            )
+        return instance
+
+    def dumps(self, data) -> bytes:
+        """Encodes the model instance or iterable of model instances"""
+        many = not isinstance(data, Model)
+        payload = (
+            [self.to_tuple(instance) for instance in data]
+            if many
+            else self.to_tuple(data)
+        )
+        return msgpack.packb([self.version, many, payload], datetime=True)
+
+    def loads(self, data: bytes):
+        """Returns the model instance or list of model instances, None if record is stale"""
+        version, many, payload = msgpack.unpackb(data, timestamp=3)
+        if version != self.version:
+            return None
+        if many:
+            return [self.from_tuple(row) for row in payload]
+        return self.from_tuple(payload)
@@ -5,6 +5,7 @@ from company.models import Company
 class CompanyCaching(Cache):
     app_name = "company"
     cache_key = "company_list"
+    list_indexes = {"slug": "slug"}
 
     def __get_queryset(self, company_slug: str):
         return (
@@ -14,14 +15,7 @@ class CompanyCaching(Cache):
         )
 
     def __get_company_by_slug(self, slug: str) -> object | None:
-        cached_data = self.get(self.cache_key)
-        if cached_data:
-            result = next(
-                (company for company in cached_data if company.slug == slug),
-                None,
-            )
-            return result
-        return None
+        return self.get_from_list_by_index(self.cache_key, "slug", slug)
 
     def get_company(self, company_slug: str):
         company = self.__get_company_by_slug(company_slug)
@@ -1,33 +1,22 @@
 from caching.cache import Cache
+from caching.records import CacheRecord
 from dealer.models import Dealer
 
 
 class DealerCaching(Cache):
     app_name = "dealer"
     cache_key = "dealer_list"
+    list_indexes = {"slug": "slug", "username": "user.username"}
+    list_record = CacheRecord(Dealer, related=("user",))
 
     def __get_queryset(self, dealer_slug: str):
         return Dealer.objects.select_related("user").filter(slug=dealer_slug)
 
     def __get_dealer_by_slug(self, slug: str) -> object | None:
-        cached_data = self.get(self.cache_key)
-        if cached_data:
-            result = next(
-                (dealer for dealer in cached_data if dealer.slug == slug),
-                None,
-            )
-            return result
-        return None
+        return self.get_from_list_by_index(self.cache_key, "slug", slug)
 
     def __get_dealer_by_username(self, username: str) -> object | None:
-        cached_data = self.get(self.cache_key)
-        if cached_data:
-            result = next(
-                (dealer for dealer in cached_data if dealer.user.username == username),
-                None,
-            )
-            return result
-        return None
+        return self.get_from_list_by_index(self.cache_key, "username", username)
 
     def get_dealer(self, dealer_slug: str):
         dealer = self.__get_dealer_by_slug(dealer_slug)
@@ -91,6 +91,8 @@ TEMPLATES = [
 # WSGI_APPLICATION = "iot.wsgi.application"
 ASGI_APPLICATION = "iot.asgi.application"
 ASGI_THREADS = 1000
+# number of threads used by the async views and consumers for the database queries
+EXECUTOR_MAX_WORKERS = config("EXECUTOR_MAX_WORKERS", default=32, cast=int)
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
@@ -243,7 +245,135 @@ CELERY_BROKER_URL = (
 )
 CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
 CELERY_RESULT_BACKEND = f"db+{database_url}"
+CELERY_BEAT_SCHEDULE = {}
+
+
+# write-behind ingestion of the sensor data
+# when enabled, validated readings are pushed to redis list and celery worker flushes them into database
+SENSOR_DATA_WRITE_BEHIND = config("SENSOR_DATA_WRITE_BEHIND", default=False, cast=bool)
+# number of rows inserted per multi-row insert and queue length that triggers an early flush
+SENSOR_DATA_FLUSH_SIZE = config("SENSOR_DATA_FLUSH_SIZE", default=1000, cast=int)
+SENSOR_DATA_FLUSH_INTERVAL = config(
+    "SENSOR_DATA_FLUSH_INTERVAL", default=2.0, cast=float
+)  # value in seconds
+# worst case time of the multi-row insert of a single flush batch, the flush lock is held this long
+SENSOR_DATA_FLUSH_TIMEOUT = config(
+    "SENSOR_DATA_FLUSH_TIMEOUT", default=300, cast=int
+)  # value in seconds
+# readings are written synchronously once the queue grows past this length
+SENSOR_DATA_BUFFER_MAX_LENGTH = config(
+    "SENSOR_DATA_BUFFER_MAX_LENGTH", default=200000, cast=int
+)
+
+if SENSOR_DATA_WRITE_BEHIND:
+    CELERY_BEAT_SCHEDULE["flush-sensor-data-buffer"] = {
+        "task": "sensor_data.tasks.flush_sensor_data_buffer",
+        "schedule": SENSOR_DATA_FLUSH_INTERVAL,
+    }
+
+# rollups of the sensor data into 1m/1h/1d buckets, run the backfill_sensor_data_rollups
+# command before enabling so the charts of the old date range are not empty
+SENSOR_DATA_ROLLUP = config("SENSOR_DATA_ROLLUP", default=False, cast=bool)
+SENSOR_DATA_ROLLUP_INTERVAL = config(
+    "SENSOR_DATA_ROLLUP_INTERVAL", default=60, cast=int
+)  # value in seconds
+# readings older than the watermark by this much are still rolled up, value in seconds
+SENSOR_DATA_ROLLUP_LATE_WINDOW = config(
+    "SENSOR_DATA_ROLLUP_LATE_WINDOW", default=3600, cast=int
+)
+# ranges up to this long are served from the raw sensor data, value in seconds
+SENSOR_DATA_ROLLUP_RAW_MAX_RANGE = config(
+    "SENSOR_DATA_ROLLUP_RAW_MAX_RANGE", default=86400, cast=int
+)
+# finest resolution with at most this many buckets in the range is used
+SENSOR_DATA_ROLLUP_MAX_POINTS = config(
+    "SENSOR_DATA_ROLLUP_MAX_POINTS", default=2000, cast=int
+)
 
+# upper limit of the points in the downsampled chart data send over websocket
+SENSOR_DATA_MAX_POINTS = config("SENSOR_DATA_MAX_POINTS", default=5000, cast=int)
+# live data of the devices of a websocket group received within the window is merged
+# into a single frame, 250 to 1000 works well for the busy sites, 0 sends every reading
+LIVE_DATA_COALESCE_WINDOW = config(
+    "LIVE_DATA_COALESCE_WINDOW", default=0, cast=int
+)  # value in milliseconds
+# lower limit of the max frame rate a websocket connection can ask for, frames per second
+LIVE_DATA_MIN_FRAME_RATE = config("LIVE_DATA_MIN_FRAME_RATE", default=0.1, cast=float)
+
+# chart queries up to this range are served by the websocket consumer, longer ones
+# by the celery worker, value in seconds
+SENSOR_DATA_INLINE_MAX_RANGE = config(
+    "SENSOR_DATA_INLINE_MAX_RANGE", default=259200, cast=int
+)
+
+# background excel exports are written here and kept for SENSOR_DATA_EXPORT_TTL
+SENSOR_DATA_EXPORT_ROOT = config(
+    "SENSOR_DATA_EXPORT_ROOT", default=str(BASE_DIR / "exports")
+)
+SENSOR_DATA_EXPORT_TTL = config(
+    "SENSOR_DATA_EXPORT_TTL", default=86400, cast=int
+)  # value in seconds
+# export of the range ending today is reused only for this long, value in seconds
+SENSOR_DATA_EXPORT_FRESH_TTL = config(
+    "SENSOR_DATA_EXPORT_FRESH_TTL", default=300, cast=int
+)
+# export task is failed after this long and killed a minute later, value in seconds
+SENSOR_DATA_EXPORT_TIME_LIMIT = config(
+    "SENSOR_DATA_EXPORT_TIME_LIMIT", default=3600, cast=int
+)
+
+CELERY_BEAT_SCHEDULE["remove-expired-sensor-data-exports"] = {
+    "task": "sensor_data.tasks.remove_expired_sensor_data_exports",
+    "schedule": 3600,
+}
+
+if SENSOR_DATA_ROLLUP:
+    CELERY_BEAT_SCHEDULE["update-sensor-data-rollups"] = {
+        "task": "sensor_data.tasks.update_sensor_data_rollups",
+        "schedule": SENSOR_DATA_ROLLUP_INTERVAL,
+    }
+
+
+# monthly range partitions of the sensor data, run the sensor_data_partitions command
+# with --init before enabling
+SENSOR_DATA_PARTITIONING = config("SENSOR_DATA_PARTITIONING", default=False, cast=bool)
+# number of monthly partitions created ahead of the current month
+SENSOR_DATA_PARTITION_MONTHS_AHEAD = config(
+    "SENSOR_DATA_PARTITION_MONTHS_AHEAD", default=3, cast=int
+)
+# partitions older than this many months are expired, 0 keeps the sensor data forever
+SENSOR_DATA_PARTITION_RETENTION_MONTHS = config(
+    "SENSOR_DATA_PARTITION_RETENTION_MONTHS", default=0, cast=int
+)
+# expired partitions are moved into sensor_data_sensordata_archive_pYYYYMM tables instead of dropped
+SENSOR_DATA_PARTITION_ARCHIVE = config(
+    "SENSOR_DATA_PARTITION_ARCHIVE", default=True, cast=bool
+)
+
+if SENSOR_DATA_PARTITIONING:
+    CELERY_BEAT_SCHEDULE["manage-sensor-data-partitions"] = {
+        "task": "sensor_data.tasks.manage_sensor_data_partitions",
+        "schedule": 86400,
+    }
+
+# raw sensor data older than the hot window of the device owner is archived to parquet files
+# per device per month and deleted, rollups are kept
+SENSOR_DATA_RETENTION = config("SENSOR_DATA_RETENTION", default=False, cast=bool)
+# hot window of the devices without a retention policy, 0 keeps the sensor data forever
+SENSOR_DATA_RETENTION_DAYS = config("SENSOR_DATA_RETENTION_DAYS", default=0, cast=int)
+# number of rows deleted per transaction
+SENSOR_DATA_RETENTION_BATCH_SIZE = config(
+    "SENSOR_DATA_RETENTION_BATCH_SIZE", default=5000, cast=int
+)
+SENSOR_DATA_ARCHIVE_ROOT = config(
+    "SENSOR_DATA_ARCHIVE_ROOT", default=str(BASE_DIR / "archive")
+)
+
+if SENSOR_DATA_RETENTION:
+    CELERY_BEAT_SCHEDULE["apply-sensor-data-retention"] = {
+        "task": "sensor_data.tasks.apply_sensor_data_retention",
+        "schedule": 86400,
+    }
 
 #  Redis cache setting
 CACHES = {
@@ -258,6 +388,10 @@ CACHES = {
     }
 }
 
+# per process cache in front of redis for the hot lookups i.e device authentication
+LOCAL_CACHE_MAX_SIZE = config("LOCAL_CACHE_MAX_SIZE", default=10000, cast=int)
+LOCAL_CACHE_TTL = config("LOCAL_CACHE_TTL", default=60, cast=int)  # value in seconds
+
 
 # setting the channel layer for websocket connection
 CHANNEL_LAYERS = {
@@ -1,14 +1,21 @@
 from caching.cache import Cache
+from caching.records import CacheRecord
 from iot_devices.models import IotDevice, IotDeviceSensor
 from company.cache import CompanyCache
 import hashlib
 
 from users.cache import UserCache
+from utils.executor import run_in_executor
 
 
 class IotDeviceCaching(Cache):
     app_name = "iot_devices"
     cache_key = "iot_devices_list"
+    list_record = CacheRecord(
+        IotDevice, related=("user", "company", "dealer", "iot_device_details")
+    )
+    device_sensor_record = CacheRecord(IotDeviceSensor, related=("sensor",))
+    auth_device_record = CacheRecord(IotDevice, related=("user", "company"))
 
     def __generate_cache_key_from_api_key(self, api_key: str):
         # Using a secure hash function to generate a deterministic cache key
@@ -17,6 +24,10 @@ class IotDeviceCaching(Cache):
     def __get_device_sensor_cache_key(self, device_id: int):
         return f"device_sensor_{device_id}"
 
+    def __get_device_ingest_plan_cache_key(self, device_id: int):
+        # prefixed with device_sensor so that it is deleted along with device sensor on sensor name change
+        return f"device_sensor_ingest_plan_{device_id}"
+
     def __get__user_device_cache_key(self, username: str):
         return f"user_device_{username}"
 
@@ -29,18 +40,7 @@ class IotDeviceCaching(Cache):
         ).filter(pk=iot_device_id)
 
     def __get_iot_device_by_id(self, iot_device_id: int) -> object | None:
-        cached_data = self.get(self.cache_key)
-        if cached_data:
-            result = next(
-                (
-                    iot_device
-                    for iot_device in cached_data
-                    if iot_device.id == iot_device_id
-                ),
-                None,
-            )
-            return result
-        return None
+        return self.get_from_list(self.cache_key, iot_device_id)
 
     def get_user_or_company_device_cache_key(
         self,
@@ -104,10 +104,11 @@ class IotDeviceCaching(Cache):
     def delete_iot_device(
         self, iot_device_id: int, system_delete=False, company_slug=None, username=None
     ):
+        # device used for authentication is also removed so that change in is_active or ownership is reflected
+        iot_device = self.__get_iot_device_by_id(iot_device_id)
+        self.delete_auth_cache_iot_device(iot_device)
         if system_delete:
             self.delete_device_sensors(iot_device_id)
-            iot_device = self.__get_iot_device_by_id(iot_device_id)
-            self.delete_auth_cache_iot_device(iot_device)
 
         self.delete_from_list(self.cache_key, self.app_name, id=iot_device_id)
 
@@ -120,33 +121,94 @@ class IotDeviceCaching(Cache):
     def get_all_device_sensors(self, device_id):
         """Returns the IotDeviceSensor Models, all instances associated with the Iot device"""
         cache_key = self.__get_device_sensor_cache_key(device_id)
-        device_sensors = self.get(cache_key)
+        device_sensors = self.get_local(cache_key, record=self.device_sensor_record)
         if device_sensors is None:
-            device_sensors = IotDeviceSensor.objects.select_related("sensor").filter(
-                iot_device=device_id
+            device_sensors = list(
+                IotDeviceSensor.objects.select_related("sensor").filter(
+                    iot_device=device_id
+                )
             )
-            self.set(cache_key, data=device_sensors)
+            self.set(cache_key, data=device_sensors, record=self.device_sensor_record)
         return device_sensors
 
+    def get_device_sensor_ids(self, device_ids, sensor_names) -> dict:
+        """
+        Resolves the sensor names to the device sensors of the Iot devices,
+        so the sensor data is filtered on device_sensor_id without joining the sensor.
+        Returns {device_sensor_id: (iot_device_id, sensor_name)}
+        """
+        sensor_names = set(sensor_names)
+        return {
+            device_sensor.id: (device_id, device_sensor.sensor.name)
+            for device_id in device_ids
+            for device_sensor in self.get_all_device_sensors(device_id)
+            if device_sensor.sensor.name in sensor_names
+        }
+
+    def get_device_sensor_id(self, device_id, sensor_name: str) -> int | None:
+        """Returns the device sensor id of the sensor of the Iot device"""
+        for device_sensor_id in self.get_device_sensor_ids([device_id], [sensor_name]):
+            return device_sensor_id
+        return None
+
+    def get_device_ingest_plan(self, device_id):
+        """
+        Returns the compiled ingest plan of the Iot device used for validating the sensor data.
+        plan is a dictionary in format
+        {field_name: (device_sensor_id, is_value_boolean, min_limit, max_limit, sensor_name)}
+        """
+        cache_key = self.__get_device_ingest_plan_cache_key(device_id)
+        ingest_plan = self.get_local(cache_key)
+        if ingest_plan is None:
+            ingest_plan = {
+                device_sensor.field_name: (
+                    device_sensor.id,
+                    device_sensor.sensor.is_value_boolean,
+                    device_sensor.min_limit,
+                    device_sensor.max_limit,
+                    device_sensor.sensor.name,
+                )
+                for device_sensor in self.get_all_device_sensors(device_id)
+            }
+            self.set(cache_key, data=ingest_plan)
+        return ingest_plan
+
+    async def aget_device_ingest_plan(self, device_id):
+        """Async version of get_device_ingest_plan, database is only hit on cache miss"""
+        cache_key = self.__get_device_ingest_plan_cache_key(device_id)
+        ingest_plan = await self.aget_local(cache_key)
+        if ingest_plan is None:
+            ingest_plan = await run_in_executor(self.get_device_ingest_plan, device_id)
+        return ingest_plan
+
     def delete_device_sensors(self, device_id):
         cache_key = self.__get_device_sensor_cache_key(device_id)
         self.delete(cache_key)
+        self.delete(self.__get_device_ingest_plan_cache_key(device_id))
 
     def get_iot_device_by_api_key(self, api_key: str):
         cache_key = self.__generate_cache_key_from_api_key(api_key)
-        iot_device = self.get(cache_key)
+        iot_device = self.get_local(cache_key, record=self.auth_device_record)
 
         if iot_device is None:
             try:
                 iot_device = IotDevice.objects.select_related("user", "company").get(
                     api_key=api_key
                 )
-                self.set(cache_key, iot_device)
+                self.set(cache_key, iot_device, record=self.auth_device_record)
 
             except IotDevice.DoesNotExist:
                 return None
         return iot_device
 
+    async def aget_iot_device_by_api_key(self, api_key: str):
+        """Async version of get_iot_device_by_api_key, database is only hit on cache miss"""
+        cache_key = self.__generate_cache_key_from_api_key(api_key)
+        iot_device = await self.aget_local(cache_key, record=self.auth_device_record)
+        if iot_device is None:
+            iot_device = await run_in_executor(self.get_iot_device_by_api_key, api_key)
+        return iot_device
+
     def delete_auth_cache_iot_device(self, iot_device):
         """Delete the iot device in cache that is being used for authetication of device"""
         api_key = iot_device.api_key if iot_device else None
@@ -164,7 +226,7 @@ class IotDeviceCaching(Cache):
                 user = UserCache.get_user(username)
                 if user is None:
                     return None
-            user_devices = user.iot_device.values_list("id", flat=True)
+            user_devices = list(user.iot_device.values_list("id", flat=True))
             self.set(cache_key=cache_key, data=user_devices)
         return user_devices
 
@@ -178,7 +240,7 @@ class IotDeviceCaching(Cache):
                 company = CompanyCache.get_company(company_slug)
                 if company is None:
                     return None
-            company_devices = company.iot_device.values_list("id", flat=True)
+            company_devices = list(company.iot_device.values_list("id", flat=True))
             self.set(cache_key=cache_key, data=company_devices)
         return company_devices
 
@@ -0,0 +1,49 @@
+import pickle
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from iot_devices.cache import IotDeviceCache
+from iot_devices.models import IotDevice, IotDeviceSensor
+
+
+class Command(BaseCommand):
+    help = "Compares payload size and decode time of pickled and compact cache records"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--number", type=int, default=1000)
+
+    def benchmark(self, name, data, record, number):
+        pickled = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+        compact = record.dumps(data)
+        pickle_time = timeit.timeit(lambda: pickle.loads(pickled), number=number)
+        record_time = timeit.timeit(lambda: record.loads(compact), number=number)
+        self.stdout.write(
+            f"{name}: pickle {len(pickled)} bytes {pickle_time / number * 1e6:.1f}us, "
+            f"record {len(compact)} bytes {record_time / number * 1e6:.1f}us"
+        )
+
+    def handle(self, number, *args, **options):
+        iot_device = IotDevice.objects.first()
+        if iot_device is None:
+            self.stdout.write("No iot device found")
+            return
+
+        device_sensors = list(
+            IotDeviceSensor.objects.select_related("sensor").filter(
+                iot_device=iot_device
+            )
+        )
+        self.benchmark(
+            "device sensors",
+            device_sensors,
+            IotDeviceCache.device_sensor_record,
+            number,
+        )
+
+        iot_devices = list(
+            IotDevice.objects.select_related(
+                "user", "company", "dealer", "iot_device_details"
+            ).all()
+        )
+        self.benchmark("iot devices", iot_devices, IotDeviceCache.list_record, number)
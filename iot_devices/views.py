@@ -5,6 +5,7 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
 from iot_devices.cache import IotDeviceCache
+from sensor_data.cache import LatestSensorDataCache
 from sensors.cache import SensorCache
 from users.cache import UserCache
 from utils.commom_functions import get_groups_tuple
@@ -50,8 +51,12 @@ def iot_device_list_all(request):
     iot_devices = IotDeviceCache.get_all_iot_devices()
 
     if GroupName.DEALER_GROUP in user_groups:
-        iot_device_list = IotDeviceCache.dealer_associated_iot_device(user.dealer)
-        iot_devices = iot_devices.filter(id__in=iot_device_list)
+        iot_device_list = set(
+            IotDeviceCache.dealer_associated_iot_device(user.dealer)
+        )
+        iot_devices = [
+            iot_device for iot_device in iot_devices if iot_device.id in iot_device_list
+        ]
 
     elif not GroupName.SUPERADMIN_GROUP in user_groups:
         iot_device_list = []
@@ -62,7 +67,10 @@ def iot_device_list_all(request):
         else:
             # user is of type Viewer or Moderator
             iot_device_list = IotDeviceCache.get_all_user_iot_devices(user.created_by)
-        iot_devices = iot_devices.filter(id__in=iot_device_list)
+        iot_device_list = set(iot_device_list)
+        iot_devices = [
+            iot_device for iot_device in iot_devices if iot_device.id in iot_device_list
+        ]
 
     serializer = IotDeviceSerializer(
         iot_devices, many=True, context={"request": request}
@@ -128,6 +136,7 @@ def iot_device(request, id):
                     username=username,
                     company_slug=company_slug,
                 )
+                LatestSensorDataCache.delete_latest_sensor_data(id)
             except ProtectedError as e:
                 related_objects_details = [
                     obj._meta.verbose_name for obj in e.protected_objects
@@ -220,6 +229,8 @@ def device_sensor(request, device_id):
                     except ProtectedError:
                         error_list.append(device_sensor.sensor.name)
             IotDeviceCache.delete_device_sensors(device_id)
+            # reloaded from the database without the deleted device sensors
+            LatestSensorDataCache.delete_latest_sensor_data(device_id)
             if error_list:
                 error_sensors = ",".join(error_list)
                 return Response(
@@ -1,51 +1,25 @@
 from caching.cache import Cache
+from caching.records import CacheRecord
 from send_livedata.models import SendLiveDataList
 
 
 class SendLiveDataCaching(Cache):
     app_name = "send_livedata"
     cache_key = "send_livedata_list"
+    list_indexes = {"username": "user.username", "company_slug": "company.slug"}
+    list_record = CacheRecord(SendLiveDataList, related=("user", "company"))
 
     def __get_queryset(self, id: int):
         return SendLiveDataList.objects.select_related("user", "company").filter(pk=id)
 
     def __get_send_livedata_by_id(self, id: int):
-        cached_data = self.get(self.cache_key)
-        if cached_data:
-            result = next(
-                (data for data in cached_data if data.id == id),
-                None,
-            )
-            return result
-        return None
+        return self.get_from_list(self.cache_key, id)
 
     def __get_send_livedata_by_user(self, username: str):
-        cached_data = self.get(self.cache_key)
-        if cached_data:
-            result = next(
-                (
-                    data
-                    for data in cached_data
-                    if data.user and data.user.username == username
-                ),
-                None,
-            )
-            return result
-        return None
+        return self.get_from_list_by_index(self.cache_key, "username", username)
 
     def __get_send_livedata_by_company_slug(self, company_slug: str):
-        cached_data = self.get(self.cache_key)
-        if cached_data:
-            result = next(
-                (
-                    data
-                    for data in cached_data
-                    if data.company and data.company.slug == company_slug
-                ),
-                None,
-            )
-            return result
-        return None
+        return self.get_from_list_by_index(self.cache_key, "company_slug", company_slug)
 
     def get_all_send_livedata(self):
         send_livedata = self.get_all(self.cache_key, self.app_name)
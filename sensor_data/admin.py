@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import SensorData
+from .models import SensorData, SensorDataRetentionPolicy, SensorDataRollup
 
 
 # Register your models here.
@@ -11,3 +11,21 @@ class SensorDataAdmin(admin.ModelAdmin):
         "value",
         "timestamp",
     )
+
+
+@admin.register(SensorDataRollup)
+class SensorDataRollupAdmin(admin.ModelAdmin):
+    list_display = (
+        "device_sensor",
+        "iot_device",
+        "resolution",
+        "bucket",
+        "avg_value",
+        "count",
+    )
+    list_filter = ("resolution",)
+
+
+@admin.register(SensorDataRetentionPolicy)
+class SensorDataRetentionPolicyAdmin(admin.ModelAdmin):
+    list_display = ("company", "user", "hot_days", "archive")
@@ -0,0 +1,183 @@
+"""
+Write-behind buffer for the sensor data.
+Validated readings are pushed to a redis list and flushed into the database by
+the celery worker in large multi-row inserts on size or time threshold.
+"""
+
+import json
+import time
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from caching.cache import get_redis_client
+from sensor_data.cache import LatestSensorDataCache
+from sensor_data.models import SensorData
+
+# marker of the oldest buffered row is cleared only if the buffer is still empty,
+# so it is not lost when a push lands between the last read and the clear
+CLEAR_OLDEST_PUSHED_AT_SCRIPT = """
+if redis.call('LLEN', KEYS[1]) == 0 then
+    return redis.call('HDEL', KEYS[2], 'oldest_pushed_at')
+end
+return 0
+"""
+
+
+class SensorDataBuffering:
+    buffer_key = "sensor_data_buffer"
+    metrics_key = "sensor_data_buffer_metrics"
+    flush_lock_key = "sensor_data_buffer_flush_lock"
+    flush_scheduled_key = "sensor_data_buffer_flush_scheduled"
+    __clear_oldest_pushed_at_script = None
+
+    def is_enabled(self) -> bool:
+        return settings.SENSOR_DATA_WRITE_BEHIND
+
+    @staticmethod
+    def get_flush_lock_ttl() -> int:
+        """
+        Lock is extended after every batch, so it must outlive the slowest insert of a
+        batch, otherwise other worker starts flushing the same rows.
+        """
+        return settings.SENSOR_DATA_FLUSH_TIMEOUT
+
+    def __get_clear_oldest_pushed_at_script(self):
+        if self.__clear_oldest_pushed_at_script is None:
+            SensorDataBuffering.__clear_oldest_pushed_at_script = (
+                get_redis_client().register_script(CLEAR_OLDEST_PUSHED_AT_SCRIPT)
+            )
+        return self.__clear_oldest_pushed_at_script
+
+    def __encode(self, sensor_data: SensorData) -> str:
+        return json.dumps(
+            [
+                sensor_data.device_sensor_id,
+                sensor_data.iot_device_id,
+                sensor_data.value,
+                sensor_data.timestamp.isoformat(),
+            ]
+        )
+
+    def __decode(self, row: bytes) -> SensorData:
+        device_sensor_id, iot_device_id, value, timestamp = json.loads(row)
+        return SensorData(
+            device_sensor_id=device_sensor_id,
+            iot_device_id=iot_device_id,
+            value=value,
+            timestamp=parse_datetime(timestamp),
+        )
+
+    def push(self, sensor_data: list) -> bool:
+        """
+        Pushes the sensor data into the buffer.
+        Returns False if write-behind is disabled or the buffer is full,
+        in that case caller must write the sensor data to the database itself.
+        """
+        if not self.is_enabled() or not sensor_data:
+            return False
+
+        client = get_redis_client()
+        if client.llen(self.buffer_key) >= settings.SENSOR_DATA_BUFFER_MAX_LENGTH:
+            # back-pressure: database is not keeping up so write synchronously
+            client.hincrby(self.metrics_key, "rejected", len(sensor_data))
+            return False
+
+        pipeline = client.pipeline(transaction=False)
+        pipeline.rpush(self.buffer_key, *(self.__encode(data) for data in sensor_data))
+        pipeline.hincrby(self.metrics_key, "pushed", len(sensor_data))
+        pipeline.hsetnx(self.metrics_key, "oldest_pushed_at", time.time())
+        length, *_ = pipeline.execute()
+
+        if length >= settings.SENSOR_DATA_FLUSH_SIZE and client.set(
+            self.flush_scheduled_key, 1, nx=True, ex=1
+        ):
+            # importing here to avoid the circular import
+            from sensor_data.tasks import flush_sensor_data_buffer
+
+            flush_sensor_data_buffer.delay()
+        return True
+
+    def write(self, sensor_data: list) -> None:
+        """
+        Pushes the sensor data into the buffer or writes it to the database
+        and updates the latest reading of the device sensors.
+        """
+        if not self.push(sensor_data):
+            with transaction.atomic():
+                SensorData.objects.bulk_create(sensor_data)
+        LatestSensorDataCache.set_latest_sensor_data(sensor_data)
+
+    def flush(self) -> int:
+        """
+        Moves the buffered sensor data into the database until the buffer is empty.
+        Rows are removed from the buffer only after they are committed.
+        Returns the number of rows written.
+        """
+        client = get_redis_client()
+        lock_ttl = self.get_flush_lock_ttl()
+        lock_token = uuid.uuid4().hex
+        if not client.set(self.flush_lock_key, lock_token, nx=True, ex=lock_ttl):
+            # other worker is already flushing the buffer
+            return 0
+
+        flush_size = settings.SENSOR_DATA_FLUSH_SIZE
+        total = 0
+        started_at = time.monotonic()
+        is_flushed = False
+        try:
+            while True:
+                rows = client.lrange(self.buffer_key, 0, flush_size - 1)
+                if not rows:
+                    break
+                with transaction.atomic():
+                    SensorData.objects.bulk_create(
+                        [self.__decode(row) for row in rows]
+                    )
+                client.ltrim(self.buffer_key, len(rows), -1)
+                client.expire(self.flush_lock_key, lock_ttl)
+                total += len(rows)
+            is_flushed = True
+        finally:
+            pipeline = client.pipeline(transaction=False)
+            if total:
+                pipeline.hincrby(self.metrics_key, "flushed", total)
+            if is_flushed:
+                # lag is kept after the failed flush as the rows are still buffered
+                pipeline.hset(
+                    self.metrics_key,
+                    mapping={
+                        "last_flush_at": time.time(),
+                        "last_flush_rows": total,
+                        "last_flush_duration": time.monotonic() - started_at,
+                    },
+                )
+                self.__get_clear_oldest_pushed_at_script()(
+                    keys=[self.buffer_key, self.metrics_key], client=pipeline
+                )
+            pipeline.execute()
+            # lock may have expired and been taken by other worker
+            if client.get(self.flush_lock_key) == lock_token.encode():
+                client.delete(self.flush_lock_key)
+        return total
+
+    def get_metrics(self) -> dict:
+        """Returns the back-pressure metrics of the buffer"""
+        client = get_redis_client()
+        pipeline = client.pipeline(transaction=False)
+        pipeline.llen(self.buffer_key)
+        pipeline.hgetall(self.metrics_key)
+        length, metrics = pipeline.execute()
+        metrics = {key.decode(): float(value) for key, value in metrics.items()}
+        oldest_pushed_at = metrics.pop("oldest_pushed_at", None)
+        metrics["length"] = length
+        metrics["max_length"] = settings.SENSOR_DATA_BUFFER_MAX_LENGTH
+        metrics["lag"] = (
+            time.time() - oldest_pushed_at if length and oldest_pushed_at else 0
+        )
+        return metrics
+
+
+SensorDataBuffer = SensorDataBuffering()
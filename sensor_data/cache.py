@@ -0,0 +1,182 @@
+"""
+Latest reading of each device sensor, kept as a redis hash per iot device of
+device sensor id and "timestamp,value". Updated on every ingest so the dashboard
+initial data and the latest api never scan the sensor data history.
+"""
+
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import connection
+
+from caching.cache import get_redis_client
+from iot_devices.cache import IotDeviceCache
+
+# fields marking the hash is being loaded and is loaded from the database
+LOADING_FIELD = "loading"
+LOADED_FIELD = "loaded"
+
+# upserts the reading only if it is newer than the stored one, hash which is not
+# yet created by loading from the database is left alone
+UPSERT_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+for i = 1, #ARGV, 2 do
+    local current = redis.call('HGET', KEYS[1], ARGV[i])
+    local timestamp = tonumber(string.match(ARGV[i + 1], '^[^,]+'))
+    if not current or tonumber(string.match(current, '^[^,]+')) < timestamp then
+        redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+    end
+end
+return 1
+"""
+
+
+class LatestSensorDataCaching:
+    __upsert_script = None
+
+    def __get_cache_key(self, iot_device_id: int) -> str:
+        return f"latest_sensor_data_{iot_device_id}"
+
+    def __encode(self, timestamp: datetime, value) -> str:
+        # boolean readings i.e. mains are stored as number so decoding always gets a float
+        return f"{timestamp.timestamp()},{'' if value is None else float(value)}"
+
+    def __decode(self, data: bytes) -> tuple:
+        timestamp, value = data.decode().split(",", 1)
+        return (
+            datetime.fromtimestamp(float(timestamp), tz=dt_timezone.utc),
+            float(value) if value else None,
+        )
+
+    def __get_upsert_script(self):
+        if self.__upsert_script is None:
+            LatestSensorDataCaching.__upsert_script = (
+                get_redis_client().register_script(UPSERT_SCRIPT)
+            )
+        return self.__upsert_script
+
+    def __load_from_database(self, iot_device_list: list) -> dict:
+        """Returns the latest reading of each device sensor of the iot devices"""
+        readings = {iot_device_id: {} for iot_device_id in iot_device_list}
+        with connection.cursor() as cursor:
+            raw_query = """
+                        SELECT sd.iot_device_id, sd.device_sensor_id, sd.timestamp, sd.value
+                        FROM thoploiot.sensor_data_sensordata sd
+                        JOIN (
+                            SELECT iot_device_id, device_sensor_id, MAX(timestamp) AS max_timestamp
+                            FROM thoploiot.sensor_data_sensordata
+                            WHERE iot_device_id IN %s
+                            GROUP BY iot_device_id, device_sensor_id
+                        ) AS max_timestamps
+                        ON sd.iot_device_id = max_timestamps.iot_device_id
+                            AND sd.device_sensor_id = max_timestamps.device_sensor_id
+                            AND sd.timestamp = max_timestamps.max_timestamp
+                        WHERE sd.iot_device_id IN %s
+                    """
+            cursor.execute(raw_query, [iot_device_list, iot_device_list])
+            for iot_device_id, device_sensor_id, timestamp, value in cursor.fetchall():
+                readings[iot_device_id][device_sensor_id] = (
+                    timestamp.replace(tzinfo=dt_timezone.utc),
+                    value,
+                )
+        return readings
+
+    def set_latest_sensor_data(self, sensor_data: list) -> None:
+        """Upserts the newest reading of each device sensor in the sensor data"""
+        readings = {}
+        for data in sensor_data:
+            key = (data.iot_device_id, data.device_sensor_id)
+            if key not in readings or readings[key].timestamp < data.timestamp:
+                readings[key] = data
+
+        device_readings = {}
+        for (iot_device_id, device_sensor_id), data in readings.items():
+            device_readings.setdefault(iot_device_id, []).extend(
+                [device_sensor_id, self.__encode(data.timestamp, data.value)]
+            )
+
+        script = self.__get_upsert_script()
+        pipeline = get_redis_client().pipeline(transaction=False)
+        for iot_device_id, args in device_readings.items():
+            script(keys=[self.__get_cache_key(iot_device_id)], args=args, client=pipeline)
+        pipeline.execute()
+
+    def get_latest_sensor_data(self, iot_device_list) -> dict:
+        """
+        Returns the latest reading of each device sensor of the iot devices
+        as {iot_device_id: {device_sensor_id: (timestamp, value)}}.
+        Iot devices which are not yet cached are loaded from the database once.
+        """
+        if not iot_device_list:
+            return {}
+        iot_device_list = list(iot_device_list)
+
+        client = get_redis_client()
+        pipeline = client.pipeline(transaction=False)
+        for iot_device_id in iot_device_list:
+            pipeline.hgetall(self.__get_cache_key(iot_device_id))
+
+        readings = {}
+        missing_devices = []
+        for iot_device_id, data in zip(iot_device_list, pipeline.execute()):
+            if LOADED_FIELD.encode() not in data:
+                missing_devices.append(iot_device_id)
+                continue
+            data.pop(LOADED_FIELD.encode())
+            data.pop(LOADING_FIELD.encode(), None)
+            readings[iot_device_id] = {
+                int(device_sensor_id): self.__decode(reading)
+                for device_sensor_id, reading in data.items()
+            }
+
+        if missing_devices:
+            # readings ingested while loading from the database are upserted into
+            # the hash created by the loading field, so they are not lost
+            pipeline = client.pipeline(transaction=False)
+            for iot_device_id in missing_devices:
+                pipeline.hset(self.__get_cache_key(iot_device_id), LOADING_FIELD, 1)
+            pipeline.execute()
+
+            loaded_readings = self.__load_from_database(missing_devices)
+            script = self.__get_upsert_script()
+            pipeline = client.pipeline(transaction=False)
+            for iot_device_id, device_readings in loaded_readings.items():
+                cache_key = self.__get_cache_key(iot_device_id)
+                args = []
+                for device_sensor_id, (timestamp, value) in device_readings.items():
+                    args.extend([device_sensor_id, self.__encode(timestamp, value)])
+                if args:
+                    script(keys=[cache_key], args=args, client=pipeline)
+                pipeline.hset(cache_key, LOADED_FIELD, 1)
+            pipeline.execute()
+            readings.update(loaded_readings)
+        return readings
+
+    def get_latest_sensor_data_by_name(self, iot_device_list) -> dict:
+        """
+        Returns the latest reading of the iot devices keyed by the sensor name
+        as {iot_device_id: {"timestamp": timestamp, sensor_name: value}}
+        ordered by the field number of the device sensor.
+        """
+        sensors_data = {}
+        for iot_device_id, readings in self.get_latest_sensor_data(
+            iot_device_list
+        ).items():
+            data = {}
+            for device_sensor in IotDeviceCache.get_all_device_sensors(iot_device_id):
+                reading = readings.get(device_sensor.id)
+                if reading is None:
+                    continue
+                timestamp, value = reading
+                data["timestamp"] = max(data.get("timestamp", timestamp), timestamp)
+                data[device_sensor.sensor.name] = value
+            if data:
+                sensors_data[iot_device_id] = data
+        return sensors_data
+
+    def delete_latest_sensor_data(self, iot_device_id: int) -> None:
+        get_redis_client().delete(self.__get_cache_key(iot_device_id))
+
+
+LatestSensorDataCache = LatestSensorDataCaching()
@@ -0,0 +1,138 @@
+"""
+Coalescing of the live data send to the websocket groups.
+Readings of all the devices of a group received within LIVE_DATA_COALESCE_WINDOW
+are merged in a redis hash with the last value winning per sensor, and send to the
+group as a single delta frame when the window closes.
+Channels of the device groups are tracked in a redis set, so the live data is only
+send to the group of the device when someone is subscribed to it.
+"""
+
+import json
+from collections import defaultdict
+
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from caching.cache import get_async_redis_client, get_redis_client
+
+LIVE_DATA_EVENT_TYPE = "send_live_data"
+PENDING_TTL = 60  # value in seconds
+
+
+def get_live_data_frame(live_data: dict) -> str:
+    """
+    Returns the encoded live data frame.
+    live_data: {iot_device_id: {sensor_name: value, "timestamp": timestamp}}
+    """
+    return json.dumps([{"message_type": "live_data"}, live_data])
+
+
+def get_device_group_name(iot_device_id) -> str:
+    """Websocket group of the connections subscribed to the device"""
+    return f"live_data_device_{iot_device_id}"
+
+
+def get_live_data_event(frame: str) -> dict:
+    return {"type": LIVE_DATA_EVENT_TYPE, "frame": frame}
+
+
+class LiveDataCoalescing:
+    pending_key_prefix = "live_data_pending"
+    window_key_prefix = "live_data_window"
+
+    def is_enabled(self) -> bool:
+        return settings.LIVE_DATA_COALESCE_WINDOW > 0
+
+    def __get_pending_key(self, group_name: str) -> str:
+        return f"{self.pending_key_prefix}_{group_name}"
+
+    def __get_window_key(self, group_name: str) -> str:
+        return f"{self.window_key_prefix}_{group_name}"
+
+    async def add(self, group_name: str, iot_device_id: int, sensor_data: dict) -> None:
+        """
+        Merges the sensor data of the device into the pending frame of the group.
+        First reading of the window schedules the flush at the end of the window.
+        """
+        window = settings.LIVE_DATA_COALESCE_WINDOW
+        pending_key = self.__get_pending_key(group_name)
+        pipeline = get_async_redis_client().pipeline(transaction=False)
+        pipeline.hset(
+            pending_key,
+            mapping={
+                f"{iot_device_id}:{name}": json.dumps(value)
+                for name, value in sensor_data.items()
+            },
+        )
+        pipeline.expire(pending_key, PENDING_TTL)
+        pipeline.set(self.__get_window_key(group_name), 1, nx=True, px=window)
+        *_, is_window_opened = await pipeline.execute()
+
+        if is_window_opened:
+            # importing here to avoid the circular import
+            from sensor_data.tasks import flush_live_data
+
+            # broker publish is blocking, only done once per window
+            await sync_to_async(flush_live_data.apply_async, thread_sensitive=False)(
+                args=[group_name], countdown=window / 1000
+            )
+
+    def pop_frame(self, group_name: str) -> str | None:
+        """
+        Returns the merged frame of the group and closes the window,
+        readings received after this open a new window.
+        """
+        pipeline = get_redis_client().pipeline(transaction=True)
+        pipeline.hgetall(self.__get_pending_key(group_name))
+        pipeline.delete(self.__get_pending_key(group_name))
+        pipeline.delete(self.__get_window_key(group_name))
+        fields, *_ = pipeline.execute()
+        if not fields:
+            return None
+
+        live_data = defaultdict(dict)
+        for field, value in fields.items():
+            iot_device_id, name = field.decode().split(":", 1)
+            live_data[iot_device_id][name] = json.loads(value)
+        return get_live_data_frame(live_data)
+
+    def flush(self, group_name: str) -> None:
+        """Sends the merged frame of the group to the websocket"""
+        frame = self.pop_frame(group_name)
+        if frame is not None:
+            async_to_sync(get_channel_layer().group_send)(
+                group_name, get_live_data_event(frame)
+            )
+
+
+LiveDataCoalescer = LiveDataCoalescing()
+
+
+class LiveDataSubscriptions:
+    key_prefix = "live_data_device_subscribers"
+
+    def __get_key(self, iot_device_id) -> str:
+        return f"{self.key_prefix}_{iot_device_id}"
+
+    @staticmethod
+    def get_ttl() -> int:
+        # channels leave the group after the group expiry, so does the set
+        return settings.CHANNEL_LAYERS["default"]["CONFIG"].get("group_expiry", 86400)
+
+    async def has_subscribers(self, iot_device_id) -> bool:
+        key = self.__get_key(iot_device_id)
+        return bool(await get_async_redis_client().exists(key))
+
+    async def add(self, iot_device_id, channel_name: str) -> None:
+        key = self.__get_key(iot_device_id)
+        pipeline = get_async_redis_client().pipeline(transaction=False)
+        pipeline.sadd(key, channel_name)
+        pipeline.expire(key, self.get_ttl())
+        await pipeline.execute()
+
+    async def remove(self, iot_device_id, channel_name: str) -> None:
+        await get_async_redis_client().srem(self.__get_key(iot_device_id), channel_name)
+
+
+LiveDataSubscribers = LiveDataSubscriptions()
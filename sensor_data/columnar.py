@@ -0,0 +1,124 @@
+"""
+Parquet and Arrow IPC export of the sensor data for the bulk data consumers.
+Sensor data is written straight from the queryset in columnar record batches,
+timestamp and value are typed columns and sensor and device names are
+dictionary encoded.
+"""
+
+import tempfile
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from django.core.exceptions import ObjectDoesNotExist
+
+from iot_devices.cache import IotDeviceCache
+from sensor_data.streaming import get_file_streaming_response, iterate_sensor_data
+
+PARQUET = "parquet"
+ARROW = "arrow"
+COLUMNAR_FILE_TYPES = (PARQUET, ARROW)
+COLUMNAR_CHUNK_SIZE = 50000
+COLUMNAR_FIELDS = ("device_sensor__sensor__name", "iot_device_id", "timestamp", "value")
+
+
+def get_device_names() -> dict:
+    """Returns dict of iot device id and the device name from the cache"""
+    device_names = {}
+    for iot_device in IotDeviceCache.get_all_iot_devices():
+        try:
+            device_names[iot_device.id] = iot_device.iot_device_details.name
+        except ObjectDoesNotExist:
+            device_names[iot_device.id] = None
+    return device_names
+
+
+class SensorDataBatchEncoder:
+    """
+    Encodes the sensor data rows into record batches.
+    Dictionaries of the sensor and device names are fixed for every batch,
+    which the Arrow IPC file format requires.
+    """
+
+    def __init__(self, sensor_names: list):
+        device_names = get_device_names()
+        self.sensor_dictionary = pa.array(sensor_names, type=pa.string())
+        self.sensor_index = {name: index for index, name in enumerate(sensor_names)}
+        unique_device_names = sorted(
+            {name for name in device_names.values() if name is not None}
+        )
+        self.device_dictionary = pa.array(unique_device_names, type=pa.string())
+        device_name_index = {
+            name: index for index, name in enumerate(unique_device_names)
+        }
+        self.device_index = {
+            iot_device_id: device_name_index.get(name)
+            for iot_device_id, name in device_names.items()
+        }
+        self.schema = pa.schema(
+            [
+                ("sensor_name", pa.dictionary(pa.int32(), pa.string())),
+                ("iot_device_id", pa.int64()),
+                ("device_name", pa.dictionary(pa.int32(), pa.string())),
+                ("timestamp", pa.timestamp("us", tz="UTC")),
+                ("value", pa.float64()),
+            ]
+        )
+
+    def encode(self, rows: list) -> pa.RecordBatch:
+        sensor_names, iot_device_ids, timestamps, values = zip(*rows)
+        sensor_indices = pa.array(
+            [self.sensor_index[name] for name in sensor_names], type=pa.int32()
+        )
+        device_indices = pa.array(
+            [self.device_index.get(iot_device_id) for iot_device_id in iot_device_ids],
+            type=pa.int32(),
+        )
+        return pa.RecordBatch.from_arrays(
+            [
+                pa.DictionaryArray.from_arrays(sensor_indices, self.sensor_dictionary),
+                pa.array(np.fromiter(iot_device_ids, np.int64, len(iot_device_ids))),
+                pa.DictionaryArray.from_arrays(device_indices, self.device_dictionary),
+                pa.array(timestamps, type=pa.timestamp("us", tz="UTC")),
+                pa.array(values, type=pa.float64()),
+            ],
+            schema=self.schema,
+        )
+
+
+def write_columnar(sink, queryset, sensor_names: list, file_type: str) -> int:
+    """Writes the sensor data to the sink, returns the number of rows written"""
+    encoder = SensorDataBatchEncoder(sensor_names)
+    writer = (
+        pq.ParquetWriter(sink, encoder.schema, compression="zstd")
+        if file_type == PARQUET
+        else pa.ipc.new_file(sink, encoder.schema)
+    )
+    total = 0
+    with writer:
+        for rows in iterate_sensor_data(
+            queryset, fields=COLUMNAR_FIELDS, chunk_size=COLUMNAR_CHUNK_SIZE
+        ):
+            writer.write_batch(encoder.encode(rows))
+            total += len(rows)
+    return total
+
+
+def get_columnar_response(queryset, sensor_names: list, file_type: str):
+    """
+    Returns the file response of the sensor data in parquet or arrow file,
+    None if there is no sensor data. File is spooled to the disk, not memory.
+    """
+    queryset = queryset.filter(device_sensor__sensor__name__in=sensor_names)
+    file = tempfile.TemporaryFile()
+    if not write_columnar(file, queryset, sensor_names, file_type):
+        file.close()
+        return None
+    file_size = file.tell()
+    if file_type == PARQUET:
+        file_name = "sensor_data.parquet"
+        content_type = "application/vnd.apache.parquet"
+    else:
+        file_name = "sensor_data.arrow"
+        content_type = "application/vnd.apache.arrow.file"
+    return get_file_streaming_response(file, file_name, content_type, file_size)
@@ -0,0 +1,77 @@
+"""
+Shape preserving downsampling of the chart series.
+Both methods return the indices of the points to keep, first and last point
+are always kept.
+"""
+
+import numpy as np
+
+LTTB = "lttb"
+MIN_MAX = "minmax"
+DOWNSAMPLING_METHODS = (LTTB, MIN_MAX)
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Largest Triangle Three Buckets, keeps the point of each bucket forming the largest triangle"""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # points other than the first and last are split into threshold - 2 buckets
+    every = (n - 2) / (threshold - 2)
+    edges = np.minimum((np.arange(threshold) * every).astype(int) + 1, n)
+    edges[-1] = n
+
+    indices = np.empty(threshold, dtype=int)
+    indices[0] = 0
+    indices[-1] = n - 1
+    selected = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = edges[i + 1], edges[i + 2]
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        area = np.abs(
+            (x[selected] - avg_x) * (y[start:end] - y[selected])
+            - (x[selected] - x[start:end]) * (avg_y - y[selected])
+        )
+        selected = start + int(area.argmax())
+        indices[i + 1] = selected
+    return indices
+
+
+def min_max(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Keeps the minimum and maximum point of each bucket"""
+    n = len(x)
+    if threshold >= n:
+        return np.arange(n)
+    if threshold < 4:
+        # no room for a min and max pair besides the first and last point
+        return lttb(x, y, threshold)
+
+    buckets = np.array_split(np.arange(1, n - 1), (threshold - 2) // 2)
+    indices = [0, n - 1]
+    for bucket in buckets:
+        if len(bucket):
+            values = y[bucket]
+            indices.append(bucket[values.argmin()])
+            indices.append(bucket[values.argmax()])
+    return np.unique(indices)
+
+
+def downsample(rows: list, max_points: int, method: str = LTTB) -> list:
+    """
+    Downsamples the rows of sensor data having "value" and "timestamp" to
+    at most max_points rows. Rows without value are dropped when downsampling,
+    rows are returned as is when there are no more than max_points.
+    """
+    if len(rows) <= max_points:
+        return rows
+    rows = [row for row in rows if row["value"] is not None]
+    if len(rows) <= max_points:
+        return rows
+
+    x = np.fromiter((row["timestamp"].timestamp() for row in rows), float, len(rows))
+    y = np.fromiter((row["value"] for row in rows), float, len(rows))
+    downsampler = min_max if method == MIN_MAX else lttb
+    return [rows[index] for index in downsampler(x, y, max_points)]
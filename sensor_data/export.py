@@ -0,0 +1,410 @@
+"""
+Background excel export of the sensor data.
+Export jobs are kept in redis, identical requests of a user share the same job.
+Celery worker writes the workbook to the disk with xlsxwriter in constant memory
+mode and reports the progress to the websocket of the user.
+"""
+
+import hashlib
+import json
+import os
+import time
+import uuid
+from itertools import chain, zip_longest
+
+import xlsxwriter
+from asgiref.sync import async_to_sync
+from celery.exceptions import SoftTimeLimitExceeded
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from caching.cache import get_redis_client
+from company.cache import CompanyCache
+from sensor_data.streaming import (
+    MAINS_NUMBER_FORMAT,
+    get_download_queryset,
+    get_owner_name,
+    get_worksheet_name,
+    iterate_sensor_data,
+)
+from sensors.cache import SensorCache
+from users.cache import UserCache
+from utils.error_message import ERROR_EXPORT_TIME_LIMIT
+
+EXPORT_PENDING = "pending"
+EXPORT_RUNNING = "running"
+EXPORT_COMPLETED = "completed"
+EXPORT_EMPTY = "empty"
+EXPORT_FAILED = "failed"
+
+EXCEL_DATETIME_FORMAT = "mmm d yyyy hh:mm:ss"
+PROGRESS_EVERY_ROWS = 10000
+# export worker is killed this long after the soft time limit, value in seconds
+EXPORT_KILL_DELAY = 60
+
+
+def get_export_hard_time_limit() -> int:
+    return settings.SENSOR_DATA_EXPORT_TIME_LIMIT + EXPORT_KILL_DELAY
+
+
+def get_user_group_name(user_id: int) -> str:
+    """Websocket group of all the connections of the user"""
+    return f"user_{user_id}"
+
+
+def get_export_params(params: dict) -> dict:
+    """Returns the json serializable export params from the validated download params"""
+    iot_device = params["iot_device"]
+    return {
+        "start_date": params["start_date"].isoformat(),
+        "end_date": params["end_date"].isoformat(),
+        "sensor_dict": params["sensor_dict"],
+        "iot_device": sorted(iot_device) if isinstance(iot_device, set) else iot_device,
+        "device_list": (
+            sorted(params["device_list"]) if params["device_list"] is not None else None
+        ),
+        "users": sorted(params["users"]) if params["users"] else None,
+        "companies": sorted(params["companies"]) if params["companies"] else None,
+        "device_dict": {
+            owner: list(iot_device_list)
+            for owner, iot_device_list in params["device_dict"].items()
+        },
+    }
+
+
+class SensorDataExporting:
+    job_key_prefix = "sensor_data_export_job"
+    dedup_key_prefix = "sensor_data_export"
+
+    def __get_job_key(self, job_id: str) -> str:
+        return f"{self.job_key_prefix}_{job_id}"
+
+    def __get_dedup_key(self, user_id: int, export_params: dict) -> str:
+        digest = hashlib.sha256(
+            json.dumps([user_id, export_params], sort_keys=True).encode()
+        ).hexdigest()
+        return f"{self.dedup_key_prefix}_{digest}"
+
+    def get_file_path(self, job_id: str) -> str:
+        return os.path.join(settings.SENSOR_DATA_EXPORT_ROOT, f"{job_id}.xlsx")
+
+    def get_job(self, job_id: str) -> dict | None:
+        job = get_redis_client().hgetall(self.__get_job_key(job_id))
+        if not job:
+            return None
+        job = {key.decode(): value.decode() for key, value in job.items()}
+        for field in ("user_id", "progress", "rows", "total_rows"):
+            job[field] = int(job[field])
+        job["params"] = json.loads(job["params"])
+        return job
+
+    def update_job(self, job_id: str, **fields) -> None:
+        get_redis_client().hset(self.__get_job_key(job_id), mapping=fields)
+
+    @staticmethod
+    def get_dedup_ttl(export_params: dict) -> int:
+        """
+        Export of the range ending today is missing the sensor data received after it,
+        so it is only reused for SENSOR_DATA_EXPORT_FRESH_TTL.
+        """
+        today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        if parse_datetime(export_params["end_date"]) >= today:
+            return min(
+                settings.SENSOR_DATA_EXPORT_FRESH_TTL, settings.SENSOR_DATA_EXPORT_TTL
+            )
+        return settings.SENSOR_DATA_EXPORT_TTL
+
+    def create_job(self, user_id: int, export_params: dict) -> tuple:
+        """
+        Returns tuple(job, created).
+        Running or finished job of the identical export request is returned instead
+        of creating a new one, failed job is replaced.
+        """
+        client = get_redis_client()
+        ttl = settings.SENSOR_DATA_EXPORT_TTL
+        dedup_ttl = self.get_dedup_ttl(export_params)
+        dedup_key = self.__get_dedup_key(user_id, export_params)
+        job_id = uuid.uuid4().hex
+        if not client.set(dedup_key, job_id, nx=True, ex=dedup_ttl):
+            existing_job_id = client.get(dedup_key)
+            job = self.get_job(existing_job_id.decode()) if existing_job_id else None
+            if job and self.is_job_dead(job):
+                # worker running the job was killed before it could mark it failed
+                self.update_job(
+                    job["id"], status=EXPORT_FAILED, error=ERROR_EXPORT_TIME_LIMIT
+                )
+                job["status"] = EXPORT_FAILED
+            if job and job["status"] != EXPORT_FAILED:
+                return job, False
+            client.set(dedup_key, job_id, ex=dedup_ttl)
+
+        job_key = self.__get_job_key(job_id)
+        pipeline = client.pipeline(transaction=False)
+        pipeline.hset(
+            job_key,
+            mapping={
+                "id": job_id,
+                "user_id": user_id,
+                "status": EXPORT_PENDING,
+                "progress": 0,
+                "rows": 0,
+                "total_rows": 0,
+                "created_at": timezone.now().isoformat(),
+                "error": "",
+                "params": json.dumps(export_params),
+            },
+        )
+        pipeline.expire(job_key, ttl)
+        pipeline.execute()
+
+        # importing here to avoid the circular import
+        from sensor_data.tasks import export_sensor_data
+
+        export_sensor_data.delay(job_id)
+        return self.get_job(job_id), True
+
+    @staticmethod
+    def is_job_dead(job: dict) -> bool:
+        """Running job started before the hard time limit of the export task is dead"""
+        started_at = job.get("started_at")
+        return (
+            job["status"] == EXPORT_RUNNING
+            and bool(started_at)
+            and time.time() - float(started_at) > get_export_hard_time_limit()
+        )
+
+    def send_progress(self, job: dict) -> None:
+        """Sends the status of the job to the websocket of the user"""
+        data = {
+            key: job[key] for key in ("id", "status", "progress", "rows", "total_rows")
+        }
+        async_to_sync(get_channel_layer().group_send)(
+            get_user_group_name(job["user_id"]),
+            {
+                "type": "send_data",
+                "data": json.dumps([{"message_type": "export_progress"}, data]),
+            },
+        )
+
+    def __set_status(self, job: dict, **fields) -> None:
+        job.update(fields)
+        self.update_job(job["id"], **fields)
+        self.send_progress(job)
+
+    def run(self, job_id: str) -> None:
+        """Writes the workbook of the export job"""
+        job = self.get_job(job_id)
+        if job is None or job["status"] != EXPORT_PENDING:
+            return
+
+        self.__set_status(job, status=EXPORT_RUNNING, started_at=time.time())
+        file_path = self.get_file_path(job_id)
+        os.makedirs(settings.SENSOR_DATA_EXPORT_ROOT, exist_ok=True)
+        try:
+            sheets = self.__get_sheets(job["params"])
+            total_rows = sum(block["count"] for _, blocks in sheets for block in blocks)
+            if not total_rows:
+                self.__set_status(job, status=EXPORT_EMPTY, progress=100)
+                return
+
+            self.__set_status(job, total_rows=total_rows)
+            temp_file_path = f"{file_path}.part"
+            self.__write_workbook(temp_file_path, sheets, job)
+            os.replace(temp_file_path, file_path)
+            self.__set_status(
+                job, status=EXPORT_COMPLETED, progress=100, rows=total_rows
+            )
+        except SoftTimeLimitExceeded:
+            self.__set_status(
+                job, status=EXPORT_FAILED, error=ERROR_EXPORT_TIME_LIMIT
+            )
+            raise
+        except Exception as error:
+            self.__set_status(job, status=EXPORT_FAILED, error=str(error))
+            raise
+
+    def __get_sensor_blocks(self, params, sensor_list, iot_device_list=None) -> list:
+        """Returns the sensor data of each sensor in the list having data"""
+        sensor_data = get_download_queryset(
+            parse_datetime(params["start_date"]),
+            parse_datetime(params["end_date"]),
+            params["iot_device"],
+            params["device_list"],
+        )
+        if iot_device_list is not None:
+            sensor_data = sensor_data.filter(iot_device__in=iot_device_list)
+
+        blocks = []
+        for sensor in sensor_list:
+            if sensor not in params["sensor_dict"]:
+                continue
+            queryset = sensor_data.filter(device_sensor__sensor__name=sensor)
+            count = queryset.count()
+            if count:
+                blocks.append(
+                    {
+                        "sensor": sensor,
+                        "unit": params["sensor_dict"][sensor],
+                        "queryset": queryset,
+                        "count": count,
+                    }
+                )
+        return blocks
+
+    def __get_sheets(self, params: dict) -> list:
+        """Returns list of (worksheet name, sensor blocks) of the workbook"""
+        users = params["users"]
+        companies = params["companies"]
+        if not users and not companies:
+            # one worksheet per sensor
+            return [
+                (sensor.capitalize(), blocks)
+                for sensor in params["sensor_dict"]
+                if (blocks := self.__get_sensor_blocks(params, [sensor]))
+            ]
+
+        sheets = []
+        for username in users or []:
+            user = UserCache.get_user(username)
+            blocks = self.__get_sensor_blocks(
+                params,
+                SensorCache.get_all_user_sensor(user=user),
+                params["device_dict"][username],
+            )
+            if blocks:
+                name = get_owner_name(username=username)
+                sheets.append((get_worksheet_name(name, is_user=True), blocks))
+
+        for slug in companies or []:
+            company = CompanyCache.get_company(slug)
+            blocks = self.__get_sensor_blocks(
+                params,
+                SensorCache.get_all_company_sensor(company=company),
+                params["device_dict"][slug],
+            )
+            if blocks:
+                sheets.append(
+                    (get_worksheet_name(company.name, is_company=True), blocks)
+                )
+        return sheets
+
+    def __write_workbook(self, file_path: str, sheets: list, job: dict) -> None:
+        workbook = xlsxwriter.Workbook(file_path, {"constant_memory": True})
+        value_column_format = workbook.add_format({"num_format": "0.00"})
+        mains_value_format = workbook.add_format({"num_format": MAINS_NUMBER_FORMAT})
+        mains_format = workbook.add_format({"bg_color": "red"})
+        header_format = workbook.add_format(
+            {"align": "center", "bold": True, "font_size": 12}
+        )
+        column_header_format = workbook.add_format({"bold": True, "border": 1})
+        datetime_format = workbook.add_format({"num_format": EXCEL_DATETIME_FORMAT})
+
+        rows_written = 0
+        next_progress_rows = PROGRESS_EVERY_ROWS
+        for worksheet_name, blocks in sheets:
+            worksheet = workbook.add_worksheet(worksheet_name)
+            # sensors are placed side by side, three columns each with a blank column in between
+            for index, block in enumerate(blocks):
+                column = index * 4
+                sensor_name = block["sensor"].capitalize()
+                header_text = (
+                    f"{sensor_name} Sensor Data in {block['unit']}"
+                    if block["unit"]
+                    else f"{sensor_name} Sensor Data"
+                )
+                worksheet.set_column(
+                    column,
+                    column,
+                    15,
+                    (
+                        mains_value_format
+                        if block["sensor"] == "mains"
+                        else value_column_format
+                    ),
+                )
+                worksheet.set_column(column + 1, column + 2, 30)
+                worksheet.merge_range(
+                    0, column, 0, column + 2, header_text, header_format
+                )
+                if block["sensor"] == "mains":
+                    worksheet.conditional_format(
+                        2,
+                        column,
+                        block["count"] + 2,
+                        column,
+                        {
+                            "type": "cell",
+                            "criteria": "==",
+                            "value": 0,
+                            "format": mains_format,
+                        },
+                    )
+            for index, block in enumerate(blocks):
+                for offset, header in enumerate(["value", "Timestamp", "Device Name"]):
+                    worksheet.write_string(
+                        1, index * 4 + offset, header, column_header_format
+                    )
+
+            # constant memory mode needs the rows written in order, so the rows of
+            # all the sensors of the worksheet are written together
+            rows = zip_longest(
+                *(
+                    chain.from_iterable(iterate_sensor_data(block["queryset"]))
+                    for block in blocks
+                )
+            )
+            for row_number, row in enumerate(rows, start=2):
+                for index, (block, sensor_data) in enumerate(zip(blocks, row)):
+                    if sensor_data is None:
+                        continue
+                    column = index * 4
+                    timestamp, value, device_name = sensor_data
+                    if value is None:
+                        worksheet.write_blank(row_number, column, None)
+                    else:
+                        worksheet.write_number(row_number, column, value)
+                    worksheet.write_datetime(
+                        row_number,
+                        column + 1,
+                        timezone.localtime(timestamp).replace(tzinfo=None),
+                        datetime_format,
+                    )
+                    worksheet.write_string(row_number, column + 2, device_name or "")
+                    rows_written += 1
+
+                if rows_written >= next_progress_rows:
+                    next_progress_rows += PROGRESS_EVERY_ROWS
+                    self.__set_status(
+                        job,
+                        rows=rows_written,
+                        progress=rows_written * 99 // job["total_rows"],
+                    )
+        workbook.close()
+
+    def cleanup(self) -> int:
+        """
+        Removes the exported files older than SENSOR_DATA_EXPORT_TTL.
+        Partially written files are removed once older than the time limit of the
+        export task, so the files of the running exports are kept.
+        """
+        removed = 0
+        export_root = settings.SENSOR_DATA_EXPORT_ROOT
+        if not os.path.isdir(export_root):
+            return removed
+        now = time.time()
+        expired_before = now - settings.SENSOR_DATA_EXPORT_TTL
+        abandoned_before = now - get_export_hard_time_limit()
+        for file_name in os.listdir(export_root):
+            file_path = os.path.join(export_root, file_name)
+            is_partial = file_name.endswith(".part")
+            if os.path.getmtime(file_path) < (
+                abandoned_before if is_partial else expired_before
+            ):
+                os.remove(file_path)
+                removed += 1
+        return removed
+
+
+SensorDataExport = SensorDataExporting()
@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from sensor_data.models import SensorData, SensorDataRollup, SensorDataRollupWatermark
+from sensor_data.rollup import ROLLUP_RESOLUTIONS, get_bucket_start, rollup
+
+
+class Command(BaseCommand):
+    help = "Rolls up the existing sensor data into the 1m/1h/1d rollup tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--start", type=str, help="Start date in YYYY-MM-DD, default oldest data"
+        )
+        parser.add_argument(
+            "--end", type=str, help="End date in YYYY-MM-DD, default now"
+        )
+        parser.add_argument(
+            "--resolution",
+            action="append",
+            choices=list(ROLLUP_RESOLUTIONS),
+            help="Resolution to backfill, can be repeated, default all",
+        )
+        parser.add_argument(
+            "--chunk-days",
+            type=int,
+            default=1,
+            help="Number of days rolled up per transaction",
+        )
+
+    def get_date(self, date: str | None):
+        if date is None:
+            return None
+        try:
+            return timezone.make_aware(datetime.strptime(date, "%Y-%m-%d"))
+        except ValueError:
+            raise CommandError(f"Invalid date {date}, expected YYYY-MM-DD")
+
+    def handle(self, *args, **options):
+        start = self.get_date(options["start"])
+        end = self.get_date(options["end"]) or timezone.now()
+        resolutions = options["resolution"] or list(ROLLUP_RESOLUTIONS)
+        if start is None:
+            start = SensorData.objects.aggregate(start=Min("timestamp"))["start"]
+            if start is None:
+                self.stdout.write("No sensor data to roll up")
+                return
+
+        chunk = timedelta(days=options["chunk_days"])
+        chunk_start = get_bucket_start(SensorDataRollup.RESOLUTION_DAY, start)
+        while chunk_start < end:
+            chunk_end = min(chunk_start + chunk, end)
+            saved = rollup(chunk_start, chunk_end, resolutions)
+            self.stdout.write(
+                f"{chunk_start:%Y-%m-%d}: "
+                + ", ".join(f"{name} {count}" for name, count in saved.items())
+            )
+            chunk_start = chunk_end
+
+        for resolution in resolutions:
+            watermark = SensorDataRollupWatermark.objects.filter(
+                resolution=resolution
+            ).aggregate(watermark=Max("watermark"))["watermark"]
+            if watermark is None or watermark < end:
+                SensorDataRollupWatermark.objects.update_or_create(
+                    resolution=resolution, defaults={"watermark": end}
+                )
+        self.stdout.write(self.style.SUCCESS("Sensor data rollups backfilled"))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from sensor_data.buffer import SensorDataBuffer
+
+
+class Command(BaseCommand):
+    help = "Show the metrics of the sensor data write-behind buffer or flush it"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--flush",
+            action="store_true",
+            help="Write all the buffered sensor data to the database",
+        )
+
+    def handle(self, *args, **options):
+        if options["flush"]:
+            total = SensorDataBuffer.flush()
+            self.stdout.write(self.style.SUCCESS(f"Flushed {total} sensor data"))
+
+        for name, value in SensorDataBuffer.get_metrics().items():
+            self.stdout.write(f"{name}: {value}")
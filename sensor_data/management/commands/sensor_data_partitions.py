@@ -0,0 +1,63 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+
+from sensor_data.models import SensorData
+from sensor_data.partition import (
+    execute_statements,
+    get_initial_partition_statements,
+    get_partition_statements,
+)
+
+
+class Command(BaseCommand):
+    help = "Creates the upcoming monthly partitions of the sensor data table and expires the old ones"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Prints the statements without executing them",
+        )
+        parser.add_argument(
+            "--init",
+            action="store_true",
+            help="Converts the table to monthly range partitions, rebuilds the whole table",
+        )
+        parser.add_argument(
+            "--months-ahead", type=int, help="Number of months created ahead"
+        )
+        parser.add_argument(
+            "--retention-months",
+            type=int,
+            help="Partitions older than this many months are expired, 0 keeps all",
+        )
+
+    def handle(self, *args, **options):
+        if options["init"]:
+            first_month = (
+                SensorData.objects.aggregate(start=Min("timestamp"))["start"]
+                or timezone.now()
+            )
+            months_ahead = options["months_ahead"]
+            if months_ahead is None:
+                months_ahead = settings.SENSOR_DATA_PARTITION_MONTHS_AHEAD
+            statements = get_initial_partition_statements(first_month, months_ahead)
+        else:
+            try:
+                statements = get_partition_statements(
+                    options["months_ahead"], options["retention_months"]
+                )
+            except ValueError as error:
+                raise CommandError(str(error))
+
+        if not statements:
+            self.stdout.write("Partitions are up to date")
+            return
+
+        execute_statements(statements, dry_run=options["dry_run"])
+        for statement in statements:
+            self.stdout.write(f"{statement};")
+        if not options["dry_run"]:
+            self.stdout.write(self.style.SUCCESS("Sensor data partitions updated"))
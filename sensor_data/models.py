@@ -6,7 +6,7 @@ from iot_devices.models import IotDevice, IotDeviceSensor
 class SensorData(models.Model):
     """
     Model representing sensor data.
-    later create a partition on the basis on timestamp
+    Table is range partitioned by month on the timestamp, see sensor_data.partition
 
     Fields:
     - device_sensor: The sensor data associated with the device sensor.
@@ -19,12 +19,16 @@ class SensorData(models.Model):
         IotDeviceSensor,
         on_delete=models.PROTECT,
         related_name="device_sensor_data",
+        # partitioned table can't have foreign key constraints
+        db_constraint=False,
     )
 
     iot_device = models.ForeignKey(
         IotDevice,
         on_delete=models.PROTECT,
         related_name="iot_device_data",
+        # partitioned table can't have foreign key constraints
+        db_constraint=False,
     )
 
     timestamp = models.DateTimeField(default=timezone.now)
@@ -33,9 +37,136 @@ class SensorData(models.Model):
     class Meta:
         ordering = ["-timestamp", "iot_device"]
 
+        # single series range scans use the first, device range scans the second
         indexes = [
             models.Index(fields=["timestamp"]),
+            models.Index(fields=["iot_device", "device_sensor", "timestamp"]),
+            models.Index(fields=["iot_device", "timestamp"]),
         ]
 
     def __str__(self):
         return f"sensor data of device_sensor id {self.device_sensor.id}"
+
+
+class SensorDataRollup(models.Model):
+    """
+    Aggregate of the sensor data of a device sensor over a time bucket.
+
+    Fields:
+    - device_sensor: The device sensor whose sensor data is aggregated.
+    - iot_device: The IOT device associated with the device sensor.
+    - resolution: Size of the time bucket.
+    - bucket: Start of the time bucket, buckets are aligned in the local timezone.
+    - min_value, max_value, avg_value: Aggregates of the values in the bucket.
+    - count: Number of values in the bucket.
+    """
+
+    RESOLUTION_MINUTE = "1m"
+    RESOLUTION_HOUR = "1h"
+    RESOLUTION_DAY = "1d"
+    RESOLUTION_CHOICES = [
+        (RESOLUTION_MINUTE, "1 minute"),
+        (RESOLUTION_HOUR, "1 hour"),
+        (RESOLUTION_DAY, "1 day"),
+    ]
+
+    device_sensor = models.ForeignKey(
+        IotDeviceSensor,
+        on_delete=models.PROTECT,
+        related_name="device_sensor_rollups",
+    )
+
+    iot_device = models.ForeignKey(
+        IotDevice,
+        on_delete=models.PROTECT,
+        related_name="iot_device_rollups",
+    )
+
+    resolution = models.CharField(max_length=2, choices=RESOLUTION_CHOICES)
+    bucket = models.DateTimeField()
+    min_value = models.FloatField(blank=True, null=True)
+    max_value = models.FloatField(blank=True, null=True)
+    avg_value = models.FloatField(blank=True, null=True)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ["-bucket", "iot_device"]
+
+        constraints = [
+            models.UniqueConstraint(
+                fields=["device_sensor", "resolution", "bucket"],
+                name="unique_device_sensor_rollup_bucket",
+            )
+        ]
+        indexes = [
+            models.Index(fields=["iot_device", "resolution", "bucket"]),
+        ]
+
+    def __str__(self):
+        return f"{self.resolution} rollup of device_sensor id {self.device_sensor_id}"
+
+
+class SensorDataRollupWatermark(models.Model):
+    """
+    Rollups of the resolution are complete up to the watermark,
+    periodic task continues from here.
+
+    Fields:
+    - last_id, max_id: Sensor data written with id above last_id is checked for the
+      readings older than the watermark, max_id is the newest id seen by the last run.
+    """
+
+    resolution = models.CharField(
+        max_length=2, choices=SensorDataRollup.RESOLUTION_CHOICES, unique=True
+    )
+    watermark = models.DateTimeField()
+    last_id = models.BigIntegerField(blank=True, null=True)
+    max_id = models.BigIntegerField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.resolution} rollup watermark {self.watermark}"
+
+
+class SensorDataRetentionPolicy(models.Model):
+    """
+    Retention of the raw sensor data of the Iot devices of the company or the user.
+    Devices without a policy use SENSOR_DATA_RETENTION_DAYS.
+
+    Fields:
+    - company: Company whose Iot devices the policy applies to.
+    - user: User whose Iot devices the policy applies to, when not owned by company.
+    - hot_days: Raw sensor data is kept in the database for this many days, 0 keeps forever.
+    - archive: Expired sensor data is archived to parquet files before deleting.
+    """
+
+    company = models.OneToOneField(
+        "company.Company",
+        on_delete=models.CASCADE,
+        related_name="sensor_data_retention_policy",
+        blank=True,
+        null=True,
+    )
+    user = models.OneToOneField(
+        "users.User",
+        on_delete=models.CASCADE,
+        related_name="sensor_data_retention_policy",
+        blank=True,
+        null=True,
+    )
+    hot_days = models.PositiveIntegerField(default=0)
+    archive = models.BooleanField(default=True)
+
+    class Meta:
+        verbose_name_plural = "sensor data retention policies"
+        constraints = [
+            models.CheckConstraint(
+                check=(
+                    models.Q(company__isnull=False, user__isnull=True)
+                    | models.Q(company__isnull=True, user__isnull=False)
+                ),
+                name="sensor_data_retention_policy_company_or_user",
+            )
+        ]
+
+    def __str__(self):
+        return f"sensor data retention policy of {self.company or self.user}"
@@ -1,9 +1,31 @@
+import base64
+import json
 from collections import defaultdict
 from math import ceil
-from django.core.paginator import Page, Paginator
+from django.core.paginator import InvalidPage, Page, Paginator
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+from django.utils.dateparse import parse_datetime
 from django.utils.functional import cached_property
 from rest_framework.utils.urls import remove_query_param, replace_query_param
 
+from iot_devices.cache import IotDeviceCache
+
+
+def get_requested_sensors(request, sensor_names, sensor_query_param="sensors"):
+    """Returns the requested sensors owned by the entity, all the owned sensors if not requested"""
+    try:
+        sensors = request.query_params[sensor_query_param].lower().split(",")
+        if sensors:
+            sensors = set(sensors)
+            sensors.intersection_update(sensor_names)
+            return sensors if sensors else sensor_names
+        else:
+            return sensor_names
+
+    except (KeyError, ValueError):
+        return sensor_names
+
 
 class SensorDataPaginator(Paginator):
     page_size_query_param = "page_size"
@@ -29,17 +51,9 @@ class SensorDataPaginator(Paginator):
         self.list_data_by_sensor = list_data_by_sensor
 
     def get_sensors(self, request):
-        try:
-            sensors = request.query_params[self.sensor_query_param].lower().split(",")
-            if sensors:
-                sensors = set(sensors)
-                sensors.intersection_update(self.sensor_names)
-                return sensors if sensors else self.sensor_names
-            else:
-                return self.sensor_names
-
-        except (KeyError, ValueError):
-            return self.sensor_names
+        return get_requested_sensors(
+            request, self.sensor_names, self.sensor_query_param
+        )
 
     def page(self, number, request):
         """Return a Page object for the given 1-based page number."""
@@ -50,12 +64,23 @@ class SensorDataPaginator(Paginator):
             top = self.count
 
         sensors = self.get_sensors(request)
+        # sensor names are resolved to the device sensors so the series are range
+        # scans on the (iot_device, device_sensor, timestamp) index
+        device_sensors = IotDeviceCache.get_device_sensor_ids(
+            self.iot_device_list, sensors
+        )
         if self.list_data_by_sensor:
             sensors_data = defaultdict(list)
 
             for sensor in sensors:
                 sensors_data[sensor].append(
-                    self.object_list.filter(device_sensor__sensor__name=sensor)
+                    self.object_list.filter(
+                        device_sensor_id__in=[
+                            device_sensor_id
+                            for device_sensor_id, (_, sensor_name) in device_sensors.items()
+                            if sensor_name == sensor
+                        ]
+                    )
                 )
 
             sensor_data = {
@@ -71,26 +96,31 @@ class SensorDataPaginator(Paginator):
 
             return Page(sensor_data, number, self)
         else:
-            # sensors_data = defaultdict(lambda: defaultdict(list))
-
-            sensors_data = {
-                iot_device: {
-                    sensor: [
-                        self.object_list.filter(
-                            device_sensor__sensor__name=sensor, iot_device=iot_device
-                        ).values("value", "timestamp")
-                    ]
-                    for sensor in sensors
-                }
-                for iot_device in self.iot_device_list
-            }
+            # single query: rows of the page of every device and sensor series
+            # numbered newest first within the series
+            page_qs = (
+                self.object_list.filter(device_sensor_id__in=list(device_sensors))
+                .annotate(
+                    row_number=Window(
+                        RowNumber(),
+                        partition_by=[F("device_sensor")],
+                        order_by=[F("timestamp").desc(), F("id").desc()],
+                    ),
+                )
+                .filter(row_number__gt=bottom, row_number__lte=top)
+                .values("device_sensor_id", "value", "timestamp")
+                .order_by("-timestamp")
+            )
 
             sensor_data = defaultdict(lambda: defaultdict(list))
-            for iot_device, sensor_dict in sensors_data.items():
-                for sensor, querysets in sensor_dict.items():
-                    # new_querysets = querysets[0][bottom:top]
-                    # if new_querysets:
-                    sensor_data[iot_device][sensor] = querysets[0][bottom:top]
+            for iot_device in self.iot_device_list:
+                for sensor in sensors:
+                    sensor_data[iot_device][sensor] = []
+            for row in page_qs:
+                iot_device, sensor = device_sensors[row["device_sensor_id"]]
+                sensor_data[iot_device][sensor].append(
+                    {"value": row["value"], "timestamp": row["timestamp"]}
+                )
 
             return Page(sensor_data, number, self)
 
@@ -127,3 +157,103 @@ class SensorDataPaginator(Paginator):
         length = len(self.sensor_names) if len(self.sensor_names) != 0 else 1
         hits = max(1, (self.count / length))
         return ceil(hits / self.per_page)
+
+
+class InvalidCursor(InvalidPage):
+    pass
+
+
+class SensorDataCursorPaginator:
+    """
+    Keyset pagination of the sensor data on (timestamp, id) newest first.
+    Every page costs a single query of page size rows on the timestamp index, no
+    matter how deep, and the pages don't drift as new sensor data arrives.
+    """
+
+    cursor_query_param = "cursor"
+    sensor_query_param = "sensors"
+    max_page_size = 500
+
+    def __init__(
+        self,
+        object_list,
+        per_page,
+        sensor_names,
+        iot_device_list,
+        list_data_by_sensor=False,
+    ):
+        self.object_list = object_list
+        self.per_page = max(1, min(per_page, self.max_page_size))
+        self.sensor_names = sensor_names
+        self.iot_device_list = iot_device_list
+        self.list_data_by_sensor = list_data_by_sensor
+
+    @staticmethod
+    def encode_cursor(timestamp, id: int) -> str:
+        data = json.dumps([timestamp.isoformat(), id]).encode()
+        return base64.urlsafe_b64encode(data).decode()
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> tuple:
+        try:
+            timestamp, id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            timestamp = parse_datetime(timestamp)
+            if timestamp is None or not isinstance(id, int):
+                raise ValueError
+            return timestamp, id
+        except (TypeError, ValueError):
+            raise InvalidCursor("Invalid cursor")
+
+    def page(self, request) -> dict:
+        """Returns the sensor data after the cursor and the cursor of the next page"""
+        sensors = get_requested_sensors(
+            request, self.sensor_names, self.sensor_query_param
+        )
+        device_sensors = IotDeviceCache.get_device_sensor_ids(
+            self.iot_device_list, sensors
+        )
+        queryset = self.object_list.filter(
+            device_sensor_id__in=list(device_sensors)
+        ).order_by("-timestamp", "-id")
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            timestamp, id = self.decode_cursor(cursor)
+            queryset = queryset.filter(
+                Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=id)
+            )
+
+        rows = list(
+            queryset.values("id", "device_sensor_id", "value", "timestamp")[
+                : self.per_page + 1
+            ]
+        )
+        has_next = len(rows) > self.per_page
+        rows = rows[: self.per_page]
+
+        sensor_data = (
+            defaultdict(list)
+            if self.list_data_by_sensor
+            else defaultdict(lambda: defaultdict(list))
+        )
+        for row in rows:
+            iot_device_id, sensor_name = device_sensors[row["device_sensor_id"]]
+            data = {"value": row["value"], "timestamp": row["timestamp"]}
+            if self.list_data_by_sensor:
+                data["iot_device_id"] = iot_device_id
+                sensor_data[sensor_name].append(data)
+            else:
+                sensor_data[iot_device_id][sensor_name].append(data)
+
+        next_cursor = (
+            self.encode_cursor(rows[-1]["timestamp"], rows[-1]["id"])
+            if has_next
+            else None
+        )
+        return {"results": sensor_data, "next_cursor": next_cursor}
+
+    def get_next_link(self, next_cursor, request):
+        if next_cursor is None:
+            return None
+        url = request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, next_cursor)
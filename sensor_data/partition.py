@@ -0,0 +1,203 @@
+"""
+Monthly RANGE partitions of the sensor data table on the timestamp.
+Partitions are created ahead of time by splitting the empty p_max partition, so
+time bounded queries are pruned to the months of the range. Partitions older than
+the retention are exchanged into an archive table or dropped, which is a metadata
+operation instead of deleting the rows.
+Timestamps are stored in UTC so the month boundaries are in UTC.
+"""
+
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from sensor_data.models import SensorData
+
+MAX_PARTITION = "p_max"
+PARTITION_NAME_FORMAT = "p%Y%m"
+
+
+def get_table_name() -> str:
+    return SensorData._meta.db_table
+
+
+def get_month_start(date_time, months: int = 0) -> datetime:
+    """Returns the start of the month in UTC, months later if months is given"""
+    date_time = date_time.astimezone(dt_timezone.utc)
+    month = date_time.year * 12 + date_time.month - 1 + months
+    return datetime(month // 12, month % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def get_partition_name(month_start) -> str:
+    return month_start.strftime(PARTITION_NAME_FORMAT)
+
+
+def get_partition_month(partition_name: str) -> datetime | None:
+    """Returns the month of the monthly partition, None for the other partitions"""
+    try:
+        return datetime.strptime(partition_name, PARTITION_NAME_FORMAT).replace(
+            tzinfo=dt_timezone.utc
+        )
+    except ValueError:
+        return None
+
+
+def get_partition_definition(month_start) -> str:
+    upper_bound = get_month_start(month_start, 1).strftime("%Y-%m-%d %H:%M:%S")
+    return (
+        f"PARTITION {get_partition_name(month_start)} "
+        f"VALUES LESS THAN ('{upper_bound}')"
+    )
+
+
+def get_partitions() -> tuple:
+    """Returns tuple(partition method, list of partition names) of the table"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT PARTITION_METHOD, PARTITION_NAME FROM information_schema.PARTITIONS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s "
+            "ORDER BY PARTITION_ORDINAL_POSITION",
+            [get_table_name()],
+        )
+        rows = cursor.fetchall()
+    method = rows[0][0] if rows else None
+    return method, [name for _, name in rows if name]
+
+
+def get_existing_tables(table_names: list) -> set:
+    if not table_names:
+        return set()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT TABLE_NAME FROM information_schema.TABLES "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN "
+            f"({', '.join(['%s'] * len(table_names))})",
+            table_names,
+        )
+        return {name for (name,) in cursor.fetchall()}
+
+
+def is_table_empty(table_name: str) -> bool:
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT 1 FROM {table_name} LIMIT 1")
+        return cursor.fetchone() is None
+
+
+def get_initial_partition_statements(first_month, months_ahead: int) -> list:
+    """
+    Statements converting the table to monthly range partitions from the first month.
+    Partition key must be part of the primary key, the foreign key constraints of the
+    table are not created by django as partitioned tables can't have them.
+    """
+    table = get_table_name()
+    last_month = get_month_start(timezone.now(), months_ahead)
+    month = get_month_start(first_month)
+    definitions = []
+    while month <= last_month:
+        definitions.append(get_partition_definition(month))
+        month = get_month_start(month, 1)
+    definitions.append(f"PARTITION {MAX_PARTITION} VALUES LESS THAN (MAXVALUE)")
+    # single statement so the existing partitioning is replaced along with the primary key
+    return [
+        f"ALTER TABLE {table} DROP PRIMARY KEY, ADD PRIMARY KEY (id, timestamp) "
+        f"PARTITION BY RANGE COLUMNS(timestamp) ({', '.join(definitions)})"
+    ]
+
+
+def get_create_statements(partition_names: list, months_ahead: int) -> list:
+    """Statement splitting p_max into the missing monthly partitions"""
+    months = [
+        month
+        for name in partition_names
+        if (month := get_partition_month(name)) is not None
+    ]
+    current_month = get_month_start(timezone.now())
+    month = get_month_start(max(months), 1) if months else current_month
+    last_month = get_month_start(current_month, months_ahead)
+    definitions = []
+    while month <= last_month:
+        definitions.append(get_partition_definition(month))
+        month = get_month_start(month, 1)
+    if not definitions:
+        return []
+    definitions.append(f"PARTITION {MAX_PARTITION} VALUES LESS THAN (MAXVALUE)")
+    return [
+        f"ALTER TABLE {get_table_name()} REORGANIZE PARTITION {MAX_PARTITION} "
+        f"INTO ({', '.join(definitions)})"
+    ]
+
+
+def get_expire_statements(partition_names: list, retention_months: int) -> list:
+    """Statements archiving or dropping the partitions older than the retention"""
+    if not retention_months:
+        return []
+    table = get_table_name()
+    # partitions entirely before the cutoff are expired
+    cutoff = get_month_start(timezone.now(), -retention_months)
+    expired_names = [
+        name
+        for name in partition_names
+        if (month := get_partition_month(name)) is not None
+        and get_month_start(month, 1) <= cutoff
+    ]
+    archive = settings.SENSOR_DATA_PARTITION_ARCHIVE
+    # archive table is left behind when a previous run failed before the drop
+    existing_tables = (
+        get_existing_tables([f"{table}_archive_{name}" for name in expired_names])
+        if archive
+        else set()
+    )
+    statements = []
+    for name in expired_names:
+        if archive:
+            archive_table = f"{table}_archive_{name}"
+            if archive_table not in existing_tables:
+                statements += [
+                    f"CREATE TABLE IF NOT EXISTS {archive_table} LIKE {table}",
+                    f"ALTER TABLE {archive_table} REMOVE PARTITIONING",
+                ]
+            # archive table with rows is already exchanged, exchanging again
+            # would swap the rows back into the partition being dropped
+            if archive_table not in existing_tables or is_table_empty(archive_table):
+                statements.append(
+                    f"ALTER TABLE {table} EXCHANGE PARTITION {name} "
+                    f"WITH TABLE {archive_table}"
+                )
+        statements.append(f"ALTER TABLE {table} DROP PARTITION {name}")
+    return statements
+
+
+def get_partition_statements(
+    months_ahead: int | None = None, retention_months: int | None = None
+) -> list:
+    """Returns the statements bringing the monthly partitions up to date"""
+    if months_ahead is None:
+        months_ahead = settings.SENSOR_DATA_PARTITION_MONTHS_AHEAD
+    if retention_months is None:
+        retention_months = settings.SENSOR_DATA_PARTITION_RETENTION_MONTHS
+
+    method, partition_names = get_partitions()
+    if method != "RANGE COLUMNS" or MAX_PARTITION not in partition_names:
+        raise ValueError(
+            f"{get_table_name()} is not range partitioned on the timestamp, "
+            "run the sensor_data_partitions command with --init first"
+        )
+    return get_create_statements(
+        partition_names, months_ahead
+    ) + get_expire_statements(partition_names, retention_months)
+
+
+def execute_statements(statements: list, dry_run: bool = False) -> list:
+    """Executes the partition statements, returns them without executing on dry run"""
+    if not dry_run:
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+    return statements
+
+
+def manage_partitions(dry_run: bool = False) -> list:
+    """Creates the upcoming monthly partitions and expires the old ones"""
+    return execute_statements(get_partition_statements(), dry_run)
@@ -0,0 +1,208 @@
+"""
+Retention of the raw sensor data.
+Whole months of sensor data older than the hot window of the device owner are
+archived to a zstd parquet file per device per month and deleted from the database
+in bounded batches. Rollups are kept, so the charts of the old ranges still work.
+Archive files are named {month}-{first id}-{last id}.parquet, ids only grow so a
+re-run after a crash skips the rows already archived and only deletes them.
+"""
+
+import glob
+import os
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+from django.conf import settings
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from iot_devices.cache import IotDeviceCache
+from sensor_data.columnar import PARQUET, write_columnar
+from sensor_data.models import (
+    SensorData,
+    SensorDataRetentionPolicy,
+    SensorDataRollup,
+    SensorDataRollupWatermark,
+)
+from sensor_data.partition import get_month_start
+
+ARCHIVE_MONTH_FORMAT = "%Y-%m"
+
+
+def get_device_policies() -> dict:
+    """Returns dict of iot device id and tuple(hot days, archive) of the device owner"""
+    company_policies = {}
+    user_policies = {}
+    for policy in SensorDataRetentionPolicy.objects.all():
+        if policy.company_id:
+            company_policies[policy.company_id] = (policy.hot_days, policy.archive)
+        else:
+            user_policies[policy.user_id] = (policy.hot_days, policy.archive)
+
+    default_policy = (settings.SENSOR_DATA_RETENTION_DAYS, True)
+    return {
+        iot_device.id: (
+            company_policies.get(iot_device.company_id, default_policy)
+            if iot_device.company_id
+            else user_policies.get(iot_device.user_id, default_policy)
+        )
+        for iot_device in IotDeviceCache.get_all_iot_devices()
+    }
+
+
+def get_cutoff(hot_days: int):
+    """
+    Sensor data before the cutoff is expired, only whole months are expired.
+    Sensor data not rolled up yet is kept.
+    """
+    cutoff = get_month_start(timezone.now() - timedelta(days=hot_days))
+    if settings.SENSOR_DATA_ROLLUP:
+        watermark = SensorDataRollupWatermark.objects.filter(
+            resolution=SensorDataRollup.RESOLUTION_MINUTE
+        ).aggregate(watermark=Max("watermark"))["watermark"]
+        cutoff = min(cutoff, get_month_start(watermark)) if watermark else None
+    return cutoff
+
+
+def get_archive_dir(iot_device_id: int) -> str:
+    return os.path.join(settings.SENSOR_DATA_ARCHIVE_ROOT, str(iot_device_id))
+
+
+def get_archive_files(iot_device_id: int, month_start=None) -> list:
+    """Returns the archive files of the device, of the month if given"""
+    month = month_start.strftime(ARCHIVE_MONTH_FORMAT) if month_start else "*"
+    return sorted(
+        glob.glob(os.path.join(get_archive_dir(iot_device_id), f"{month}-*.parquet"))
+    )
+
+
+def get_archived_last_id(iot_device_id: int, month_start) -> int:
+    """Returns the last sensor data id archived in the month of the device"""
+    return max(
+        (
+            int(os.path.basename(file_path).rsplit(".", 1)[0].rsplit("-", 1)[1])
+            for file_path in get_archive_files(iot_device_id, month_start)
+        ),
+        default=0,
+    )
+
+
+def archive_month(iot_device_id: int, month_start, queryset) -> int:
+    """Writes the sensor data of the month not archived yet, returns the last archived id"""
+    last_id = get_archived_last_id(iot_device_id, month_start)
+    ids = queryset.filter(id__gt=last_id).aggregate(
+        first_id=Min("id"), last_id=Max("id")
+    )
+    if ids["last_id"] is None:
+        return last_id
+
+    sensor_names = sorted(
+        {
+            device_sensor.sensor.name
+            for device_sensor in IotDeviceCache.get_all_device_sensors(iot_device_id)
+        }
+        | set(
+            queryset.values_list("device_sensor__sensor__name", flat=True).distinct()
+        )
+    )
+    archive_dir = get_archive_dir(iot_device_id)
+    os.makedirs(archive_dir, exist_ok=True)
+    file_path = os.path.join(
+        archive_dir,
+        f"{month_start.strftime(ARCHIVE_MONTH_FORMAT)}-{ids['first_id']}-{ids['last_id']}.parquet",
+    )
+    temp_file_path = f"{file_path}.part"
+    with open(temp_file_path, "wb") as file:
+        write_columnar(
+            file,
+            queryset.filter(id__gt=last_id, id__lte=ids["last_id"]),
+            sensor_names,
+            PARQUET,
+        )
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_file_path, file_path)
+    return ids["last_id"]
+
+
+def delete_sensor_data(queryset, batch_size: int) -> int:
+    """Deletes the sensor data in batches, each batch is a short transaction"""
+    deleted = 0
+    while True:
+        ids = list(queryset.order_by("id").values_list("id", flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += SensorData.objects.filter(id__in=ids).delete()[0]
+
+
+def expire_device(iot_device_id: int, hot_days: int, archive: bool) -> int:
+    """Archives and deletes the expired sensor data of the device, returns rows deleted"""
+    cutoff = get_cutoff(hot_days)
+    if cutoff is None:
+        return 0
+    device_qs = SensorData.objects.filter(
+        iot_device_id=iot_device_id, timestamp__lt=cutoff
+    )
+    oldest = device_qs.aggregate(oldest=Min("timestamp"))["oldest"]
+    if oldest is None:
+        return 0
+
+    deleted = 0
+    month_start = get_month_start(oldest)
+    while month_start < cutoff:
+        next_month_start = get_month_start(month_start, 1)
+        month_qs = device_qs.filter(
+            timestamp__gte=month_start, timestamp__lt=next_month_start
+        )
+        if archive:
+            last_id = archive_month(iot_device_id, month_start, month_qs)
+            # rows inserted after archiving are archived on the next run
+            month_qs = month_qs.filter(id__lte=last_id)
+        deleted += delete_sensor_data(
+            month_qs, settings.SENSOR_DATA_RETENTION_BATCH_SIZE
+        )
+        month_start = next_month_start
+    return deleted
+
+
+def apply_retention() -> dict:
+    """Expires the sensor data of every device with a hot window, returns rows deleted per device"""
+    deleted = {}
+    for iot_device_id, (hot_days, archive) in get_device_policies().items():
+        if hot_days:
+            deleted[iot_device_id] = expire_device(iot_device_id, hot_days, archive)
+    return deleted
+
+
+def get_file_month(file_path: str):
+    """Returns the month start of the archive file"""
+    month = os.path.basename(file_path)[: len("YYYY-MM")]
+    return datetime.strptime(month, ARCHIVE_MONTH_FORMAT).replace(
+        tzinfo=dt_timezone.utc
+    )
+
+
+def read_archive(iot_device_id: int, sensor_name: str, start_date, end_date) -> list:
+    """Returns the archived sensor data of the sensor of the device oldest first"""
+    files = [
+        file_path
+        for file_path in get_archive_files(iot_device_id)
+        if get_file_month(file_path) <= end_date
+        and start_date < get_month_start(get_file_month(file_path), 1)
+    ]
+    if not files:
+        return []
+    table = (
+        ds.dataset(files, format="parquet")
+        .to_table(
+            columns=["timestamp", "value"],
+            filter=(
+                (ds.field("sensor_name").cast(pa.string()) == sensor_name)
+                & (ds.field("timestamp") >= start_date)
+                & (ds.field("timestamp") <= end_date)
+            ),
+        )
+        .sort_by("timestamp")
+    )
+    return table.to_pylist()
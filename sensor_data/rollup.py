@@ -0,0 +1,213 @@
+"""
+Rollups of the sensor data into 1 minute, 1 hour and 1 day buckets.
+Minute buckets are aggregated from the raw sensor data, hour buckets from the
+minute buckets and day buckets from the hour buckets. Buckets are recomputed as
+a whole so re-running a range is safe.
+Readings with the timestamp older than the watermark, i.e. uploaded by the batch
+ingest after a gap, are found by the sensor data id written since the last run
+and the hours they fall in are recomputed.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Sum
+from django.db.models.functions import TruncDay, TruncHour, TruncMinute
+from django.utils import timezone
+
+from sensor_data.models import SensorData, SensorDataRollup, SensorDataRollupWatermark
+
+# resolution: (bucket size, trunc function, resolution aggregated from)
+ROLLUP_RESOLUTIONS = {
+    SensorDataRollup.RESOLUTION_MINUTE: (timedelta(minutes=1), TruncMinute, None),
+    SensorDataRollup.RESOLUTION_HOUR: (
+        timedelta(hours=1),
+        TruncHour,
+        SensorDataRollup.RESOLUTION_MINUTE,
+    ),
+    SensorDataRollup.RESOLUTION_DAY: (
+        timedelta(days=1),
+        TruncDay,
+        SensorDataRollup.RESOLUTION_HOUR,
+    ),
+}
+ROLLUP_BATCH_SIZE = 1000
+
+
+def get_bucket_start(resolution: str, date_time):
+    """Returns the start of the bucket containing the date time in the local timezone"""
+    date_time = timezone.localtime(date_time).replace(second=0, microsecond=0)
+    if resolution == SensorDataRollup.RESOLUTION_MINUTE:
+        return date_time
+    date_time = date_time.replace(minute=0)
+    if resolution == SensorDataRollup.RESOLUTION_HOUR:
+        return date_time
+    return date_time.replace(hour=0)
+
+
+def get_bucket_end(resolution: str, date_time):
+    """Returns the end of the bucket containing the date time"""
+    bucket_start = get_bucket_start(resolution, date_time)
+    if bucket_start == date_time:
+        return date_time
+    bucket_size, _, _ = ROLLUP_RESOLUTIONS[resolution]
+    return get_bucket_start(resolution, bucket_start + bucket_size)
+
+
+def get_aggregated_rows(resolution: str, start, end):
+    """Returns the aggregates of the buckets from start to end"""
+    _, trunc, source = ROLLUP_RESOLUTIONS[resolution]
+    tzinfo = timezone.get_default_timezone()
+    if source is None:
+        queryset = SensorData.objects.filter(timestamp__gte=start, timestamp__lt=end)
+        return (
+            queryset.annotate(rollup_bucket=trunc("timestamp", tzinfo=tzinfo))
+            .values("device_sensor_id", "iot_device_id", "rollup_bucket")
+            .annotate(
+                rollup_min=Min("value"),
+                rollup_max=Max("value"),
+                rollup_total=Sum("value"),
+                rollup_count=Count("value"),
+            )
+            .order_by()
+        )
+
+    queryset = SensorDataRollup.objects.filter(
+        resolution=source, bucket__gte=start, bucket__lt=end
+    )
+    return (
+        queryset.annotate(rollup_bucket=trunc("bucket", tzinfo=tzinfo))
+        .values("device_sensor_id", "iot_device_id", "rollup_bucket")
+        .annotate(
+            rollup_min=Min("min_value"),
+            rollup_max=Max("max_value"),
+            rollup_total=Sum(F("avg_value") * F("count")),
+            rollup_count=Sum("count"),
+        )
+        .order_by()
+    )
+
+
+def save_rollups(resolution: str, rows) -> int:
+    """Inserts or replaces the rollups, returns the number of rollups saved"""
+    total = 0
+    rollups = []
+
+    def save():
+        SensorDataRollup.objects.bulk_create(
+            rollups,
+            update_conflicts=True,
+            update_fields=["min_value", "max_value", "avg_value", "count"],
+        )
+
+    for row in rows.iterator(chunk_size=ROLLUP_BATCH_SIZE):
+        count = row["rollup_count"] or 0
+        rollups.append(
+            SensorDataRollup(
+                device_sensor_id=row["device_sensor_id"],
+                iot_device_id=row["iot_device_id"],
+                resolution=resolution,
+                bucket=row["rollup_bucket"],
+                min_value=row["rollup_min"],
+                max_value=row["rollup_max"],
+                avg_value=row["rollup_total"] / count if count else None,
+                count=count,
+            )
+        )
+        if len(rollups) >= ROLLUP_BATCH_SIZE:
+            save()
+            total += len(rollups)
+            rollups = []
+    if rollups:
+        save()
+        total += len(rollups)
+    return total
+
+
+def rollup(start, end, resolutions=None) -> dict:
+    """
+    Recomputes the buckets overlapping start to end of each resolution,
+    finer resolution first as coarser ones are aggregated from it.
+    Returns the number of rollups saved per resolution.
+    """
+    resolutions = resolutions or list(ROLLUP_RESOLUTIONS)
+    saved = {}
+    for resolution in ROLLUP_RESOLUTIONS:
+        if resolution not in resolutions:
+            continue
+        # whole buckets are aggregated, partial bucket would replace the complete one
+        bucket_start = get_bucket_start(resolution, start)
+        bucket_end = get_bucket_end(resolution, end)
+        with transaction.atomic():
+            saved[resolution] = save_rollups(
+                resolution, get_aggregated_rows(resolution, bucket_start, bucket_end)
+            )
+    return saved
+
+
+def get_late_hours(last_id: int, max_id: int, start) -> list:
+    """Returns the hours of the sensor data written after last_id dated before start"""
+    return list(
+        SensorData.objects.filter(id__gt=last_id, id__lte=max_id, timestamp__lt=start)
+        .annotate(
+            hour=TruncHour("timestamp", tzinfo=timezone.get_default_timezone())
+        )
+        .values_list("hour", flat=True)
+        .distinct()
+        .order_by("hour")
+    )
+
+
+def update_rollups() -> dict:
+    """
+    Rolls up the sensor data received since the watermark.
+    Late window is re-processed on every run for the readings delayed by the
+    write-behind buffer. Older readings are found by the id, ids written since the
+    last run are checked on two runs, as transactions can commit out of id order.
+    """
+    now = timezone.now()
+    late_window = timedelta(seconds=settings.SENSOR_DATA_ROLLUP_LATE_WINDOW)
+    watermark = SensorDataRollupWatermark.objects.filter(
+        resolution=SensorDataRollup.RESOLUTION_MINUTE
+    ).first()
+    start = (
+        min(watermark.watermark, now) - late_window
+        if watermark
+        else now - late_window
+    )
+    max_id = SensorData.objects.aggregate(max_id=Max("id"))["max_id"] or 0
+    # ids are tracked from the first run, older sensor data is rolled up by the backfill
+    last_id = watermark.last_id if watermark else None
+
+    saved = rollup(start, now)
+    if last_id is not None:
+        for hour in get_late_hours(last_id, max_id, start):
+            for resolution, count in rollup(hour, hour + timedelta(hours=1)).items():
+                saved[resolution] += count
+
+    next_last_id = (
+        watermark.max_id if watermark and watermark.max_id is not None else max_id
+    )
+    for resolution in ROLLUP_RESOLUTIONS:
+        SensorDataRollupWatermark.objects.update_or_create(
+            resolution=resolution,
+            defaults={"watermark": now, "last_id": next_last_id, "max_id": max_id},
+        )
+    return saved
+
+
+def select_resolution(start, end) -> str | None:
+    """
+    Returns the finest resolution whose number of buckets from start to end is
+    within SENSOR_DATA_ROLLUP_MAX_POINTS, None if the raw sensor data is to be used.
+    """
+    if not settings.SENSOR_DATA_ROLLUP:
+        return None
+    time_range = end - start
+    if time_range <= timedelta(seconds=settings.SENSOR_DATA_ROLLUP_RAW_MAX_RANGE):
+        return None
+    for resolution, (bucket_size, _, _) in ROLLUP_RESOLUTIONS.items():
+        if time_range / bucket_size <= settings.SENSOR_DATA_ROLLUP_MAX_POINTS:
+            return resolution
+    return SensorDataRollup.RESOLUTION_DAY
@@ -1,89 +1,76 @@
-from django.utils import timezone
 from rest_framework import serializers
-from utils.error_message import ERROR_NO_VALUE
+from utils.error_message import (
+    ERROR_INVALID_READING_TIMESTAMP,
+    error_invalid_reading_message,
+)
 from .models import SensorData
+from .utilis import get_sensor_data_list, validate_sensor_values
 
+# maximum number of buffered readings accepted in a single batch request
+MAX_BATCH_SIZE = 1000
 
-class IotDeviceSensorDataSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = SensorData
-        fields = [
-            "device_sensor",
-            "iot_device",
-            "timestamp",
-            "value",
+
+class IotDeviceSensorDataBatchSerializer(serializers.Serializer):
+    """
+    Validates the readings buffered by the iot device during connectivity gaps.
+    readings are received in format
+    {
+        "readings": [
+            {"timestamp": "2024-01-01T10:00:00+05:45", "field1": 20.5, "field2": 1},
+            {"timestamp": "2024-01-01T10:00:05+05:45", "field1": 20.7},
         ]
-        extra_kwargs = {
-            "device_sensor": {"required": False},
-            "iot_device": {"required": False},
-        }
+    }
+    """
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.fields.update(self.get_sensor_fields())
+    readings = serializers.ListField(
+        child=serializers.DictField(), allow_empty=False, max_length=MAX_BATCH_SIZE
+    )
 
-    def get_sensor_fields(self):
-        fields = {}
-        device_sensors = self.context["device_sensors"]
+    def validate_readings(self, readings):
+        """
+        Validates all the readings against the device ingest plan in a single pass.
+        Sensor values beyond the device sensor max and min limit are removed
+        and readings left without any sensor value are dropped.
+        """
+        ingest_plan = self.context["ingest_plan"]
+        timestamp_field = serializers.DateTimeField()
 
-        for device_sensor in device_sensors:
-            field_name = device_sensor.field_name
-            if device_sensor.sensor.is_value_boolean:
-                if field_name in self.initial_data:
-                    # check to see if value is provided in initial data to avoid being field default o false
-                    # default to none because if field is absent in request.data it will default to false which is not the required case
-                    fields[field_name] = serializers.BooleanField(
-                        required=False, default=None, allow_null=True
-                    )
-            else:
-                fields[field_name] = serializers.FloatField(required=False)
-        return fields
+        validated_readings = []
+        for index, reading in enumerate(readings):
+            try:
+                timestamp = timestamp_field.run_validation(reading.get("timestamp"))
+            except serializers.ValidationError:
+                raise serializers.ValidationError(ERROR_INVALID_READING_TIMESTAMP)
 
-    def validate_sensor_data(self, attrs):
-        """Removing the sensor data that beyond device sensor max and min limit"""
-        device_sensors = self.context["device_sensors"]
-        for device_sensor in device_sensors:
-            field_name = device_sensor.field_name
-            if field_name in attrs:
-                value = attrs[field_name]
-                if not device_sensor.sensor.is_value_boolean:
-                    # getting min and max limit
-                    min_limit = device_sensor.min_limit
-                    max_limit = device_sensor.max_limit
+            try:
+                data = validate_sensor_values(ingest_plan, reading)
+            except serializers.ValidationError as error:
+                field_name = next(iter(error.detail))
+                raise serializers.ValidationError(
+                    error_invalid_reading_message(index, field_name)
+                )
 
-                    # checking if values lies in the range or not
-                    # if max_limit and value <= max_limit:
-                    if (max_limit is not None and value > max_limit) or (
-                        min_limit is not None and value < min_limit
-                    ):
-                        attrs.pop(field_name)
-        return attrs
+            if data:
+                data["timestamp"] = timestamp
+                validated_readings.append(data)
 
-    def validate(self, attrs):
-        if not attrs:
-            raise serializers.ValidationError({"error": ERROR_NO_VALUE})
-        attrs = self.validate_sensor_data(attrs)
-        if not attrs:
-            return attrs
-        attrs["timestamp"] = timezone.now()
-        return attrs
+        return validated_readings
 
     def create(self, validated_data):
-        sensor_data = []
-        if not validated_data:
-            return sensor_data
-        device_sensors = self.context["device_sensors"]
-        iot_device = self.context["iot_device"]
-        for device_sensor in device_sensors:
-            field_name = device_sensor.field_name
-            if field_name in validated_data:
-                sensor_data.append(
-                    SensorData(
-                        device_sensor=device_sensor,
-                        iot_device=iot_device,
-                        value=validated_data[field_name],
-                        timestamp=validated_data["timestamp"],
-                    )
-                )
+        return SensorData.objects.bulk_create(self.get_sensor_data(validated_data))
 
-        return SensorData.objects.bulk_create(sensor_data)
+    def get_sensor_data(self, validated_data=None):
+        """Returns the unsaved SensorData instances built from all the readings"""
+        validated_data = (
+            self.validated_data if validated_data is None else validated_data
+        )
+        ingest_plan = self.context["ingest_plan"]
+        iot_device = self.context["iot_device"]
+        sensor_data = []
+        for reading in validated_data["readings"]:
+            reading = dict(reading)
+            timestamp = reading.pop("timestamp")
+            sensor_data.extend(
+                get_sensor_data_list(ingest_plan, reading, iot_device, timestamp)
+            )
+        return sensor_data
@@ -0,0 +1,231 @@
+"""
+Streaming csv export of the sensor data.
+Sensor data is read in keyset paginated chunks, formatted a chunk at a time and
+yielded to the StreamingHttpResponse, so memory stays constant with export size.
+Responses stream async iterators, under ASGI Django consumes a sync iterator into
+the memory before sending the first byte.
+Download helpers shared by the download views and the background export live here.
+"""
+
+import csv
+import io
+import re
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from company.cache import CompanyCache
+from sensor_data.models import SensorData
+from users.cache import UserCache
+
+CSV_CHUNK_SIZE = 5000
+CSV_TIMESTAMP_FORMAT = "%b %d %Y %H:%M:%S"
+SENSOR_DATA_FIELDS = ("timestamp", "value", "iot_device__iot_device_details__name")
+FILE_CHUNK_SIZE = 64 * 1024
+# mains value is kept numeric, 1 is displayed as ON and 0 as OFF
+MAINS_NUMBER_FORMAT = '"ON";"ON";"OFF"'
+
+
+def get_sensor_data_chunk(queryset, fields, last_row, chunk_size) -> list:
+    """
+    Returns the chunk of the fields of the sensor data newest first continuing after
+    the last row, rows are tuple(id, *fields).
+    """
+    queryset = queryset.order_by("-timestamp", "-id").values_list("id", *fields)
+    if last_row is not None:
+        last_id, last_timestamp = last_row
+        queryset = queryset.filter(
+            Q(timestamp__lt=last_timestamp)
+            | Q(timestamp=last_timestamp, id__lt=last_id)
+        )
+    return list(queryset[:chunk_size])
+
+
+def iterate_sensor_data(
+    queryset, fields=SENSOR_DATA_FIELDS, chunk_size=CSV_CHUNK_SIZE
+):
+    """
+    Yields chunks of the fields of the sensor data newest first, fields must contain timestamp.
+    MySQL client loads the whole result set of a query, so each chunk is a separate
+    query continuing after the last row of the previous chunk.
+    """
+    timestamp_index = fields.index("timestamp") + 1
+    last_row = None
+    while True:
+        rows = get_sensor_data_chunk(queryset, fields, last_row, chunk_size)
+        if not rows:
+            return
+        yield [row[1:] for row in rows]
+        if len(rows) < chunk_size:
+            return
+        last_row = (rows[-1][0], rows[-1][timestamp_index])
+
+
+async def aiterate_sensor_data(
+    queryset, fields=SENSOR_DATA_FIELDS, chunk_size=CSV_CHUNK_SIZE
+):
+    """Async version of iterate_sensor_data, each chunk is queried in the sync thread"""
+    timestamp_index = fields.index("timestamp") + 1
+    last_row = None
+    while True:
+        rows = await sync_to_async(get_sensor_data_chunk)(
+            queryset, fields, last_row, chunk_size
+        )
+        if not rows:
+            return
+        yield [row[1:] for row in rows]
+        if len(rows) < chunk_size:
+            return
+        last_row = (rows[-1][0], rows[-1][timestamp_index])
+
+
+def format_value(sensor_name: str, value):
+    if value is None:
+        return ""
+    if sensor_name == "mains" and value in (0, 1):
+        return "ON" if value == 1 else "OFF"
+    return f"{value:.2f}"
+
+
+async def generate_csv(header: list, sections):
+    """
+    Yields the csv text chunk by chunk.
+    sections: iterable of (queryset, sensor name, extra column values)
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for queryset, sensor_name, extra_columns in sections:
+        async for chunk in aiterate_sensor_data(queryset):
+            writer.writerows(
+                [
+                    sensor_name,
+                    timezone.localtime(timestamp).strftime(CSV_TIMESTAMP_FORMAT),
+                    format_value(sensor_name, value),
+                    device_name,
+                    *extra_columns,
+                ]
+                for timestamp, value, device_name in chunk
+            )
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+async def gzip_stream(chunks):
+    compressor = zlib.compressobj(wbits=31)  # 31 writes the gzip header and trailer
+    async for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def get_streaming_csv_response(request, header: list, sections, file_name):
+    """
+    Returns csv streaming response, gzip encoded if client accepts gzip.
+    Content is an async iterator, as under ASGI sync iterator is consumed into
+    the memory before sending.
+    """
+    chunks = generate_csv(header, sections)
+    accepts_gzip = "gzip" in request.META.get("HTTP_ACCEPT_ENCODING", "")
+    response = StreamingHttpResponse(
+        gzip_stream(chunks) if accepts_gzip else chunks, content_type="text/csv"
+    )
+    if accepts_gzip:
+        response["Content-Encoding"] = "gzip"
+    response["Vary"] = "Accept-Encoding"
+    response["Content-Disposition"] = f"attachment; filename={file_name}"
+    return response
+
+
+async def read_file(file, start=0, length=None):
+    """Yields the file from start to length chunk by chunk and closes it"""
+    read = sync_to_async(file.read, thread_sensitive=False)
+    try:
+        await sync_to_async(file.seek, thread_sensitive=False)(start)
+        while length is None or length > 0:
+            data = await read(
+                FILE_CHUNK_SIZE if length is None else min(FILE_CHUNK_SIZE, length)
+            )
+            if not data:
+                break
+            if length is not None:
+                length -= len(data)
+            yield data
+    finally:
+        file.close()
+
+
+def get_file_streaming_response(
+    file, file_name, content_type, file_size, start=0, length=None, status=200
+):
+    """Returns the response streaming the file as an attachment through an async iterator"""
+    response = StreamingHttpResponse(
+        read_file(file, start, length), status=status, content_type=content_type
+    )
+    response["Content-Length"] = str(file_size if length is None else length)
+    response["Content-Disposition"] = f'attachment; filename="{file_name}"'
+    return response
+
+
+def get_download_queryset(start_date, end_date, iot_device, device_list=None):
+    """Returns the sensor data to download of the iot devices and the date range"""
+    sensor_data = (
+        SensorData.objects.select_related("iot_device")
+        .filter(
+            timestamp__range=(start_date, end_date),
+        )
+        .values_list(
+            "device_sensor__sensor__name",
+            "iot_device_id",
+            "value",
+            "timestamp",
+            "iot_device__iot_device_details__name",
+        )
+        .order_by("-timestamp", "iot_device")
+    )
+
+    if isinstance(iot_device, (set, list)):
+        sensor_data = sensor_data.filter(
+            iot_device__in=iot_device,
+        )
+
+    if device_list is not None:
+        sensor_data = sensor_data.filter(iot_device__in=device_list)
+    return sensor_data
+
+
+def get_owner_name(username=None, company_slug=None):
+    if company_slug:
+        return CompanyCache.get_company(company_slug).name
+    user = UserCache.get_user(username)
+    return (
+        f"{user.profile.first_name} {user.profile.last_name}"
+        if user.profile.first_name
+        else username
+    )
+
+
+def get_worksheet_name(name: str, is_user=False, is_company=False):
+    """Excel doesn't support sheet name greater than 31 character"""
+    if is_user:
+        if len(name) > 31:
+            return name[:31].capitalize()
+        else:
+            return name.capitalize()
+    if is_company:
+        remove_strings = ("private limited", "pvt ltd", "pvt. ltd.", "p.v.t l.t.d")
+        # Create a regex pattern to match any of the remove_strings, case-insensitive
+        pattern = re.compile("|".join(map(re.escape, remove_strings)), re.IGNORECASE)
+        # Use regex sub to replace matched patterns with an empty string
+        cleaned_name = pattern.sub("", name)
+        if len(cleaned_name) > 31:
+            return cleaned_name[:31].capitalize()
+        else:
+            return cleaned_name.capitalize()
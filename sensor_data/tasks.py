@@ -1,19 +1,27 @@
 import gzip
 import json
-import sys
 import zoneinfo
 from datetime import datetime, timedelta
 
 import requests
 from asgiref.sync import async_to_sync
 from celery import shared_task
+from celery.signals import worker_shutting_down
 from channels.layers import get_channel_layer
+from django.conf import settings
 from django.db.models import CharField, DateTimeField, F, Func, Value
 from django.utils.timezone import make_aware
 
 from iot_devices.cache import IotDeviceCache
 from send_livedata.cache import SendLiveDataCache
-from sensor_data.models import SensorData
+from sensor_data.buffer import SensorDataBuffer
+from sensor_data.coalescing import LiveDataCoalescer
+from sensor_data.downsampling import LTTB, downsample
+from sensor_data.export import SensorDataExport, get_export_hard_time_limit
+from sensor_data.models import SensorData, SensorDataRollup
+from sensor_data.partition import manage_partitions
+from sensor_data.retention import apply_retention, read_archive
+from sensor_data.rollup import select_resolution, update_rollups
 from sensor_data.utilis import get_mains_interruption_count
 
 
@@ -22,6 +30,25 @@ class ConvertTz(Func):
     output_field = DateTimeField()
 
 
+def get_date_time_annotation(field_name, tz):
+    """Formats the datetime field in the timezone inside the database"""
+    return Func(
+        ConvertTz(F(field_name), Value("UTC"), Value(tz)),
+        Value("%Y/%m/%d %H:%i:%s"),
+        function="DATE_FORMAT",
+        output_field=CharField(),
+    )
+
+
+def get_max_points(max_points) -> int | None:
+    """Returns the max points of the chart within SENSOR_DATA_MAX_POINTS, None if not requested"""
+    try:
+        max_points = int(max_points)
+    except (TypeError, ValueError):
+        return None
+    return min(max(max_points, 3), settings.SENSOR_DATA_MAX_POINTS)
+
+
 @shared_task
 def send_live_data_to(username, company_slug, data, iot_device_id, board_id, timestamp):
     """Sending data to the third party api endpoint"""
@@ -55,45 +82,114 @@ def send_live_data_to(username, company_slug, data, iot_device_id, board_id, tim
                 pass
 
 
-@shared_task
-def get_sensor_data(sensor_name, iot_device_id, channel_name, start_date, end_date):
-    """Used For Fetching data of a specific sensor of a iot device and send data via websocket for graphical representation"""
+def get_date_range(start_date, end_date=None) -> tuple:
+    """
+    Returns the aware start and end date of the YYYY-MM-DD dates in the local timezone,
+    end date defaults to now and the last one day is used if the dates are invalid.
+    """
     kathmandu_tz = zoneinfo.ZoneInfo("Asia/Kathmandu")
-
     try:
         start_date = datetime.strptime(start_date, "%Y-%m-%d")
-        end_date = datetime.strptime(end_date, "%Y-%m-%d").replace(
-            hour=23, minute=59, second=59, microsecond=999999
-        )
-    except ValueError:
-        start_date = (datetime.now() - timedelta(days=1)).date()
+        if end_date:
+            end_date = datetime.strptime(end_date, "%Y-%m-%d").replace(
+                hour=23, minute=59, second=59, microsecond=999999
+            )
+        else:
+            end_date = datetime.now()
+    except (TypeError, ValueError):
         end_date = datetime.now()
+        start_date = end_date - timedelta(days=1)
 
-    start_date = make_aware(start_date, kathmandu_tz)
-    end_date = make_aware(end_date, kathmandu_tz)
+    return make_aware(start_date, kathmandu_tz), make_aware(end_date, kathmandu_tz)
 
-    sensor_data_qs = (
-        SensorData.objects.filter(
-            iot_device__id=iot_device_id,
-            timestamp__range=(start_date, end_date),
-            device_sensor__sensor__name=sensor_name,
+
+def is_inline_query(start_date, end_date, rollup=True) -> bool:
+    """
+    Chart queries of the short ranges, or served from the rollups, are answered
+    by the websocket consumer itself, others are send to the celery worker.
+    """
+    return end_date - start_date <= timedelta(
+        seconds=settings.SENSOR_DATA_INLINE_MAX_RANGE
+    ) or (rollup and bool(select_resolution(start_date, end_date)))
+
+
+def get_channel_event(data: str) -> dict:
+    """Returns the channel layer event sending the data, gzipped if larger than 1MB"""
+    # Convert 1MB to bytes
+    ONE_MB = 1024 * 1024
+    encoded_data = data.encode("utf-8")
+    if len(encoded_data) < ONE_MB:
+        return {"type": "send_data", "data": data}
+    return {"type": "send_binary_data", "data": gzip.compress(encoded_data)}
+
+
+def get_sensor_data_message(
+    sensor_name,
+    iot_device_id,
+    start_date,
+    end_date,
+    max_points=None,
+    downsampling_method=LTTB,
+) -> str:
+    """
+    Returns the sensor data message of a specific sensor of a iot device for graphical representation
+    max_points: downsamples the data to at most max_points, capped by SENSOR_DATA_MAX_POINTS
+    """
+    kathmandu_tz = zoneinfo.ZoneInfo("Asia/Kathmandu")
+    device_sensor_id = IotDeviceCache.get_device_sensor_id(iot_device_id, sensor_name)
+
+    resolution = select_resolution(start_date, end_date)
+    if resolution:
+        # average of the bucket is the value, min and max keeps the peaks visible
+        sensor_data_qs = (
+            SensorDataRollup.objects.filter(
+                iot_device__id=iot_device_id,
+                device_sensor_id=device_sensor_id,
+                resolution=resolution,
+                bucket__range=(start_date, end_date),
+            )
+            .annotate(
+                value=F("avg_value"),
+                timestamp=F("bucket"),
+                date_time=get_date_time_annotation("bucket", kathmandu_tz),
+            )
+            .values("value", "min_value", "max_value", "date_time", "timestamp")
+            .order_by("bucket")
         )
-        .annotate(
-            date_time=Func(
-                ConvertTz(F("timestamp"), Value("UTC"), Value(kathmandu_tz)),
-                Value("%Y/%m/%d %H:%i:%s"),
-                function="DATE_FORMAT",
-                output_field=CharField(),
-            ),
+    else:
+        sensor_data_qs = (
+            SensorData.objects.filter(
+                iot_device__id=iot_device_id,
+                device_sensor_id=device_sensor_id,
+                timestamp__range=(start_date, end_date),
+            )
+            .annotate(
+                date_time=get_date_time_annotation("timestamp", kathmandu_tz),
+            )
+            .values("value", "date_time", "timestamp")
+            .order_by("timestamp")
         )
-        .values("value", "date_time")
-        .order_by("timestamp")
-    )
 
     sensor_data = list(sensor_data_qs)
-    channel_layer = get_channel_layer()
+    if not resolution:
+        # raw sensor data past the retention is read from the archive
+        sensor_data = [
+            {
+                "value": data["value"],
+                "date_time": data["timestamp"]
+                .astimezone(kathmandu_tz)
+                .strftime("%Y/%m/%d %H:%M:%S"),
+                "timestamp": data["timestamp"],
+            }
+            for data in read_archive(iot_device_id, sensor_name, start_date, end_date)
+        ] + sensor_data
+    max_points = get_max_points(max_points)
+    if max_points:
+        sensor_data = downsample(sensor_data, max_points, downsampling_method)
+    for data in sensor_data:
+        del data["timestamp"]
 
-    data = json.dumps(
+    return json.dumps(
         [
             {
                 "message_type": "sensor_data",
@@ -104,63 +200,122 @@ def get_sensor_data(sensor_name, iot_device_id, channel_name, start_date, end_da
         ]
     )
 
-    # Convert 1MB to bytes
-    ONE_MB = 1024 * 1024
-    if sys.getsizeof(data) < ONE_MB:
-        async_to_sync(channel_layer.send)(
-            channel_name, {"type": "send_data", "data": data}
-        )
-    else:
-        compressed_data = gzip.compress(data.encode("utf-8"))
-        async_to_sync(channel_layer.send)(
-            channel_name, {"type": "send_binary_data", "data": compressed_data}
-        )
-
 
 @shared_task
-def get_mains_interruption(channel_name, iot_device_id, start_date, end_date=None):
-    """Counting the Number of times Mains Interputted"""
-    try:
-        start_date = datetime.strptime(start_date, "%Y-%m-%d")
-        if end_date:
-            end_date = datetime.strptime(end_date, "%Y-%m-%d").replace(
-                hour=23, minute=59, second=59, microsecond=999999
-            )
-        else:
-            end_date = datetime.now()
-    except ValueError:
-        start_date = (datetime.now() - timedelta(days=1)).date()
-        end_date = datetime.now()
+def get_sensor_data(
+    sensor_name,
+    iot_device_id,
+    channel_name,
+    start_date,
+    end_date,
+    max_points=None,
+    downsampling_method=LTTB,
+):
+    """
+    Used For Fetching data of a specific sensor of a iot device and send data via websocket for graphical representation
+    Used for the long date ranges, shorter ones are served by the consumer.
+    """
+    start_date, end_date = get_date_range(start_date, end_date)
+    data = get_sensor_data_message(
+        sensor_name,
+        iot_device_id,
+        start_date,
+        end_date,
+        max_points=max_points,
+        downsampling_method=downsampling_method,
+    )
+    channel_layer = get_channel_layer()
+    async_to_sync(channel_layer.send)(channel_name, get_channel_event(data))
 
-    kathmandu_tz = zoneinfo.ZoneInfo("Asia/Kathmandu")
-    start_date = make_aware(start_date, kathmandu_tz)
-    end_date = make_aware(end_date, kathmandu_tz)
 
+def get_mains_interruption_message(iot_device_id, start_date, end_date) -> str:
+    """Returns the message of the number of times mains interrupted"""
     sensor_data_qs = (
         SensorData.objects.filter(
             iot_device__id=iot_device_id,
+            device_sensor_id=IotDeviceCache.get_device_sensor_id(
+                iot_device_id, "mains"
+            ),
             timestamp__range=(start_date, end_date),
-            device_sensor__sensor__name="mains",
         )
         .values("value", "timestamp")
         .order_by("timestamp")
     )
 
     mains_interruption_count = get_mains_interruption_count(list(sensor_data_qs))
+    return json.dumps(
+        [
+            {
+                "message_type": "mains_interruption",
+                "iot_device_id": iot_device_id,
+            },
+            {"count": mains_interruption_count},
+        ]
+    )
 
+
+@shared_task
+def get_mains_interruption(channel_name, iot_device_id, start_date, end_date=None):
+    """Counting the Number of times Mains Interputted"""
+    start_date, end_date = get_date_range(start_date, end_date)
     channel_layer = get_channel_layer()
     async_to_sync(channel_layer.send)(
         channel_name,
         {
             "type": "send_data",
-            "data": json.dumps(
-                [
-                    {
-                        "message_type": "mains_interruption",
-                        "iot_device_id": iot_device_id,
-                    },
-                    {"count": mains_interruption_count},
-                ]
-            ),
+            "data": get_mains_interruption_message(iot_device_id, start_date, end_date),
         },
     )
+
+
+@shared_task(ignore_result=True)
+def flush_sensor_data_buffer():
+    """Flushes the write-behind buffer of the sensor data into the database"""
+    return SensorDataBuffer.flush()
+
+
+@shared_task(ignore_result=True)
+def flush_live_data(group_name):
+    """Sends the live data of the group coalesced over the window to the websocket"""
+    LiveDataCoalescer.flush(group_name)
+
+
+@shared_task(ignore_result=True)
+def update_sensor_data_rollups():
+    """Rolls up the sensor data received since the last run"""
+    return update_rollups()
+
+
+@shared_task(
+    ignore_result=True,
+    soft_time_limit=settings.SENSOR_DATA_EXPORT_TIME_LIMIT,
+    time_limit=get_export_hard_time_limit(),
+)
+def export_sensor_data(job_id):
+    """Writes the excel workbook of the sensor data export job"""
+    SensorDataExport.run(job_id)
+
+
+@shared_task(ignore_result=True)
+def remove_expired_sensor_data_exports():
+    """Removes the exported workbooks which are no longer downloadable"""
+    return SensorDataExport.cleanup()
+
+
+@shared_task(ignore_result=True)
+def manage_sensor_data_partitions(dry_run=False):
+    """Creates the upcoming monthly partitions of the sensor data and expires the old ones"""
+    return manage_partitions(dry_run)
+
+
+@shared_task(ignore_result=True)
+def apply_sensor_data_retention():
+    """Archives and deletes the sensor data past the retention of the device owner"""
+    return apply_retention()
+
+
+@worker_shutting_down.connect
+def flush_sensor_data_buffer_on_shutdown(**kwargs):
+    """Guarantees the buffered sensor data is written before the worker exits"""
+    if SensorDataBuffer.is_enabled():
+        SensorDataBuffer.flush()
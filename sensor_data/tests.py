@@ -1,3 +1,190 @@
-from django.test import TestCase
+import base64
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.db.models import Q
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from caching.local_cache import local_cache
+from iot_devices.cache import IotDeviceCache
+from iot_devices.models import IotDevice, IotDeviceSensor
+from sensor_data.models import SensorData
+from sensor_data.pagination import (
+    InvalidCursor,
+    SensorDataCursorPaginator,
+    SensorDataPaginator,
+)
+from sensor_data.views.get_data_views import encode_since_cursor, get_since_filter
+from sensors.models import Sensor
+from utils.constants import GroupName, UserType
+
+User = get_user_model()
+
+
+class SensorDataTestCase(TestCase):
+    """Admin user owning an iot device with temperature and humidity sensors"""
+
+    @classmethod
+    def setUpTestData(cls):
+        Group.objects.get_or_create(name=GroupName.ADMIN_GROUP)
+        cls.user = User.objects.create_user(
+            email="admin@example.com", type=UserType.ADMIN
+        )
+        cls.iot_device = IotDevice.objects.create(user=cls.user)
+        cls.device_sensors = {
+            name: IotDeviceSensor.objects.create(
+                iot_device=cls.iot_device,
+                sensor=Sensor.objects.create(name=name),
+                field_name=f"field{number}",
+            )
+            for number, name in enumerate(("temperature", "humidity"), start=1)
+        }
+
+    def setUp(self):
+        # ids are reused by the test database, so the cached devices of the earlier runs are removed
+        local_cache.clear()
+        IotDeviceCache.delete_device_sensors(self.iot_device.id)
+        IotDeviceCache.delete_auth_cache_iot_device(self.iot_device)
+
+    def create_sensor_data(self, count):
+        now = timezone.now()
+        SensorData.objects.bulk_create(
+            SensorData(
+                device_sensor=device_sensor,
+                iot_device=self.iot_device,
+                value=index,
+                timestamp=now - timedelta(minutes=index),
+            )
+            for device_sensor in self.device_sensors.values()
+            for index in range(count)
+        )
+
+
+@override_settings(
+    SENSOR_DATA_WRITE_BEHIND=False,
+    LIVE_DATA_COALESCE_WINDOW=0,
+    CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}},
+)
+class SaveSensorDataQueriesTest(SensorDataTestCase):
+    def test_save_sensor_data_with_warm_cache(self):
+        client = APIClient()
+        client.credentials(HTTP_API_KEY=self.iot_device.api_key)
+        url = reverse("save-sensor-data")
+        # first request fills the device and ingest plan cache
+        response = client.post(url, {"field1": 20, "field2": 60})
+        self.assertEqual(response.status_code, 200)
+
+        # savepoint, multi-row insert and savepoint release
+        with self.assertNumQueries(3):
+            response = client.post(url, {"field1": 21, "field2": 61})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(SensorData.objects.count(), 4)
+
+
+class SensorDataPaginatorQueriesTest(SensorDataTestCase):
+    def test_page_is_single_query(self):
+        self.create_sensor_data(30)
+        paginator = SensorDataPaginator(
+            SensorData.objects.all(),
+            10,
+            list(self.device_sensors),
+            [self.iot_device.id],
+        )
+        request = Request(APIRequestFactory().get("/"))
+        # count query and device sensors cache are not part of the page
+        paginator.count
+        IotDeviceCache.get_all_device_sensors(self.iot_device.id)
+
+        with self.assertNumQueries(1):
+            page = paginator.page(2, request)
+        series = page.object_list[self.iot_device.id]
+        for name in self.device_sensors:
+            self.assertEqual(
+                [data["value"] for data in series[name]], list(range(10, 20))
+            )
+
+
+class SensorDataIndexTest(SensorDataTestCase):
+    def setUp(self):
+        super().setUp()
+        # enough rows for a range of the last 10 minutes to be selective, range
+        # estimates come from index dives so no ANALYZE TABLE, which would commit
+        self.create_sensor_data(500)
+
+    def get_index_name(self, fields):
+        for index in SensorData._meta.indexes:
+            if index.fields == fields:
+                return index.name
+
+    def get_used_index(self, queryset):
+        """Returns the index chosen by the planner, not just one of the possible keys"""
+        plan = json.loads(queryset.explain(format="json"))
+        return plan["query_block"]["table"].get("key")
+
+    def test_series_range_uses_device_sensor_index(self):
+        queryset = SensorData.objects.filter(
+            iot_device=self.iot_device,
+            device_sensor=self.device_sensors["temperature"],
+            timestamp__gte=timezone.now() - timedelta(minutes=10),
+        )
+        self.assertEqual(
+            self.get_used_index(queryset),
+            self.get_index_name(["iot_device", "device_sensor", "timestamp"]),
+        )
+
+    def test_device_range_uses_device_index(self):
+        queryset = SensorData.objects.filter(
+            iot_device=self.iot_device,
+            timestamp__gte=timezone.now() - timedelta(minutes=10),
+        )
+        self.assertEqual(
+            self.get_used_index(queryset),
+            self.get_index_name(["iot_device", "timestamp"]),
+        )
+
+
+class SensorDataCursorTest(SimpleTestCase):
+    def test_cursor_round_trip(self):
+        timestamp = datetime(2024, 1, 1, 10, 30, tzinfo=dt_timezone.utc)
+        cursor = SensorDataCursorPaginator.encode_cursor(timestamp, 42)
+        self.assertEqual(
+            SensorDataCursorPaginator.decode_cursor(cursor), (timestamp, 42)
+        )
+
+    def test_invalid_cursor(self):
+        for cursor in (
+            "not a cursor",
+            base64.urlsafe_b64encode(b'{"id": 1}').decode(),
+            base64.urlsafe_b64encode(b'["not a date", 1]').decode(),
+            base64.urlsafe_b64encode(b'["2024-01-01T00:00:00", "1"]').decode(),
+        ):
+            with self.subTest(cursor=cursor), self.assertRaises(InvalidCursor):
+                SensorDataCursorPaginator.decode_cursor(cursor)
+
+
+class SinceFilterTest(SimpleTestCase):
+    def test_since_cursor(self):
+        self.assertEqual(get_since_filter(encode_since_cursor(42)), Q(id__gt=42))
+
+    def test_since_timestamp(self):
+        timestamp = datetime(2024, 1, 1, 10, 30, tzinfo=dt_timezone.utc)
+        self.assertEqual(
+            get_since_filter(timestamp.isoformat()), Q(timestamp__gt=timestamp)
+        )
+
+    def test_naive_since_timestamp_is_made_aware(self):
+        since_filter = get_since_filter("2024-01-01T10:30:00")
+        _, timestamp = since_filter.children[0]
+        self.assertTrue(timezone.is_aware(timestamp))
+
+    def test_invalid_since(self):
+        self.assertIsNone(get_since_filter("not a cursor"))
+        self.assertIsNone(
+            get_since_filter(base64.urlsafe_b64encode(json.dumps({}).encode()).decode())
+        )
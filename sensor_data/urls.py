@@ -1,11 +1,34 @@
 from django.urls import path
-from sensor_data.views import download_views, get_data_views, save_data_views
+from sensor_data.views import (
+    async_save_views,
+    download_views,
+    export_views,
+    get_data_views,
+    save_data_views,
+)
 
 
 # URLConfig
 urlpatterns = [
     # "domain/api/savedata" for saving the data in the devices.
     path("post/", save_data_views.save_sensor_data, name="save-sensor-data"),
+    path(
+        "post/batch/",
+        save_data_views.save_sensor_data_batch,
+        name="save-sensor-data-batch",
+    ),
+    path(
+        "post/async/",
+        async_save_views.save_sensor_data,
+        name="save-sensor-data-async",
+    ),
     path("get/", get_data_views.get_sensor_data, name="get-sensor-data"),
     path("download/", download_views.download_sensor_data, name="download-sensor-data"),
+    path("export/", export_views.create_export_job, name="create-export-job"),
+    path("export/<str:job_id>/", export_views.get_export_job, name="export-job"),
+    path(
+        "export/<str:job_id>/download/",
+        export_views.download_export_job,
+        name="download-export-job",
+    ),
 ]
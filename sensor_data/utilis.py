@@ -1,6 +1,13 @@
+import math
+
 from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.fields import BooleanField
 import pandas as pd
 
+from sensor_data.models import SensorData
+from utils.error_message import ERROR_INVALID_BOOLEAN, ERROR_INVALID_NUMBER
+
 
 def prepare_sensor_data(field_sensor_name_dict, data, iot_device_id, timestamp):
     """
@@ -25,6 +32,69 @@ def prepare_sensor_data(field_sensor_name_dict, data, iot_device_id, timestamp):
     return sensor_data
 
 
+def validate_sensor_values(ingest_plan: dict, data) -> dict:
+    """
+    Parses and range checks the sensor values received from the iot device using the ingest plan.
+    Sensor values beyond the max and min limit of the device sensor are removed.
+    Returns the dictionary of field name and sensor value.
+    """
+    sensor_values = {}
+    for field_name, (
+        _,
+        is_value_boolean,
+        min_limit,
+        max_limit,
+        _,
+    ) in ingest_plan.items():
+        if field_name not in data:
+            continue
+        value = data[field_name]
+        if is_value_boolean:
+            try:
+                if value in BooleanField.TRUE_VALUES:
+                    sensor_values[field_name] = True
+                elif value in BooleanField.FALSE_VALUES:
+                    sensor_values[field_name] = False
+                elif value in BooleanField.NULL_VALUES:
+                    sensor_values[field_name] = None
+                else:
+                    raise ValidationError({field_name: [ERROR_INVALID_BOOLEAN]})
+            except TypeError:
+                # unhashable values such as list or dict
+                raise ValidationError({field_name: [ERROR_INVALID_BOOLEAN]})
+            continue
+
+        if value == "":
+            # empty form value is treated as not provided
+            continue
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            raise ValidationError({field_name: [ERROR_INVALID_NUMBER]})
+        if not math.isfinite(value):
+            raise ValidationError({field_name: [ERROR_INVALID_NUMBER]})
+
+        if (max_limit is not None and value > max_limit) or (
+            min_limit is not None and value < min_limit
+        ):
+            continue
+        sensor_values[field_name] = value
+    return sensor_values
+
+
+def get_sensor_data_list(ingest_plan, sensor_values, iot_device, timestamp) -> list:
+    """Returns the unsaved SensorData instances of the validated sensor values"""
+    return [
+        SensorData(
+            device_sensor_id=ingest_plan[field_name][0],
+            iot_device=iot_device,
+            value=value,
+            timestamp=timestamp,
+        )
+        for field_name, value in sensor_values.items()
+    ]
+
+
 def strtobool(val):
     """Convert a string representation of truth to true (1) or false (0).
     True values are 'true', and '1';
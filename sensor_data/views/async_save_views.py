@@ -0,0 +1,113 @@
+import json
+
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from iot_devices.cache import IotDeviceCache
+from sensor_data.buffer import SensorDataBuffer
+from sensor_data.utilis import (
+    get_sensor_data_list,
+    strtobool,
+    validate_sensor_values,
+)
+from sensor_data.views.save_data_views import asend_sensor_data
+from utils.error_message import (
+    ERROR_DEVICE_INACTIVE,
+    ERROR_INVALID_API_KEY,
+    ERROR_NO_API_KEY_PROVIDED,
+    ERROR_NO_VALUE,
+    ERROR_UNASSOCIATED_DEVICE,
+)
+from utils.executor import run_in_executor
+
+
+def get_request_data(request):
+    """Parses the json or form body of the request"""
+    if request.content_type == "application/json":
+        data = json.loads(request.body or b"{}")
+        if not isinstance(data, dict):
+            raise ValueError("JSON object is expected")
+        return data
+    return request.POST
+
+
+async def authenticate_device(request, data):
+    """
+    Async version of the DeviceAuthentication.
+    Returns tuple(iot_device, error_response)
+    """
+    api_key = request.headers.get("API-KEY")
+    if not api_key:
+        api_key = data.get("API-KEY")
+    if not api_key:
+        return None, JsonResponse({"error": ERROR_NO_API_KEY_PROVIDED}, status=401)
+
+    iot_device = await IotDeviceCache.aget_iot_device_by_api_key(api_key)
+    if iot_device is None:
+        return None, JsonResponse({"error": ERROR_INVALID_API_KEY}, status=401)
+
+    if not iot_device.is_active:
+        return None, JsonResponse({"detail": ERROR_DEVICE_INACTIVE}, status=403)
+
+    if not iot_device.user and not iot_device.company:
+        return None, JsonResponse({"detail": ERROR_UNASSOCIATED_DEVICE}, status=400)
+
+    return iot_device, None
+
+
+async def save_sensor_data(request):
+    """
+    Async version of the save_sensor_data view.
+    Cache lookups and websocket publish are done on the event loop
+    and the database write is handed off to the bounded executor.
+    """
+    if request.method != "POST":
+        return JsonResponse(
+            {"detail": f'Method "{request.method}" not allowed.'}, status=405
+        )
+
+    try:
+        data = get_request_data(request)
+    except ValueError:
+        return JsonResponse({"detail": "JSON parse error"}, status=400)
+
+    iot_device, error_response = await authenticate_device(request, data)
+    if error_response:
+        return error_response
+
+    if strtobool(str(data.get("is_error", ""))):
+        return HttpResponse(status=200)
+
+    ingest_plan = await IotDeviceCache.aget_device_ingest_plan(iot_device.id)
+    if not ingest_plan:
+        return JsonResponse(
+            {"error": "No Sensor is associated with the devices"}, status=400
+        )
+
+    if not any(field_name in data for field_name in ingest_plan):
+        return JsonResponse({"error": ERROR_NO_VALUE}, status=400)
+
+    try:
+        sensor_values = validate_sensor_values(ingest_plan, data)
+    except ValidationError as error:
+        return JsonResponse(error.detail, status=400)
+
+    if not sensor_values:
+        # this means all the sensor values received are beyond the max and min limit of the device sensor
+        return HttpResponse(status=200)
+
+    timestamp = timezone.now()
+    await run_in_executor(
+        SensorDataBuffer.write,
+        get_sensor_data_list(ingest_plan, sensor_values, iot_device, timestamp),
+    )
+
+    sensor_values["timestamp"] = timestamp
+    await asend_sensor_data(iot_device, sensor_values, ingest_plan)
+
+    return HttpResponse(status=200)
+
+
+# device does not send the csrf token, same as the api_view of rest framework
+save_sensor_data.csrf_exempt = True
@@ -1,4 +1,3 @@
-import re
 from datetime import datetime, timedelta
 from io import BytesIO
 
@@ -11,7 +10,15 @@ from rest_framework.response import Response
 
 from company.cache import CompanyCache
 from iot_devices.cache import IotDeviceCache
-from sensor_data.models import SensorData
+from sensor_data.columnar import COLUMNAR_FILE_TYPES, get_columnar_response
+from sensor_data.streaming import (
+    MAINS_NUMBER_FORMAT,
+    get_download_queryset,
+    get_owner_name,
+    get_streaming_csv_response,
+    get_worksheet_name,
+)
+from sensor_data.utilis import strtobool
 from sensors.cache import SensorCache
 from users.cache import UserCache
 from utils.commom_functions import get_groups_tuple
@@ -136,25 +143,6 @@ def get_companies_to_download_data(companies, user, is_user_superadmin=False):
             return companies
 
 
-def get_worksheet_name(name: str, is_user=False, is_company=False):
-    """Excel doesn't support sheet name greater than 31 character"""
-    if is_user:
-        if len(name) > 31:
-            return name[:31].capitalize()
-        else:
-            return name.capitalize()
-    if is_company:
-        remove_strings = ("private limited", "pvt ltd", "pvt. ltd.", "p.v.t l.t.d")
-        # Create a regex pattern to match any of the remove_strings, case-insensitive
-        pattern = re.compile("|".join(map(re.escape, remove_strings)), re.IGNORECASE)
-        # Use regex sub to replace matched patterns with an empty string
-        cleaned_name = pattern.sub("", name)
-        if len(cleaned_name) > 31:
-            return cleaned_name[:31].capitalize()
-        else:
-            return cleaned_name.capitalize()
-
-
 def get_sensor_dict(user, user_groups, sensors: set | str):
     """Return the sensor dictionary: name and symbol as key value pair"""
     all_sensor_list = SensorCache.get_all_sensor()
@@ -180,6 +168,10 @@ def get_sensor_dict(user, user_groups, sensors: set | str):
     }
 
 
+# mains value is kept numeric, 1 is displayed as ON and 0 as OFF
+MAINS_STATES = {1: "ON", 0: "OFF"}
+
+
 def get_dataframe(queryset):
     df = pd.DataFrame(
         queryset,
@@ -189,13 +181,10 @@ def get_dataframe(queryset):
     if df.empty:
         return None
 
-    df.loc[(df["Sensor Name"] == "mains") & (df["value"] == 1), "value"] = "ON"
-    df.loc[(df["Sensor Name"] == "mains") & (df["value"] == 0), "value"] = "OFF"
-
-    # rounding of the values
-    df["value"] = df["value"].map(
-        lambda x: "{:.2f}".format(x) if isinstance(x, (int, float)) else x
-    )
+    # values stay float so the number format of excel and float_format of csv rounds them
+    df["value"] = df["value"].astype("float64")
+    df["Sensor Name"] = df["Sensor Name"].astype("category")
+    df["Device Name"] = df["Device Name"].astype("category")
 
     # removing time zone infomation as excel doesn't support timezone aware dateTime values
     df["Timestamp"] = df["Timestamp"].dt.tz_convert("Asia/Kathmandu")
@@ -204,117 +193,205 @@ def get_dataframe(queryset):
     return df
 
 
-def sensor_data_to_excel(
-    sensor_dict, df, writer, workbook, header_format, value_column_format, mains_format
+def get_device_owner_map(owners, device_dict, owner_names=None) -> dict:
+    """Returns dict of iot device id and the owner or the owner name if provided"""
+    return {
+        device_id: owner_names[owner] if owner_names else owner
+        for owner in owners
+        for device_id in device_dict[owner]
+    }
+
+
+def group_by_sensor(df, by=()) -> dict:
+    """
+    Splits the dataframe in a single pass into dict of
+    (*by values, sensor name) and the sensor data of the group.
+    """
+    return dict(
+        tuple(df.groupby([*by, "Sensor Name"], observed=True, sort=False, dropna=True))
+    )
+
+
+def get_excel_formats(workbook) -> dict:
+    return {
+        "header": workbook.add_format(
+            {"align": "center", "bold": True, "font_size": 12}
+        ),
+        "value": workbook.add_format({"num_format": "0.00"}),
+        "mains_value": workbook.add_format({"num_format": MAINS_NUMBER_FORMAT}),
+        "mains": workbook.add_format({"bg_color": "red"}),
+    }
+
+
+def sensor_block_to_excel(
+    writer, worksheet, worksheet_name, sensor, unit, sensor_df, start_column, formats
 ):
+    """Writes the value, timestamp and device name of the sensor from the start column"""
+    sensor_name = sensor.capitalize()
+    header_text = (
+        f"{sensor_name} Sensor Data in {unit}" if unit else f"{sensor_name} Sensor Data"
+    )
+    worksheet.merge_range(
+        0, start_column, 0, start_column + 2, header_text, formats["header"]
+    )
+
+    if sensor == "mains":
+        (max_row, _) = sensor_df.shape
+        worksheet.conditional_format(
+            2,
+            start_column,
+            max_row + 2,
+            start_column,
+            {
+                "type": "cell",
+                "criteria": "==",
+                "value": 0,
+                "format": formats["mains"],
+            },
+        )
+
+    value_format = formats["mains_value"] if sensor == "mains" else formats["value"]
+    worksheet.set_column(start_column, start_column, 15, value_format)
+    worksheet.set_column(start_column + 1, start_column + 2, 30)
+
+    sensor_df.to_excel(
+        writer,
+        sheet_name=worksheet_name,
+        index=False,
+        startrow=1,
+        startcol=start_column,
+        columns=["value", "Timestamp", "Device Name"],
+    )
+
+
+def sensor_data_to_excel(sensor_dict, sensor_groups, writer, workbook, formats):
+    """Writes a worksheet per sensor, returns False if no worksheet is written"""
+    is_written = False
     for sensor, unit in sensor_dict.items():
-        sensor_df = df.loc[lambda df: df["Sensor Name"] == sensor]
-        if sensor_df.empty:
+        sensor_df = sensor_groups.get((sensor,))
+        if sensor_df is None:
             continue
         worksheet_name = sensor.capitalize()
         worksheet = workbook.add_worksheet(worksheet_name)
-        header_text = (
-            f"{worksheet_name} Sensor Data in {unit}"
-            if unit
-            else f"{worksheet_name} Sensor Data"
-        )
-        worksheet.merge_range(0, 0, 0, 2, header_text, header_format)
-        if sensor == "mains":
-            (max_row, _) = sensor_df.shape
-            worksheet.conditional_format(
-                2,
-                0,
-                max_row + 2,
-                0,
-                {
-                    "type": "cell",
-                    "criteria": "==",
-                    "value": '"OFF"',
-                    "format": mains_format,
-                },
-            )
-
-        worksheet.set_column(0, 0, 15, value_column_format)
-        worksheet.set_column(1, 2, 30)
-
-        sensor_df.to_excel(
-            writer,
-            sheet_name=worksheet_name,
-            index=False,
-            startrow=1,
-            columns=["value", "Timestamp", "Device Name"],
+        sensor_block_to_excel(
+            writer, worksheet, worksheet_name, sensor, unit, sensor_df, 0, formats
         )
+        is_written = True
+    return is_written
 
 
 def users_and_company_data_to_excel(
     sensor_list,
     sensor_dict,
-    df,
+    sensor_groups,
+    owner,
     writer,
     worksheet,
     worksheet_name,
-    header_format,
-    value_column_format,
-    mains_format,
+    formats,
 ):
+    """Writes the sensors of the user or company side by side in the worksheet"""
     start_column = 0
-    end_column = 2
     for sensor in sensor_list:
         if sensor in sensor_dict:
-            sensor_df = df.loc[lambda df: df["Sensor Name"] == sensor]
-            if not sensor_df.empty:
-                sensor_name = sensor.capitalize()
-                unit = sensor_dict[sensor]
-                header_text = (
-                    f"{sensor_name} Sensor Data in {sensor_dict[sensor]}"
-                    if unit
-                    else f"{sensor_name} Sensor Data"
-                )
-                worksheet.merge_range(
-                    0,
+            sensor_df = sensor_groups.get((owner, sensor))
+            if sensor_df is not None:
+                sensor_block_to_excel(
+                    writer,
+                    worksheet,
+                    worksheet_name,
+                    sensor,
+                    sensor_dict[sensor],
+                    sensor_df,
                     start_column,
-                    0,
-                    end_column,
-                    header_text,
-                    header_format,
+                    formats,
                 )
+                start_column = start_column + 4
 
-                if sensor == "mains":
-                    (max_row, _) = sensor_df.shape
-                    worksheet.conditional_format(
-                        2,
-                        start_column,
-                        max_row + 2,
-                        start_column,
-                        {
-                            "type": "cell",
-                            "criteria": "==",
-                            "value": '"OFF"',
-                            "format": mains_format,
-                        },
-                    )
 
-                worksheet.set_column(
-                    start_column, start_column, 15, value_column_format
-                )
-                worksheet.set_column(start_column + 1, start_column + 2, 30)
+def sensor_data_to_csv(df, bio, columns):
+    """
+    Writes the sorted dataframe as csv, a run of rows of the same sensor at a time,
+    so mains is written as ON/OFF and other values are rounded by float_format.
+    """
+    sensor_runs = (df["Sensor Name"] != df["Sensor Name"].shift()).cumsum()
+    header = True
+    for _, run_df in df.groupby(sensor_runs, sort=False):
+        if run_df["Sensor Name"].iat[0] == "mains":
+            run_df = run_df.assign(
+                value=run_df["value"].map(MAINS_STATES).fillna(run_df["value"])
+            )
+        run_df.to_csv(
+            bio, header=header, index=False, float_format="%.2f", columns=columns
+        )
+        header = False
 
-                sensor_df.to_excel(
-                    writer,
-                    sheet_name=worksheet_name,
-                    index=False,
-                    startrow=1,
-                    startcol=start_column,
-                    columns=["value", "Timestamp", "Device Name"],
-                )
 
-                start_column = end_column + 2
-                end_column = end_column + 2 + 2
+def stream_sensor_data_csv(
+    request, sensor_data, sensor_dict, users=None, companies=None, device_dict=None
+):
+    """
+    Streams the sensor data as csv sorted by the user, company, sensor name and timestamp
+    same as the csv build from the dataframe, without loading it into the memory.
+    """
+    sensor_data = sensor_data.filter(device_sensor__sensor__name__in=list(sensor_dict))
+    if not sensor_data.exists():
+        return Response(
+            {"message": "No data is present to download"},
+            status=status.HTTP_204_NO_CONTENT,
+        )
 
+    sensor_names = sorted(sensor_dict)
+    header = ["Sensor Name", "Timestamp", "value", "Device Name"]
+    if not users and not companies:
+        sections = (
+            (sensor_data.filter(device_sensor__sensor__name=sensor), sensor, [])
+            for sensor in sensor_names
+        )
+        return get_streaming_csv_response(
+            request, header, sections, "sensor_data.csv"
+        )
 
-@api_view(["GET"])
-@permission_classes([IsAuthenticated])
-def download_sensor_data(request):
+    owners = []
+    if users:
+        header.append("User")
+        user_names = sorted(
+            (get_owner_name(username=username), username) for username in users
+        )
+        owners.extend(
+            ([name, ""] if companies else [name], device_dict[username])
+            for name, username in user_names
+        )
+    if companies:
+        header.append("Company")
+        company_names = sorted(
+            (get_owner_name(company_slug=slug), slug) for slug in companies
+        )
+        owners.extend(
+            (["", name] if users else [name], device_dict[slug])
+            for name, slug in company_names
+        )
+
+    sections = (
+        (
+            sensor_data.filter(
+                iot_device__in=iot_device_list, device_sensor__sensor__name=sensor
+            ),
+            sensor,
+            extra_columns,
+        )
+        for extra_columns, iot_device_list in owners
+        for sensor in sensor_names
+    )
+    return get_streaming_csv_response(request, header, sections, "sensor_data.csv")
+
+
+def get_download_params(request, file_types=("excel", "csv", *COLUMNAR_FILE_TYPES)):
+    """
+    Validates the download query params.
+    Returns tuple(params, error response), params is None if validation fails.
+    """
+    query_params = request.query_params
     user = UserCache.get_user(username=request.user.username)
     user_groups = get_groups_tuple(user)
     is_user_superadmin = GroupName.SUPERADMIN_GROUP in user_groups
@@ -326,23 +403,23 @@ def download_sensor_data(request):
             GroupName.MODERATOR_GROUP,
         )
     ):
-        return Response(
+        return None, Response(
             {"error": "Permission denied"}, status=status.HTTP_403_FORBIDDEN
         )
 
     if not user.is_associated_with_company and GroupName.MODERATOR_GROUP in user_groups:
         user = UserCache.get_user(username=user.created_by)
 
-    start_date = request.query_params.get("start_date", None)
-    end_date = request.query_params.get("end_date", None)
-    sensors = request.query_params.get("sensors", None)
-    iot_device = request.query_params.get("iot_device", None)
-    file_type = request.query_params.get("file_type", None)
+    start_date = query_params.get("start_date", None)
+    end_date = query_params.get("end_date", None)
+    sensors = query_params.get("sensors", None)
+    iot_device = query_params.get("iot_device", None)
+    file_type = query_params.get("file_type", None)
 
-    if file_type is None or not file_type in ("excel", "csv"):
-        return Response(
+    if file_type is None or not file_type in file_types:
+        return None, Response(
             {
-                "error": "Invalid/Unspecified format! file-format must be either 'excel' or 'csv'."
+                "error": f"Invalid/Unspecified format! file-format must be either {' or '.join(map(repr, file_types))}."
             },
             status=status.HTTP_400_BAD_REQUEST,
         )
@@ -352,7 +429,7 @@ def download_sensor_data(request):
     )
 
     if date_error_message:
-        return Response(
+        return None, Response(
             {"error": date_error_message},
             status=status.HTTP_400_BAD_REQUEST,
         )
@@ -365,7 +442,7 @@ def download_sensor_data(request):
     )
 
     if iot_device_error_message:
-        return Response(
+        return None, Response(
             {"error": iot_device_error_message},
             status=status.HTTP_400_BAD_REQUEST,
         )
@@ -373,42 +450,37 @@ def download_sensor_data(request):
     sensor_dict = get_sensor_dict(user, user_groups, sensors)
 
     if sensor_dict is None:
-        return Response(
+        return None, Response(
             {
                 "error": "Invalid Sensor! A sensor provided which is not owned by the entity"
             },
             status=status.HTTP_400_BAD_REQUEST,
         )
 
-    sensor_data = (
-        SensorData.objects.select_related("iot_device")
-        .filter(
-            timestamp__range=(start_date, end_date),
-        )
-        .values_list(
-            "device_sensor__sensor__name",
-            "iot_device_id",
-            "value",
-            "timestamp",
-            "iot_device__iot_device_details__name",
-        )
-        .order_by("-timestamp", "iot_device")
-    )
-
-    if isinstance(iot_device, set):
-        sensor_data = sensor_data.filter(
-            iot_device__in=iot_device,
-        )
+    params = {
+        "user": user,
+        "user_groups": user_groups,
+        "start_date": start_date,
+        "end_date": end_date,
+        "file_type": file_type,
+        "sensor_dict": sensor_dict,
+        "iot_device": iot_device,
+        "is_dealer_or_superadmin": any(
+            group_name in user_groups
+            for group_name in (
+                GroupName.DEALER_GROUP,
+                GroupName.SUPERADMIN_GROUP,
+            )
+        ),
+        "users": None,
+        "companies": None,
+        "device_list": None,
+        "device_dict": {},
+    }
 
-    if any(
-        group_name in user_groups
-        for group_name in (
-            GroupName.DEALER_GROUP,
-            GroupName.SUPERADMIN_GROUP,
-        )
-    ):
-        users = request.query_params.get("user", None)
-        companies = request.query_params.get("company", None)
+    if params["is_dealer_or_superadmin"]:
+        users = query_params.get("user", None)
+        companies = query_params.get("company", None)
         device_list = []
         device_dict = {}
         if companies:
@@ -416,7 +488,7 @@ def download_sensor_data(request):
                 companies, user, is_user_superadmin
             )
             if companies is None:
-                return Response(
+                return None, Response(
                     {
                         "error": "Invalid Company! A company provided which is not in our system."
                     },
@@ -432,7 +504,7 @@ def download_sensor_data(request):
         if users:
             users = get_users_to_download_data(users, user, is_user_superadmin)
             if users is None:
-                return Response(
+                return None, Response(
                     {
                         "error": "Invalid user! A user provided which is not an Admin User."
                     },
@@ -445,8 +517,51 @@ def download_sensor_data(request):
                 device_list.extend(iot_device_list)
                 device_dict[username] = iot_device_list
 
+        params["users"] = users
+        params["companies"] = companies
+        params["device_dict"] = device_dict
         if users or companies:
-            sensor_data = sensor_data.filter(iot_device__in=device_list)
+            params["device_list"] = device_list
+
+    return params, None
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def download_sensor_data(request):
+    params, error_response = get_download_params(request)
+    if error_response:
+        return error_response
+
+    file_type = params["file_type"]
+    sensor_dict = params["sensor_dict"]
+    # streams the csv instead of building it in memory
+    stream = strtobool(request.query_params.get("stream", ""))
+    sensor_data = get_download_queryset(
+        params["start_date"],
+        params["end_date"],
+        params["iot_device"],
+        params["device_list"],
+    )
+
+    if file_type in COLUMNAR_FILE_TYPES:
+        response = get_columnar_response(sensor_data, list(sensor_dict), file_type)
+        if response is None:
+            return Response(
+                {"message": "No data is present to download"},
+                status=status.HTTP_204_NO_CONTENT,
+            )
+        return response
+
+    if params["is_dealer_or_superadmin"]:
+        users = params["users"]
+        companies = params["companies"]
+        device_dict = params["device_dict"]
+
+        if file_type == "csv" and stream:
+            return stream_sensor_data_csv(
+                request, sensor_data, sensor_dict, users, companies, device_dict
+            )
 
         df = get_dataframe(sensor_data)
         if df is None:
@@ -463,43 +578,42 @@ def download_sensor_data(request):
                 datetime_format="mmm d yyyy hh:mm:ss",
             ) as writer:
                 workbook = writer.book
-                value_column_format = workbook.add_format({"num_format": "0.00"})
-                mains_format = workbook.add_format({"bg_color": "red"})
-                header_format = workbook.add_format(
-                    {"align": "center", "bold": True, "font_size": 12}
-                )
+                formats = get_excel_formats(workbook)
+                is_written = False
                 if users:
+                    df["User"] = df["Device Id"].map(
+                        get_device_owner_map(users, device_dict)
+                    )
+                    user_groups = group_by_sensor(df, by=["User"])
+                    user_names = {owner for owner, _ in user_groups}
                     for username in users:
-                        iot_device_list = device_dict[username]
-                        users_df = df[df["Device Id"].isin(iot_device_list)]
-                        if not users_df.empty:
+                        if username in user_names:
                             user = UserCache.get_user(username)
                             user_owned_sensor_list = SensorCache.get_all_user_sensor(
                                 user=user
                             )
-                            name = (
-                                f"{user.profile.first_name} {user.profile.last_name}"
-                                if user.profile.first_name
-                                else username
-                            )
+                            name = get_owner_name(username=username)
                             worksheet_name = get_worksheet_name(name, is_user=True)
                             worksheet = workbook.add_worksheet(worksheet_name)
                             users_and_company_data_to_excel(
                                 user_owned_sensor_list,
                                 sensor_dict,
-                                users_df,
+                                user_groups,
+                                username,
                                 writer,
                                 worksheet,
                                 worksheet_name,
-                                header_format,
-                                value_column_format,
-                                mains_format,
+                                formats,
                             )
+                            is_written = True
                 if companies:
+                    df["Company"] = df["Device Id"].map(
+                        get_device_owner_map(companies, device_dict)
+                    )
+                    company_groups = group_by_sensor(df, by=["Company"])
+                    company_slugs = {owner for owner, _ in company_groups}
                     for slug in companies:
-                        iot_device_list = device_dict[slug]
-                        company_df = df[df["Device Id"].isin(iot_device_list)]
-                        if not company_df.empty:
+                        if slug in company_slugs:
                             company = CompanyCache.get_company(slug)
                             company_owned_sensor_list = (
                                 SensorCache.get_all_company_sensor(company=company)
@@ -512,26 +626,20 @@ def download_sensor_data(request):
                             users_and_company_data_to_excel(
                                 company_owned_sensor_list,
                                 sensor_dict,
-                                company_df,
+                                company_groups,
+                                slug,
                                 writer,
                                 worksheet,
                                 worksheet_name,
-                                header_format,
-                                value_column_format,
-                                mains_format,
+                                formats,
                             )
+                            is_written = True
                 if users is None and companies is None:
-                    sensor_data_to_excel(
-                        sensor_dict,
-                        df,
-                        writer,
-                        workbook,
-                        header_format,
-                        value_column_format,
-                        mains_format,
+                    is_written = sensor_data_to_excel(
+                        sensor_dict, group_by_sensor(df), writer, workbook, formats
                     )
 
-            if pd.read_excel(bio, nrows=2).empty:
+            if not is_written:
                 return Response(
                     {"message": "No data is present to download"},
                     status=status.HTTP_204_NO_CONTENT,
@@ -540,44 +648,33 @@ def download_sensor_data(request):
             # file type is equal to csv
             df = df[df["Sensor Name"].isin(sensor_dict.keys())]
             if users is None and companies is None:
-                df.sort_values(
+                df = df.sort_values(
                     by=["Sensor Name", "Timestamp"],
-                    inplace=True,
                     ascending=[True, False],
                     ignore_index=True,
                 )
                 df["Timestamp"] = df["Timestamp"].dt.strftime("%b %d %Y %H:%M:%S")
-                df.to_csv(
-                    bio,
-                    index=False,
-                    float_format="%.2f",
-                    columns=["Sensor Name", "Timestamp", "value", "Device Name"],
+                sensor_data_to_csv(
+                    df, bio, columns=["Sensor Name", "Timestamp", "value", "Device Name"]
                 )
 
             else:
                 if users:
-                    df["User"] = None
-                    for username in users:
-                        iot_device_list = device_dict[username]
-                        users_mask = df["Device Id"].isin(iot_device_list)
-                        if any(users_mask):
-                            user = UserCache.get_user(username)
-                            user_name = (
-                                f"{user.profile.first_name} {user.profile.last_name}"
-                                if user.profile.first_name
-                                else username
-                            )
-                            df.loc[users_mask, "User"] = user_name
+                    user_names = {
+                        username: get_owner_name(username=username)
+                        for username in users
+                    }
+                    df["User"] = df["Device Id"].map(
+                        get_device_owner_map(users, device_dict, user_names)
+                    )
 
                 if companies:
-                    df["Company"] = None
-                    for slug in companies:
-                        iot_device_list = device_dict[slug]
-                        company_mask = df["Device Id"].isin(iot_device_list)
-                        if any(company_mask):
-                            company = CompanyCache.get_company(slug)
-                            company_name = company.name
-                            df.loc[company_mask, "Company"] = company_name
+                    company_names = {
+                        slug: get_owner_name(company_slug=slug) for slug in companies
+                    }
+                    df["Company"] = df["Device Id"].map(
+                        get_device_owner_map(companies, device_dict, company_names)
+                    )
 
                 columns = [
                     "Sensor Name",
@@ -603,65 +700,57 @@ def download_sensor_data(request):
                     columns.append("User")
 
                 if is_company_value_present and is_user_value_present:
-                    df.dropna(
+                    df = df.dropna(
                         subset=["User", "Company"],
                         how="all",
-                        inplace=True,
                         ignore_index=True,
                     )
 
-                    df.sort_values(
+                    df = df.sort_values(
                         by=["User", "Company", "Sensor Name", "Timestamp"],
                         ascending=[True, True, True, False],
-                        inplace=True,
                         ignore_index=True,
                     )
 
                 elif is_company_value_present:
-                    df.dropna(
+                    df = df.dropna(
                         subset=["Company"],
                         how="all",
-                        inplace=True,
                         ignore_index=True,
                     )
 
-                    df.sort_values(
+                    df = df.sort_values(
                         by=["Company", "Sensor Name", "Timestamp"],
                         ascending=[True, True, False],
-                        inplace=True,
                         ignore_index=True,
                     )
 
                 elif is_user_value_present:
-                    df.dropna(
+                    df = df.dropna(
                         subset=["User"],
                         how="all",
-                        inplace=True,
                         ignore_index=True,
                     )
 
-                    df.sort_values(
+                    df = df.sort_values(
                         by=["User", "Sensor Name", "Timestamp"],
                         ascending=[True, True, False],
-                        inplace=True,
                         ignore_index=True,
                     )
 
                 df["Timestamp"] = df["Timestamp"].dt.strftime("%b %d %Y %H:%M:%S")
-                df.to_csv(
-                    bio,
-                    index=False,
-                    float_format="%.2f",
-                    columns=columns,
-                )
+                sensor_data_to_csv(df, bio, columns=columns)
 
     elif any(
-        group_name in user_groups
+        group_name in params["user_groups"]
         for group_name in (
             GroupName.ADMIN_GROUP,
             GroupName.MODERATOR_GROUP,
         )
     ):
+        if file_type == "csv" and stream:
+            return stream_sensor_data_csv(request, sensor_data, sensor_dict)
+
         df = get_dataframe(sensor_data)
 
         if df is None:
@@ -678,35 +767,23 @@ def download_sensor_data(request):
                 datetime_format="mmm d yyyy hh:mm:ss",
             ) as writer:
                 workbook = writer.book
-                value_column_format = workbook.add_format({"num_format": "0.00"})
-                mains_format = workbook.add_format({"bg_color": "red"})
-                header_format = workbook.add_format(
-                    {"align": "center", "bold": True, "font_size": 12}
-                )
-
                 sensor_data_to_excel(
                     sensor_dict,
-                    df,
+                    group_by_sensor(df),
                     writer,
                     workbook,
-                    header_format,
-                    value_column_format,
-                    mains_format,
+                    get_excel_formats(workbook),
                 )
         else:
             # file type is equal to csv
-            df.sort_values(
+            df = df.sort_values(
                 by=["Sensor Name", "Timestamp"],
                 ascending=[True, False],
-                inplace=True,
                 ignore_index=True,
             )
             df["Timestamp"] = df["Timestamp"].dt.strftime("%b %d %Y %H:%M:%S")
-            df.to_csv(
-                bio,
-                index=False,
-                float_format="%.2f",
-                columns=["Sensor Name", "Timestamp", "value", "Device Name"],
+            sensor_data_to_csv(
+                df, bio, columns=["Sensor Name", "Timestamp", "value", "Device Name"]
             )
 
     # Seek to the beginning and read/or getValue to copy the workbook to a variable in memory
@@ -0,0 +1,125 @@
+import os
+import re
+
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from sensor_data.export import (
+    EXPORT_COMPLETED,
+    SensorDataExport,
+    get_export_params,
+)
+from sensor_data.streaming import get_file_streaming_response
+from sensor_data.views.download_views import get_download_params
+
+EXCEL_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def get_job_data(job: dict) -> dict:
+    return {
+        key: job[key]
+        for key in ("id", "status", "progress", "rows", "total_rows", "created_at")
+    }
+
+
+def get_user_job(request, job_id):
+    """Returns the export job of the user, None if not found"""
+    job = SensorDataExport.get_job(job_id)
+    if job is None or job["user_id"] != request.user.id:
+        return None
+    return job
+
+
+def get_file_response(request, file_path, file_name, content_type):
+    """Returns the file response, partial content if the request has a single byte range"""
+    file_size = os.path.getsize(file_path)
+    range_header = request.META.get("HTTP_RANGE", "").strip()
+    match = RANGE_PATTERN.match(range_header)
+    if not match or match.groups() == ("", ""):
+        response = get_file_streaming_response(
+            open(file_path, "rb"), file_name, content_type, file_size
+        )
+        response["Accept-Ranges"] = "bytes"
+        return response
+
+    start, end = match.groups()
+    if start:
+        start = int(start)
+        end = min(int(end), file_size - 1) if end else file_size - 1
+    else:
+        # suffix range i.e last n bytes
+        start = max(file_size - int(end), 0)
+        end = file_size - 1
+
+    if start > end or start >= file_size:
+        response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        response["Content-Range"] = f"bytes */{file_size}"
+        return response
+
+    length = end - start + 1
+    response = get_file_streaming_response(
+        open(file_path, "rb"),
+        file_name,
+        content_type,
+        file_size,
+        start=start,
+        length=length,
+        status=status.HTTP_206_PARTIAL_CONTENT,
+    )
+    response["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+    response["Accept-Ranges"] = "bytes"
+    return response
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def create_export_job(request):
+    """
+    Starts the background excel export of the sensor data, takes the same query params
+    as the download. Identical export request returns the existing job.
+    """
+    params, error_response = get_download_params(request, file_types=("excel",))
+    if error_response:
+        return error_response
+
+    job, created = SensorDataExport.create_job(
+        request.user.id, get_export_params(params)
+    )
+    return Response(
+        get_job_data(job),
+        status=status.HTTP_202_ACCEPTED if created else status.HTTP_200_OK,
+    )
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def get_export_job(request, job_id):
+    job = get_user_job(request, job_id)
+    if job is None:
+        return Response(
+            {"error": "Export job not found"}, status=status.HTTP_404_NOT_FOUND
+        )
+    return Response(get_job_data(job), status=status.HTTP_200_OK)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def download_export_job(request, job_id):
+    job = get_user_job(request, job_id)
+    if job is None:
+        return Response(
+            {"error": "Export job not found"}, status=status.HTTP_404_NOT_FOUND
+        )
+
+    file_path = SensorDataExport.get_file_path(job["id"])
+    if job["status"] != EXPORT_COMPLETED or not os.path.exists(file_path):
+        return Response(
+            {"error": f"Export is not ready to download, export is {job['status']}"},
+            status=status.HTTP_409_CONFLICT,
+        )
+
+    return get_file_response(request, file_path, "sensor_data.xlsx", EXCEL_CONTENT_TYPE)
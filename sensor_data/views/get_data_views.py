@@ -1,14 +1,21 @@
+import base64
+import hashlib
+import json
 from collections import defaultdict
 from datetime import timedelta
 
+from django.db.models import F, Max, Q
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.http import parse_etags, quote_etag
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
 from iot_devices.cache import IotDeviceCache
-from sensor_data.models import SensorData
+from sensor_data.models import SensorData, SensorDataRollup
+from sensor_data.rollup import select_resolution
 from users.cache import UserCache
 from utils.commom_functions import get_groups_tuple
 from utils.constants import GroupName
@@ -47,25 +54,96 @@ def process_sensor_data(sensor_data_qs, list_data_by_sensor=False):
     return sensors_data
 
 
-@api_view(["GET"])
-@permission_classes([IsAuthenticated])
-def get_sensor_data(request):
-    user = UserCache.get_user(username=request.user.username)
-    user_groups = get_groups_tuple(user)
-    one_month_ago = timezone.now() - timedelta(days=30)
-    if GroupName.SUPERADMIN_GROUP in user_groups:
-        sensor_data_qs = (
-            SensorData.objects.filter(timestamp__gte=one_month_ago)
+def get_sensor_data_queryset(start_date, end_date, **filters):
+    """
+    Returns the sensor data from start to end date, served from the coarsest rollup
+    that keeps the range within the max points if rollups are enabled.
+    """
+    resolution = select_resolution(start_date, end_date)
+    if resolution:
+        return (
+            SensorDataRollup.objects.filter(
+                resolution=resolution,
+                bucket__gte=start_date,
+                bucket__lte=end_date,
+                **filters,
+            )
             .values(
                 "device_sensor__sensor__name",
                 "iot_device_id",
-                "value",
-                "timestamp",
+                value=F("avg_value"),
+                timestamp=F("bucket"),
             )
-            .order_by("-timestamp")
+            .order_by("-bucket")
         )
 
-    else:
+    return (
+        SensorData.objects.filter(
+            timestamp__gte=start_date, timestamp__lte=end_date, **filters
+        )
+        .values(
+            "device_sensor__sensor__name",
+            "iot_device_id",
+            "value",
+            "timestamp",
+        )
+        .order_by("-timestamp")
+    )
+
+
+def encode_since_cursor(id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"id": id}).encode()).decode()
+
+
+def get_since_filter(since: str) -> Q | None:
+    """
+    Returns the filter of the sensor data newer than the watermark, None if invalid.
+    Cursor is the last sensor data id received, so the readings inserted with an
+    older timestamp by the batch ingest are still received, timestamp is also accepted.
+    Ids are not committed in order across the buffer flush, the sync writes and the
+    batch ingest, a reading whose transaction commits after a poll that already
+    received a higher id is not returned by the cursor.
+    """
+    try:
+        return Q(id__gt=int(json.loads(base64.urlsafe_b64decode(since))["id"]))
+    except (TypeError, ValueError, KeyError):
+        pass
+    timestamp = parse_datetime(since)
+    if timestamp is None:
+        return None
+    if timezone.is_naive(timestamp):
+        timestamp = timezone.make_aware(timestamp)
+    return Q(timestamp__gt=timestamp)
+
+
+def get_etag(window_start, *keys, **filters) -> str:
+    """
+    ETag of the response from the newest sensor data id of the devices and the start
+    of the window rounded to the minute, changes whenever sensor data is added or
+    the window moves. MAX(id) of the devices is read from the index without
+    scanning the rows of the window.
+    """
+    max_id = SensorData.objects.filter(**filters).aggregate(max_id=Max("id"))["max_id"]
+    value = ":".join(
+        str(key) for key in (*keys, max_id, window_start.strftime("%Y%m%d%H%M"))
+    )
+    return quote_etag(hashlib.md5(value.encode()).hexdigest())
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def get_sensor_data(request):
+    """
+    Returns the sensor data of the last 30 days.
+    With since query param only the sensor data newer than the since cursor or
+    timestamp is returned along with the cursor for the next poll.
+    """
+    user = UserCache.get_user(username=request.user.username)
+    user_groups = get_groups_tuple(user)
+    now = timezone.now()
+    one_month_ago = now - timedelta(days=30)
+    filters = {}
+    if GroupName.SUPERADMIN_GROUP not in user_groups:
         # getting the list of the iot_device associated with the admin user or company
         iot_device_list = []
         if user.is_associated_with_company:
@@ -74,22 +152,63 @@ def get_sensor_data(request):
             iot_device_list = IotDeviceCache.get_all_user_iot_devices(user)
         else:
             iot_device_list = IotDeviceCache.get_all_user_iot_devices(user.created_by)
+        filters["iot_device__id__in"] = iot_device_list
 
-        sensor_data_qs = (
-            SensorData.objects.filter(
-                iot_device__id__in=iot_device_list, timestamp__gte=one_month_ago
-            )
-            .values(
-                "device_sensor__sensor__name",
-                "iot_device_id",
-                "value",
-                "timestamp",
+    list_data_by_sensor = request.query_params.get("list_by", None)
+    since = request.query_params.get("since", None)
+    raw_sensor_data_qs = SensorData.objects.filter(
+        timestamp__gte=one_month_ago, **filters
+    )
+    if since:
+        since_filter = get_since_filter(since)
+        if since_filter is None:
+            return Response(
+                {"error": "Invalid since! since must be a cursor or a timestamp"},
+                status=status.HTTP_400_BAD_REQUEST,
             )
-            .order_by("-timestamp")
-        )
+        raw_sensor_data_qs = raw_sensor_data_qs.filter(since_filter)
 
-    list_data_by_sensor = request.query_params.get("list_by", None)
-    sensors_data = process_sensor_data(
-        sensor_data_qs, list_data_by_sensor=(list_data_by_sensor == "sensor")
+    resolution = None if since else select_resolution(one_month_ago, now)
+    etag = get_etag(
+        one_month_ago,
+        user.username,
+        list_data_by_sensor,
+        since,
+        resolution,
+        **filters,
     )
-    return Response(sensors_data, status=status.HTTP_200_OK)
+    if etag in parse_etags(request.META.get("HTTP_IF_NONE_MATCH", "")):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        response["ETag"] = etag
+        return response
+
+    if since:
+        sensor_data_qs = raw_sensor_data_qs.values(
+            "id",
+            "device_sensor__sensor__name",
+            "iot_device_id",
+            "value",
+            "timestamp",
+        ).order_by("-timestamp")
+        sensor_data_list = list(sensor_data_qs)
+        next_since = (
+            encode_since_cursor(max(data["id"] for data in sensor_data_list))
+            if sensor_data_list
+            else since
+        )
+        sensors_data = {
+            "since": next_since,
+            "results": process_sensor_data(
+                sensor_data_list,
+                list_data_by_sensor=(list_data_by_sensor == "sensor"),
+            ),
+        }
+    else:
+        sensor_data_qs = get_sensor_data_queryset(one_month_ago, now, **filters)
+        sensors_data = process_sensor_data(
+            sensor_data_qs, list_data_by_sensor=(list_data_by_sensor == "sensor")
+        )
+
+    response = Response(sensors_data, status=status.HTTP_200_OK)
+    response["ETag"] = etag
+    return response
@@ -1,6 +1,5 @@
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
-from django.db import transaction
 from django.utils import timezone
 from rest_framework import status
 from rest_framework.decorators import api_view, authentication_classes
@@ -8,9 +7,107 @@ from rest_framework.response import Response
 
 from iot_devices.auth import DeviceAuthentication
 from iot_devices.cache import IotDeviceCache
-from sensor_data.serializers import IotDeviceSensorDataSerializer
+from sensor_data.buffer import SensorDataBuffer
+from sensor_data.coalescing import (
+    LiveDataCoalescer,
+    LiveDataSubscribers,
+    get_device_group_name,
+    get_live_data_event,
+    get_live_data_frame,
+)
+from sensor_data.serializers import IotDeviceSensorDataBatchSerializer
 from sensor_data.tasks import send_live_data_to
-from sensor_data.utilis import strtobool
+from sensor_data.utilis import (
+    get_sensor_data_list,
+    strtobool,
+    validate_sensor_values,
+)
+from utils.error_message import ERROR_NO_VALUE
+from utils.executor import run_in_executor
+
+
+def get_live_data(data):
+    """Returns tuple(sensor values, timestamp formatted in the local timezone)"""
+    data = dict(data)
+    timestamp = (
+        data.pop("timestamp")
+        .astimezone(timezone.get_default_timezone())
+        .strftime("%Y/%m/%d %H:%M:%S")
+    )
+    return data, timestamp
+
+
+def get_live_data_group_name(iot_device) -> str:
+    """Websocket group of the company or admin user owning the device"""
+    username = iot_device.user.username if iot_device.user else None
+    company_slug = iot_device.company.slug if iot_device.company else None
+    return company_slug if company_slug else username
+
+
+def get_live_sensor_data(data, timestamp, ingest_plan) -> dict:
+    """Returns the sensor values keyed by the sensor name along with the timestamp"""
+    # sensor name is the last item of the ingest plan of the field
+    sensor_data = {
+        ingest_plan[field_name][-1]: value
+        for field_name, value in data.items()
+        if field_name in ingest_plan
+    }
+    sensor_data["timestamp"] = timestamp
+    return sensor_data
+
+
+async def apublish_live_data(iot_device, data, timestamp, ingest_plan):
+    """
+    Sends the live data to the websocket group of the device owner and to the
+    subscribers of the device if any, merged with the other readings of the group
+    when coalescing is enabled.
+    Frame is shaped and encoded once here, so the consumers only forward it.
+    Runs on the event loop, sync views call it through async_to_sync.
+    """
+    group_names = [get_live_data_group_name(iot_device)]
+    if await LiveDataSubscribers.has_subscribers(iot_device.id):
+        group_names.append(get_device_group_name(iot_device.id))
+    sensor_data = get_live_sensor_data(data, timestamp, ingest_plan)
+    if LiveDataCoalescer.is_enabled():
+        for group_name in group_names:
+            await LiveDataCoalescer.add(group_name, iot_device.id, sensor_data)
+        return
+
+    channel_layer = get_channel_layer()
+    event = get_live_data_event(get_live_data_frame({iot_device.id: sensor_data}))
+    for group_name in group_names:
+        await channel_layer.group_send(group_name, event)
+
+
+def send_live_data_to_api(iot_device, data, timestamp):
+    """call celery for sending live data to an api end point"""
+    if iot_device.send_live_data:
+        send_live_data_to.delay(
+            username=iot_device.user.username if iot_device.user else None,
+            company_slug=iot_device.company.slug if iot_device.company else None,
+            data=data,
+            iot_device_id=iot_device.id,
+            board_id=iot_device.board_id,
+            timestamp=timestamp,
+        )
+
+
+def send_sensor_data(iot_device, data, ingest_plan):
+    """Sends the sensor data to the websocket and to the live data api end point"""
+    data, timestamp = get_live_data(data)
+    async_to_sync(apublish_live_data)(iot_device, data, timestamp, ingest_plan)
+
+    send_live_data_to_api(iot_device, data, timestamp)
+
+
+async def asend_sensor_data(iot_device, data, ingest_plan):
+    """Async version of send_sensor_data"""
+    data, timestamp = get_live_data(data)
+    await apublish_live_data(iot_device, data, timestamp, ingest_plan)
+
+    if iot_device.send_live_data:
+        # celery publish is blocking
+        await run_in_executor(send_live_data_to_api, iot_device, data, timestamp)
 
 
 @api_view(["POST"])
@@ -20,59 +117,63 @@ def save_sensor_data(request):
     if strtobool(request.data.get("is_error", "")):
         return Response(status=status.HTTP_200_OK)
 
-    device_sensors = IotDeviceCache.get_all_device_sensors(iot_device.id)
-    if not device_sensors:
+    ingest_plan = IotDeviceCache.get_device_ingest_plan(iot_device.id)
+    if not ingest_plan:
         return Response(
             {"error": "No Sensor is associated with the devices"},
             status=status.HTTP_400_BAD_REQUEST,
         )
-    serializer = IotDeviceSensorDataSerializer(
-        data=request.data,
-        context={
-            "request": request,
-            "iot_device": iot_device,
-            "device_sensors": device_sensors,
-        },
-    )
-    serializer.is_valid(raise_exception=True)
-    if not serializer.validated_data:
+
+    if not any(field_name in request.data for field_name in ingest_plan):
+        return Response({"error": ERROR_NO_VALUE}, status=status.HTTP_400_BAD_REQUEST)
+
+    sensor_values = validate_sensor_values(ingest_plan, request.data)
+    if not sensor_values:
         # this means all the sensor values received are beyond the max and min limit of the device sensor
         return Response(status=status.HTTP_200_OK)
 
-    with transaction.atomic():
-        serializer.save()
+    timestamp = timezone.now()
+    SensorDataBuffer.write(
+        get_sensor_data_list(ingest_plan, sensor_values, iot_device, timestamp)
+    )
 
-    username = iot_device.user.username if iot_device.user else None
-    company_slug = iot_device.company.slug if iot_device.company else None
-    group_name = company_slug if company_slug else username
+    sensor_values["timestamp"] = timestamp
+    send_sensor_data(iot_device, sensor_values, ingest_plan)
 
-    # sending data to the websocket
-    channel_layer = get_channel_layer()
-    timestamp = (
-        serializer.validated_data.pop("timestamp")
-        .astimezone(timezone.get_default_timezone())
-        .strftime("%Y/%m/%d %H:%M:%S")
-    )
+    return Response(status=status.HTTP_200_OK)
 
-    async_to_sync(channel_layer.group_send)(
-        group_name,
-        {
-            "type": "send_live_data",
-            "data": serializer.validated_data,
-            "device_id": iot_device.id,
-            "timestamp": timestamp,
+
+@api_view(["POST"])
+@authentication_classes([DeviceAuthentication])
+def save_sensor_data_batch(request):
+    """
+    Saves the readings buffered by the iot device in a single request.
+    Only the newest reading is send to the websocket and live data api end point.
+    """
+    iot_device = request.auth
+    ingest_plan = IotDeviceCache.get_device_ingest_plan(iot_device.id)
+    if not ingest_plan:
+        return Response(
+            {"error": "No Sensor is associated with the devices"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    serializer = IotDeviceSensorDataBatchSerializer(
+        data=request.data,
+        context={
+            "request": request,
+            "iot_device": iot_device,
+            "ingest_plan": ingest_plan,
         },
     )
+    serializer.is_valid(raise_exception=True)
+    readings = serializer.validated_data["readings"]
+    if not readings:
+        # all the sensor values received are beyond the max and min limit of the device sensor
+        return Response({"saved": 0}, status=status.HTTP_200_OK)
 
-    # call celery for sending live data to an api end point
-    if iot_device.send_live_data:
-        send_live_data_to.delay(
-            username=username,
-            company_slug=company_slug,
-            data=serializer.validated_data,
-            iot_device_id=iot_device.id,
-            board_id=iot_device.board_id,
-            timestamp=timestamp,
-        )
+    SensorDataBuffer.write(serializer.get_sensor_data())
 
-    return Response(status=status.HTTP_200_OK)
+    latest_reading = max(readings, key=lambda reading: reading["timestamp"])
+    send_sensor_data(iot_device, latest_reading, ingest_plan)
+
+    return Response({"saved": len(readings)}, status=status.HTTP_200_OK)
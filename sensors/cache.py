@@ -1,4 +1,5 @@
 from caching.cache import Cache
+from caching.records import CacheRecord
 from company.cache import CompanyCache
 from dealer.cache import DealerCache
 from sensors.models import Sensor
@@ -8,6 +9,9 @@ from users.cache import UserCache
 class SensorCaching(Cache):
     app_name = "sensor"
     cache_key = "sensor_list"
+    list_indexes = {"name": "name"}
+    list_ordering = "name"
+    list_record = CacheRecord(Sensor)
 
     def __get_queryset(self, sensor_name: str):
         return Sensor.objects.filter(name=sensor_name)
@@ -22,14 +26,7 @@ class SensorCaching(Cache):
         return f"admin_user_sensor_{username}"
 
     def __get_sensor_by_name(self, sensor_name: str) -> object | None:
-        cached_data = self.get(self.cache_key)
-        if cached_data:
-            result = next(
-                (sensor for sensor in cached_data if sensor.name == sensor_name),
-                None,
-            )
-            return result
-        return None
+        return self.get_from_list_by_index(self.cache_key, "name", sensor_name)
 
     def get_sensor(self, sensor_name: str):
         sensor = self.__get_sensor_by_name(sensor_name)
@@ -77,7 +74,7 @@ class SensorCaching(Cache):
         if company_sensors is None:
             if company is None:
                 company = CompanyCache.get_company(company_slug)
-            company_sensors = (
+            company_sensors = list(
                 company.iot_device.prefetch_related("iot_device_sensors")
                 .exclude(iot_device_sensors__sensor__name__isnull=True)
                 .values_list("iot_device_sensors__sensor__name", flat=True)
@@ -94,7 +91,7 @@ class SensorCaching(Cache):
         if user_sensors is None:
             if user is None:
                 user = UserCache.get_user(username)
-            user_sensors = (
+            user_sensors = list(
                 user.iot_device.prefetch_related("iot_device_sensors")
                 .exclude(iot_device_sensors__sensor__name__isnull=True)
                 .values_list("iot_device_sensors__sensor__name", flat=True)
@@ -113,7 +110,7 @@ class SensorCaching(Cache):
             if dealer is None:
                 dealer = DealerCache.get_dealer(dealer_slug)
 
-            dealer_sensors = (
+            dealer_sensors = list(
                 dealer.iot_device.prefetch_related("iot_device_sensors")
                 .exclude(iot_device_sensors__sensor__name__isnull=True)
                 .values_list("iot_device_sensors__sensor__name", flat=True)
@@ -10,6 +10,7 @@ User = get_user_model()
 class UserCaching(Cache):
     app_name = "user"
     cache_key = "user_list"
+    list_indexes = {"username": "username", "email": "email"}
 
     def __generate_cache_key_from_api_key(self, api_key: str):
         # Using a secure hash function to generate a deterministic cache key
@@ -23,26 +24,10 @@ class UserCaching(Cache):
         )
 
     def __get_user_by_username(self, username: str) -> object | None:
-        cached_data = self.get(self.cache_key)
-
-        if cached_data:
-            result = next(
-                (user for user in cached_data if user.username == username),
-                None,
-            )
-            return result
-        return None
+        return self.get_from_list_by_index(self.cache_key, "username", username)
 
     def __get_user_by_email(self, email: str) -> object | None:
-        cached_data = self.get(self.cache_key)
-
-        if cached_data:
-            result = next(
-                (user for user in cached_data if user.email == email),
-                None,
-            )
-            return result
-        return None
+        return self.get_from_list_by_index(self.cache_key, "email", email)
 
     def get_user(self, username):
         user = self.__get_user_by_username(username)
@@ -132,3 +132,24 @@ ERROR_NO_SENSOR_ASSOCIATED_WITH_ADMIN_USER = (
     "No sensor is associated with the Admin user"
 )
 ERROR_NO_SENSOR_ASSOCIATED_WITH_COMPANY = "No sensor is associated with the company"
+ERROR_INVALID_NUMBER = "A valid number is required."
+ERROR_INVALID_BOOLEAN = "Must be a valid boolean."
+ERROR_INVALID_READING_TIMESTAMP = (
+    "Invalid timestamp! Each reading must have a valid ISO 8601 timestamp"
+)
+
+
+def error_invalid_reading_message(index: int, field_name: str):
+    return f"Invalid value provided for {field_name} in reading {index}"
+
+
+ERROR_EXPORT_TIME_LIMIT = "Export took too long! Try again with a shorter date range"
+
+
+#  websocket app
+ERROR_INVALID_WEBSOCKET_MESSAGE = "Invalid message! Unable to decode the message"
+ERROR_INVALID_SUBSCRIBED_SENSORS = "Invalid sensors! Sensors must be a list of sensor names"
+ERROR_INVALID_HISTORY_QUERY = (
+    "Invalid query! iot_device_id must be a number and dates in YYYY-MM-DD format"
+)
+ERROR_HISTORY_QUERY_FAILED = "Unable to fetch the data! Try again later"
@@ -0,0 +1,37 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+# bounded pool used by the async code for the blocking work i.e database queries
+_executor = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.EXECUTOR_MAX_WORKERS,
+            thread_name_prefix="blocking-executor",
+        )
+    return _executor
+
+
+def _run_with_connection(func, *args, **kwargs):
+    # worker threads are not part of request cycle so unusable connections are closed here
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_in_executor(func, *args, **kwargs):
+    """Runs the blocking function in the bounded executor without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_executor(),
+        functools.partial(_run_with_connection, func, *args, **kwargs),
+    )
@@ -1,17 +1,71 @@
+import asyncio
+import gzip
 import json
+from datetime import datetime
+from urllib.parse import parse_qs
 
 from channels.db import database_sync_to_async
 from channels.exceptions import StopConsumer
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+from django.db import DatabaseError
 
 from company.cache import CompanyCache
 from iot_devices.cache import IotDeviceCache
-from sensor_data.tasks import get_mains_interruption, get_sensor_data
+from sensor_data.coalescing import (
+    LiveDataSubscribers,
+    get_device_group_name,
+    get_live_data_frame,
+)
+from sensor_data.downsampling import DOWNSAMPLING_METHODS, LTTB
+from sensor_data.export import get_user_group_name
+from sensor_data.tasks import (
+    get_channel_event,
+    get_date_range,
+    get_mains_interruption,
+    get_mains_interruption_message,
+    get_sensor_data,
+    get_sensor_data_message,
+    is_inline_query,
+)
 from users.cache import UserCache
 from utils.commom_functions import get_groups_tuple
 from utils.constants import GroupName, UserType
+from utils.error_message import (
+    ERROR_HISTORY_QUERY_FAILED,
+    ERROR_INVALID_HISTORY_QUERY,
+    ERROR_INVALID_SUBSCRIBED_SENSORS,
+    ERROR_INVALID_WEBSOCKET_MESSAGE,
+)
+from utils.executor import run_in_executor
+from websocket import protocol
+from websocket.exceptions import InvalidMessage
 from websocket.tasks import send_initial_data
 
+MAX_DEVICE_SUBSCRIPTIONS = 100
+
+
+def get_history_query(data) -> tuple:
+    """
+    Returns the iot device id, start date and end date of the history query,
+    raises InvalidMessage if the id is not a number or the dates are not YYYY-MM-DD.
+    Missing dates are left to get_date_range.
+    """
+    try:
+        iot_device_id = int(data.get("iot_device_id"))
+        start_date = data.get("start_date")
+        end_date = data.get("end_date")
+        dates = [
+            datetime.strptime(date, "%Y-%m-%d")
+            for date in (start_date, end_date)
+            if date is not None
+        ]
+    except (TypeError, ValueError):
+        raise InvalidMessage(ERROR_INVALID_HISTORY_QUERY)
+    if dates != sorted(dates):
+        raise InvalidMessage(ERROR_INVALID_HISTORY_QUERY)
+    return iot_device_id, start_date, end_date
+
 
 class SensorDataConsumer(AsyncWebsocketConsumer):
     async def connect(self):
@@ -22,12 +76,30 @@ class SensorDataConsumer(AsyncWebsocketConsumer):
         )
 
         self.is_user_dealer = True if GroupName.DEALER_GROUP in user_groups else False
+        # live data frame rate limit negotiated by the client, 0 forwards every frame
+        self.live_data_interval = 0
+        self.last_live_data_at = 0
+        self.pending_live_data = None
+        self.live_data_flush_task = None
+        # subscribed devices and their sensors, None sensors means all the sensors
+        self.device_sensors = {}
+        query_params = parse_qs(self.scope.get("query_string", b"").decode())
+        self.set_protocol(
+            query_params.get("encoding", [protocol.JSON])[0],
+            query_params.get("compression", [""])[0],
+        )
 
         if not self.is_superadmin and not self.is_user_dealer:
             group_name = await self.get_group_name(user)
             await self.subscribe_to_group(group_name)
         else:
             self.subscribed_group = ""
+        # live data of the whole group is received again once all the devices are unsubscribed
+        self.default_group = self.subscribed_group
+
+        # progress of the background exports of the user
+        self.user_group = get_user_group_name(user.id)
+        await self.channel_layer.group_add(self.user_group, self.channel_name)
 
         await self.accept()
         if not self.is_superadmin and not self.is_user_dealer:
@@ -45,30 +117,139 @@ class SensorDataConsumer(AsyncWebsocketConsumer):
             await self.channel_layer.group_discard(
                 self.subscribed_group, self.channel_name
             )
+        if getattr(self, "user_group", None):
+            await self.channel_layer.group_discard(self.user_group, self.channel_name)
+        if getattr(self, "device_sensors", None):
+            await self.unsubscribe_from_devices()
+        if getattr(self, "live_data_flush_task", None):
+            self.live_data_flush_task.cancel()
         raise StopConsumer()
 
+    def filter_live_data_frame(self, frame):
+        """Returns the frame with only the subscribed sensors, None if nothing is left"""
+        _, live_data = json.loads(frame)
+        filtered_live_data = {}
+        for iot_device_id, sensor_data in live_data.items():
+            if iot_device_id not in self.device_sensors:
+                continue
+            sensors = self.device_sensors[iot_device_id]
+            if sensors:
+                sensor_data = {
+                    name: value
+                    for name, value in sensor_data.items()
+                    if name in sensors or name == "timestamp"
+                }
+                if len(sensor_data) == 1:
+                    continue
+            filtered_live_data[iot_device_id] = sensor_data
+        return get_live_data_frame(filtered_live_data) if filtered_live_data else None
+
     async def send_live_data(self, event):
-        # Send the data to the websocket
-        device_id = event["device_id"]
-        data = event["data"]
-        timestamp = event["timestamp"]
-        device_sensor_data = await self.prepare_live_sensors_data(
-            device_id, data, timestamp
-        )
-        await self.send(
-            text_data=json.dumps([{"message_type": "live_data"}, device_sensor_data])
-        )
+        # frame is already encoded by the publisher
+        frame = event["frame"]
+        if any(self.device_sensors.values()):
+            # decoded only when the client subscribed to the specific sensors
+            frame = self.filter_live_data_frame(frame)
+            if frame is None:
+                return
+
+        if not self.live_data_interval:
+            await self.send_live_data_frame(frame)
+            return
+
+        now = asyncio.get_running_loop().time()
+        wait = self.last_live_data_at + self.live_data_interval - now
+        if self.pending_live_data is None and wait <= 0:
+            self.last_live_data_at = now
+            await self.send_live_data_frame(frame)
+            return
+
+        # frames within the interval are merged with the last value winning per sensor
+        _, live_data = json.loads(frame)
+        if self.pending_live_data is None:
+            self.pending_live_data = {}
+        for iot_device_id, sensor_data in live_data.items():
+            self.pending_live_data.setdefault(iot_device_id, {}).update(sensor_data)
+        if self.live_data_flush_task is None:
+            self.live_data_flush_task = asyncio.create_task(
+                self.flush_live_data(max(wait, 0))
+            )
+
+    async def flush_live_data(self, delay):
+        await asyncio.sleep(delay)
+        live_data, self.pending_live_data = self.pending_live_data, None
+        self.live_data_flush_task = None
+        self.last_live_data_at = asyncio.get_running_loop().time()
+        if live_data:
+            await self.send_live_data_frame(get_live_data_frame(live_data))
+
+    async def send_live_data_frame(self, frame):
+        if self.encoding == protocol.JSON:
+            await self.send(text_data=frame)
+        else:
+            await self.send(
+                bytes_data=protocol.encode_live_frame(frame, self.compression)
+            )
+
+    async def send_message(self, text):
+        """Sends the json encoded message in the protocol of the connection"""
+        if self.encoding == protocol.JSON:
+            event = get_channel_event(text)
+            if event["type"] == "send_binary_data":
+                await self.send(bytes_data=event["data"])
+            else:
+                await self.send(text_data=text)
+        else:
+            await self.send(bytes_data=protocol.encode_text(text, self.compression))
+
+    def set_protocol(self, encoding, compression):
+        """Sets the encoding of the messages send to the client, json if invalid"""
+        self.encoding = encoding if encoding in protocol.ENCODINGS else protocol.JSON
+        self.compression = compression in (True, 1, "1", "true", "True")
+
+    def set_live_data_rate(self, max_frame_rate):
+        """Sets the max live data frames per second, 0 or invalid value removes the limit"""
+        try:
+            max_frame_rate = float(max_frame_rate)
+        except (TypeError, ValueError):
+            max_frame_rate = 0
+        if max_frame_rate > 0:
+            max_frame_rate = max(max_frame_rate, settings.LIVE_DATA_MIN_FRAME_RATE)
+            self.live_data_interval = 1 / max_frame_rate
+        else:
+            self.live_data_interval = 0
 
     async def send_data(self, event):
         # Send the data to the websocket
-        await self.send(text_data=event["data"])
+        if self.encoding == protocol.JSON:
+            await self.send(text_data=event["data"])
+        else:
+            await self.send_message(event["data"])
 
     async def send_binary_data(self, event):
-        # Send the data to the websocket
-        await self.send(bytes_data=event["data"])
+        # Send the data to the websocket, data is the gzipped json
+        if self.encoding == protocol.JSON:
+            await self.send(bytes_data=event["data"])
+        else:
+            await self.send_message(gzip.decompress(event["data"]).decode("utf-8"))
 
-    async def receive(self, text_data):
-        data = json.loads(text_data)
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            data = (
+                json.loads(text_data)
+                if text_data is not None
+                else protocol.decode(bytes_data)
+            )
+        except json.JSONDecodeError:
+            await self.send_message(
+                protocol.get_error_message(ERROR_INVALID_WEBSOCKET_MESSAGE)
+            )
+            return
+        except InvalidMessage as e:
+            await self.send_message(protocol.get_error_message(str(e)))
+            return
+        if not isinstance(data, dict):
+            return
         message_type = data.get("type")
 
         if message_type == "group_subscribe" and (
@@ -83,8 +264,10 @@ class SensorDataConsumer(AsyncWebsocketConsumer):
             )
             # here user is the admin user
             group_name = user.username if user else company.slug
+            await self.unsubscribe_from_devices()
             await self.unsubscribe_from_group()
             await self.subscribe_to_group(group_name)
+            self.default_group = group_name
             username = None
             company_slug = company.slug if company else None
             if company is None:
@@ -93,23 +276,78 @@ class SensorDataConsumer(AsyncWebsocketConsumer):
                 )
             send_initial_data.delay(username=username, company_slug=company_slug)
 
-        elif message_type == "sensor_data":
-            sensor_name = data.get("sensor_name")
-            iot_device_id = data.get("iot_device_id")
-            start_date = data.get("start_date")
-            end_date = data.get("end_date")
+        elif message_type == "device_subscribe":
+            await self.subscribe_to_device(
+                data.get("iot_device_id"), data.get("sensors")
+            )
+
+        elif message_type == "device_unsubscribe":
+            await self.unsubscribe_from_device(data.get("iot_device_id"))
+
+        elif message_type == "protocol":
+            self.set_protocol(data.get("encoding"), data.get("compression"))
+
+        elif message_type == "live_data_rate":
+            self.set_live_data_rate(data.get("max_frame_rate"))
 
+        elif message_type in ("sensor_data", "mains_interruption"):
+            try:
+                iot_device_id, start_date, end_date = get_history_query(data)
+            except InvalidMessage as e:
+                await self.send_message(protocol.get_error_message(str(e)))
+                return
+            if message_type == "sensor_data":
+                await self.send_sensor_data(data, iot_device_id, start_date, end_date)
+            else:
+                await self.send_mains_interruption(iot_device_id, start_date, end_date)
+
+    async def send_inline_query(self, func, *args, **kwargs):
+        """Runs the history query in the bounded executor and sends the result"""
+        try:
+            message = await run_in_executor(func, *args, **kwargs)
+        except (DatabaseError, OSError, ValueError):
+            # the consumer is kept alive, the client can retry the query
+            message = protocol.get_error_message(ERROR_HISTORY_QUERY_FAILED)
+        await self.send_message(message)
+
+    async def send_sensor_data(self, data, iot_device_id, start_date, end_date):
+        sensor_name = data.get("sensor_name")
+        max_points = data.get("max_points")
+        downsampling_method = data.get("downsampling_method")
+        if downsampling_method not in DOWNSAMPLING_METHODS:
+            downsampling_method = LTTB
+
+        start, end = get_date_range(start_date, end_date)
+        if is_inline_query(start, end):
+            # queried in the bounded executor and send straight to the websocket
+            await self.send_inline_query(
+                get_sensor_data_message,
+                sensor_name,
+                iot_device_id,
+                start,
+                end,
+                max_points=max_points,
+                downsampling_method=downsampling_method,
+            )
+        else:
             get_sensor_data.delay(
                 sensor_name,
                 iot_device_id,
                 channel_name=self.channel_name,
                 start_date=start_date,
                 end_date=end_date,
+                max_points=max_points,
+                downsampling_method=downsampling_method,
+            )
+
+    async def send_mains_interruption(self, iot_device_id, start_date, end_date):
+        start, end = get_date_range(start_date, end_date)
+        # mains interruption is counted from the raw sensor data
+        if is_inline_query(start, end, rollup=False):
+            await self.send_inline_query(
+                get_mains_interruption_message, iot_device_id, start, end
             )
-        elif message_type == "mains_interruption":
-            start_date = data.get("start_date")
-            end_date = data.get("end_date")
-            iot_device_id = data.get("iot_device_id")
+        else:
             get_mains_interruption.delay(
                 self.channel_name,
                 iot_device_id,
@@ -128,6 +366,77 @@ class SensorDataConsumer(AsyncWebsocketConsumer):
             )
             self.subscribed_group = ""
 
+    async def subscribe_to_device(self, iot_device_id, sensors=None):
+        """
+        Receives the live data of the device only, optionally of the listed sensors.
+        Live data of the whole group is no longer received while subscribed to devices.
+        """
+        try:
+            iot_device_id = int(iot_device_id)
+        except (TypeError, ValueError):
+            return
+        if sensors is not None and (
+            not isinstance(sensors, list)
+            or not all(isinstance(sensor, str) for sensor in sensors)
+        ):
+            await self.send_message(
+                protocol.get_error_message(ERROR_INVALID_SUBSCRIBED_SENSORS)
+            )
+            return
+        key = str(iot_device_id)
+        if (
+            key not in self.device_sensors
+            and len(self.device_sensors) >= MAX_DEVICE_SUBSCRIPTIONS
+        ):
+            return
+        if not self.is_superadmin and not self.is_user_dealer:
+            if not await self.is_device_owned(self.scope["user"], iot_device_id):
+                return
+
+        if key not in self.device_sensors:
+            await self.channel_layer.group_add(
+                get_device_group_name(iot_device_id), self.channel_name
+            )
+            await LiveDataSubscribers.add(key, self.channel_name)
+        self.device_sensors[key] = set(sensors) if sensors else None
+        await self.unsubscribe_from_group()
+
+    async def unsubscribe_from_device(self, iot_device_id):
+        try:
+            key = str(int(iot_device_id))
+        except (TypeError, ValueError):
+            return
+        if key not in self.device_sensors:
+            return
+        del self.device_sensors[key]
+        await self.channel_layer.group_discard(
+            get_device_group_name(key), self.channel_name
+        )
+        await LiveDataSubscribers.remove(key, self.channel_name)
+        # superadmin and dealer have no group until they subscribe to one
+        if not self.device_sensors and self.default_group:
+            await self.subscribe_to_group(self.default_group)
+
+    async def unsubscribe_from_devices(self):
+        for iot_device_id in self.device_sensors:
+            await self.channel_layer.group_discard(
+                get_device_group_name(iot_device_id), self.channel_name
+            )
+            await LiveDataSubscribers.remove(iot_device_id, self.channel_name)
+        self.device_sensors = {}
+
+    @staticmethod
+    @database_sync_to_async
+    def is_device_owned(user, iot_device_id):
+        """Checks the device is owned by the company or admin user of the user"""
+        if user.is_associated_with_company:
+            iot_device_list = IotDeviceCache.get_all_company_iot_devices(user.company)
+        elif user.type != UserType.ADMIN:
+            iot_device_list = IotDeviceCache.get_all_user_iot_devices(user.created_by)
+        else:
+            iot_device_list = IotDeviceCache.get_all_user_iot_devices(user)
+        return iot_device_id in iot_device_list
+
     @staticmethod
     @database_sync_to_async
     def get_group_name(user=None):
@@ -150,16 +459,3 @@ class SensorDataConsumer(AsyncWebsocketConsumer):
         else:
             user = UserCache.get_user(username)
             return (user, None)
-
-    @staticmethod
-    @database_sync_to_async
-    def prepare_live_sensors_data(device_id, data, timestamp):
-        """Prepare data to send over to client"""
-        device_sensors = IotDeviceCache.get_all_device_sensors(device_id)
-        sensor_data = {
-            device_sensor.sensor.name: data[device_sensor.field_name]
-            for device_sensor in device_sensors
-            if (device_sensor.field_name in data)
-        }
-        sensor_data["timestamp"] = timestamp
-        return {device_id: sensor_data}
@@ -3,3 +3,7 @@ from channels.exceptions import DenyConnection
 
 class AuthenticationFailed(DenyConnection):
     pass
+
+
+class InvalidMessage(Exception):
+    """Message received from the client can't be decoded"""
@@ -0,0 +1,100 @@
+"""
+Binary websocket protocol negotiated by the client.
+Client asks for it with ?encoding=msgpack&compression=1 on the websocket url or with
+{"type": "protocol", "encoding": "msgpack", "compression": true} message.
+Every message is then send as a binary frame: one flag byte, 0 for the plain
+MessagePack payload and 1 for the deflate compressed payload, followed by the
+payload. Floats are packed as float32 and the rows of the sensor data history are
+send as columns i.e. {"value": [...], "date_time": [...]}.
+"""
+
+import functools
+import json
+import zlib
+
+import msgpack
+
+from utils.error_message import ERROR_INVALID_WEBSOCKET_MESSAGE
+from websocket.exceptions import InvalidMessage
+
+JSON = "json"
+MSGPACK = "msgpack"
+ENCODINGS = (JSON, MSGPACK)
+
+FLAG_RAW = 0
+FLAG_DEFLATE = 1
+# smaller payloads are not worth compressing
+COMPRESS_MIN_SIZE = 512
+# live frames are same for every subscriber in the process so are encoded once
+LIVE_FRAME_CACHE_SIZE = 256
+# client only sends small control messages, larger frames are rejected before unpacking
+MAX_FRAME_SIZE = 64 * 1024
+
+
+def to_columns(message):
+    """Converts the rows of the sensor data history message into columns"""
+    if not isinstance(message, list) or len(message) != 2:
+        return message
+    header, rows = message
+    if (
+        not isinstance(header, dict)
+        or header.get("message_type") != "sensor_data"
+        or not rows
+        or not isinstance(rows, list)
+    ):
+        return message
+    return [header, {key: [row.get(key) for row in rows] for key in rows[0]}]
+
+
+def encode(message, compression: bool = False) -> bytes:
+    """Returns the binary frame of the message"""
+    payload = msgpack.packb(to_columns(message), use_single_float=True)
+    if compression and len(payload) >= COMPRESS_MIN_SIZE:
+        return bytes([FLAG_DEFLATE]) + zlib.compress(payload)
+    return bytes([FLAG_RAW]) + payload
+
+
+def encode_text(text: str, compression: bool = False) -> bytes:
+    """Returns the binary frame of the json encoded message"""
+    return encode(json.loads(text), compression)
+
+
+@functools.lru_cache(maxsize=LIVE_FRAME_CACHE_SIZE)
+def encode_live_frame(frame: str, compression: bool = False) -> bytes:
+    return encode_text(frame, compression)
+
+
+def decode(data: bytes):
+    """
+    Returns the message send by the client in binary frame.
+    Raises InvalidMessage if the frame is empty, too large or not valid MessagePack.
+    """
+    if not data or len(data) > MAX_FRAME_SIZE:
+        raise InvalidMessage(ERROR_INVALID_WEBSOCKET_MESSAGE)
+    flag, payload = data[0], data[1:]
+    try:
+        if flag == FLAG_DEFLATE:
+            decompressor = zlib.decompressobj()
+            payload = decompressor.decompress(payload, MAX_FRAME_SIZE)
+            # bounded so a small compressed frame can't inflate to a huge payload
+            if decompressor.unconsumed_tail:
+                raise InvalidMessage(ERROR_INVALID_WEBSOCKET_MESSAGE)
+        elif flag != FLAG_RAW:
+            raise InvalidMessage(ERROR_INVALID_WEBSOCKET_MESSAGE)
+        return msgpack.unpackb(payload)
+    except (
+        zlib.error,
+        ValueError,
+        # unhashable map keys like a map or an array raise TypeError
+        TypeError,
+        msgpack.exceptions.ExtraData,
+        msgpack.exceptions.FormatError,
+        msgpack.exceptions.StackError,
+        msgpack.exceptions.UnpackException,
+    ):
+        raise InvalidMessage(ERROR_INVALID_WEBSOCKET_MESSAGE)
+
+
+def get_error_message(error: str) -> str:
+    """Returns the json encoded error message send to the client"""
+    return json.dumps([{"message_type": "error"}, {"error": error}])